@@ -0,0 +1,377 @@
+"""
+Animations of Julia sets along a path through c-space and of morphs
+between two IFS tables. Frames are rendered in parallel by worker
+processes, each rendering every n-th frame, and are handed to a streaming
+GIF or ffmpeg encoder in frame order as they finish. Each worker only runs
+a few frames ahead of the encoder, so the animation is never held in
+memory. An IFS worker starts each frame's chains from the points of its
+previous frame, workers frames earlier on the morph, so later frames only
+need a short burn-in to settle onto their own attractor.
+
+Run with: python3 Animation.py --julia {c,c,...} or --ifs {table},{table}
+"""
+import sys
+from multiprocessing import Process, Queue, cpu_count
+from queue import Empty
+
+import numpy as np
+
+import Backends
+import CPUTransformation
+import CompiledTransformation
+import Formulas
+import Utilities
+import constants
+from Viewport import Viewport
+
+
+def parse_c(text):
+    """
+    Parse a c value given as a complex literal such as -0.8+0.156j or as
+    the name of a Julia set such as set2.
+    """
+    text = text.strip()
+    if text in constants.julia_fractals:
+        return complex(constants.julia_fractals[text])
+    return complex(text.replace(" ", ""))
+
+
+def julia_path(points, frames, closed=False):
+    """
+    Spread frames evenly along the polyline through the given c values.
+    :param closed: Return to the first point, for a seamless loop
+    :return: list of c values, one per frame
+    """
+    points = np.array(points, dtype=np.complex128)
+    if closed:
+        points = np.append(points, points[0])
+    if points.size == 1 or frames == 1:
+        return [complex(points[0])] * frames
+    lengths = np.concatenate([[0.0], np.cumsum(np.abs(np.diff(points)))])
+    if lengths[-1] == 0:
+        return [complex(points[0])] * frames
+    # a closed loop must not repeat its first frame at the end
+    positions = np.linspace(0, lengths[-1], frames, endpoint=not closed)
+    real = np.interp(positions, lengths, points.real)
+    imag = np.interp(positions, lengths, points.imag)
+    return list(real + 1j * imag)
+
+
+def morph_table(first, second, t):
+    """
+    :return: IFS table interpolated linearly between two tables at
+        0 <= t <= 1. The table with fewer transformations is padded with
+        the other's extra transformations at probability 0, so those fade
+        in or out instead of changing shape
+    """
+    first = np.asarray(first, dtype=np.float64)
+    second = np.asarray(second, dtype=np.float64)
+    if len(first) < len(second):
+        extra = len(second) - len(first)
+        first = np.concatenate([first, second[-extra:]])
+        first[-extra:, 6] = 0
+    elif len(second) < len(first):
+        extra = len(first) - len(second)
+        second = np.concatenate([second, first[-extra:]])
+        second[-extra:, 6] = 0
+    return (1 - t) * first + t * second
+
+
+def morph_bounds(first, second, frames):
+    """
+    :return: bounds containing the attractor of every frame, so the morph
+        is drawn with a fixed camera
+    """
+    bounds = []
+    for index in range(frames):
+        table = morph_table(first, second, index / max(frames - 1, 1))
+        frame_bounds = CompiledTransformation.compile_transformation(
+            table).bounds
+        if frame_bounds is None:
+            frame_bounds = Utilities.warm_up_bounds(
+                *CPUTransformation.cpuIfsPoints(table, num_points=20000))
+        bounds.append(frame_bounds)
+    bounds = np.array(bounds)
+    return (bounds[:, 0].min(), bounds[:, 1].max(), bounds[:, 2].min(),
+            bounds[:, 3].max())
+
+
+def _render_julia_frames(job, indices):
+    """
+    Render the Julia frames with the given indices.
+    :return: generator of uint8 RGB frames
+    """
+    for index in indices:
+        counts = Backends.run(job["backend"], "julia_iterations",
+                              c=job["c_values"][index],
+                              iterations=job["iterations"],
+                              divergence_value=job["divergence_value"],
+                              viewport=job["viewport"],
+                              formula=job["formula"])
+        # one colour scale for every frame so the animation does not flicker
+        yield Utilities.colorize(np.asarray(counts).T,
+                                 colormap=job["colormap"],
+                                 count_range=(0, job["iterations"]))
+
+
+def _render_morph_frames(job, indices):
+    """
+    Render the IFS morph frames with the given indices. The chains of each
+    frame start from the last points of the worker's previous frame, which
+    is several frames away, and take warm_burn_in steps to settle.
+    :return: generator of uint8 greyscale frames
+    """
+    rng = np.random.default_rng(job["seed"])
+    start = None
+    for index in indices:
+        table = morph_table(job["first"], job["second"],
+                            index / max(job["frames"] - 1, 1))
+        x, y = next(CPUTransformation.cpuIfsChunks(
+            transformation=table,
+            num_points=job["num_points"],
+            chunk_size=job["num_points"],
+            chains=job["chains"],
+            burn_in=job["burn_in"] if start is None
+            else job["warm_burn_in"],
+            rng=rng,
+            start=start))
+        start = x[-job["chains"]:], y[-job["chains"]:]
+        counts = Utilities.bin_points(x, y, job["width"], job["height"],
+                                      job["bounds"])
+        yield np.asarray(Utilities.density_to_image(counts))
+
+
+def _frame_worker(render, job, indices, queue):
+    try:
+        for frame in render(job, indices):
+            queue.put(frame)
+    except Exception as error:
+        queue.put(error)
+
+
+def _next_frame(queue, process, poll=1.0):
+    """
+    :return: the next item of a worker's queue, waiting while the worker
+        is alive. Raises RuntimeError if it exits without sending one
+    """
+    while True:
+        try:
+            return queue.get(timeout=poll)
+        except Empty:
+            if not process.is_alive():
+                break
+    # the worker may have sent its frame just before exiting
+    try:
+        return queue.get(timeout=poll)
+    except Empty:
+        raise RuntimeError("Frame worker exited with code {} before "
+                           "sending its frames".format(process.exitcode))
+
+
+def render_animation(render, job, frames, output_file, workers=None, fps=20,
+                     lookahead=2):
+    """
+    Render frames across worker processes and encode them in order. Worker
+    k renders frames k, k + workers, ... into its own bounded queue, so it
+    can run at most lookahead frames ahead of the encoder.
+    :param render: Function taking the job and a list of frame indices and
+        yielding those frames in order
+    :param job: dict of the parameters render needs
+    :param frames: Number of frames
+    :param output_file: .gif file, or any video file ffmpeg can write
+    :param workers: Number of worker processes, defaults to the CPU count
+    :param fps: Frames per second
+    :param lookahead: Frames each worker may finish before the encoder
+        takes them
+    """
+    if workers is None:
+        workers = cpu_count()
+    workers = max(1, min(workers, frames))
+    queues = [Queue(maxsize=lookahead) for _ in range(workers)]
+    processes = [Process(target=_frame_worker,
+                         args=(render, dict(job, seed=[job["seed"], worker]),
+                               list(range(worker, frames, workers)),
+                               queues[worker]),
+                         daemon=True)
+                 for worker in range(workers)]
+    for process in processes:
+        process.start()
+
+    writer = None
+    try:
+        for index in range(frames):
+            frame = _next_frame(queues[index % workers],
+                                processes[index % workers])
+            if isinstance(frame, Exception):
+                raise frame
+            if writer is None:
+                writer = Utilities.open_video_writer(
+                    output_file, frame.shape[1], frame.shape[0], fps)
+            writer.write_frame(frame)
+            print("\rFrame {}/{}".format(index + 1, frames), end="")
+        writer.close()
+        print("\nSaved animation to", output_file)
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+
+def animate_julia(c_values, output_file, iterations=200, divergence_value=10,
+                  viewport=None, formula=None, backend="cpu",
+                  colormap="viridis", workers=None, fps=20):
+    """
+    Animate the Julia sets of a sequence of c values.
+    :param c_values: c value of each frame, e.g. from julia_path
+    :param viewport: Viewport.Viewport of every frame
+    :param formula: Optional Formulas.Formula to iterate instead of the
+        quadratic map
+    """
+    if viewport is None:
+        viewport = Viewport()
+    if formula is not None and \
+            not Backends.accepts(backend, "julia_iterations", "formula"):
+        raise ValueError("Backend '" + backend + "' does not support "
+                         "formulas")
+    job = {"c_values": [complex(c) for c in c_values],
+           "iterations": iterations, "divergence_value": divergence_value,
+           "viewport": viewport, "formula": formula, "backend": backend,
+           "colormap": colormap, "seed": None}
+    render_animation(_render_julia_frames, job, len(job["c_values"]),
+                     output_file, workers, fps)
+
+
+def animate_ifs_morph(first, second, frames, output_file, width=600,
+                      height=600, num_points=200000, chains=10000,
+                      burn_in=20, warm_burn_in=5, seed=None, workers=None,
+                      fps=20):
+    """
+    Animate the attractors of the IFS tables interpolated between two
+    tables with the same number of transformations.
+    :param chains: Chains advanced together in each frame
+    :param burn_in: Steps discarded by the first frame of each worker
+    :param warm_burn_in: Steps discarded by the worker's later frames,
+        whose chains start on the attractor of its previous frame
+    :param seed: Seed of the workers' random generators
+    """
+    chains = max(1, min(chains, num_points))
+    job = {"first": np.asarray(first, dtype=np.float64),
+           "second": np.asarray(second, dtype=np.float64),
+           "frames": frames, "num_points": num_points, "chains": chains,
+           "burn_in": burn_in, "warm_burn_in": warm_burn_in,
+           "width": width, "height": height,
+           "bounds": morph_bounds(first, second, frames),
+           "seed": np.random.SeedSequence(seed).entropy}
+    render_animation(_render_morph_frames, job, frames, output_file,
+                     workers, fps)
+
+
+def print_help():
+    print("To animate Julia sets along a path through c-space: "
+          "--julia {comma separated c values or set names, e.g. "
+          "-0.8+0.156j,set3}")
+    print("Optional arguments: --size {size of image width/height}"
+          "--iterations {number of total iterations}"
+          "--divergence {divergence value}"
+          "--closed {1 to loop back to the first c value}"
+          "--formula {" + ", ".join(Formulas.FORMULAS) + " or an expression "
+          "in z and c}"
+          "--backend {cpu, numba}"
+          "--colormap {" + ", ".join(Utilities.COLORMAPS) + "}")
+    print("To morph between two IFS fractals: --ifs {fractal},{fractal}")
+    print("Optional arguments: --width {width of image}"
+          "--height {height of image}"
+          "--points {number of points per frame}"
+          "--seed {seed for the random generators}")
+    print("Common arguments: --frames {number of frames}"
+          "--fps {frames per second}"
+          "--workers {number of worker processes}"
+          "--output {.gif file, or a video file written with ffmpeg}")
+
+
+def parse_input_args():
+    mode = ""
+    targets = ""
+    frames = 60
+    fps = 20
+    workers = None
+    output_file = "animation.gif"
+    size = 300
+    iterations = 200
+    divergence_val = 10
+    closed = False
+    formula = ""
+    backend = "cpu"
+    colormap = "viridis"
+    width = 600
+    height = 600
+    num_points = 200000
+    seed = None
+    n = len(sys.argv)
+    i = 1
+    while i < n:
+        try:
+            if sys.argv[i] == "--julia" or sys.argv[i] == "--ifs":
+                mode = sys.argv[i][2:]
+                targets = sys.argv[i + 1]
+            elif sys.argv[i] == "--frames":
+                frames = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--fps":
+                fps = float(sys.argv[i + 1])
+            elif sys.argv[i] == "--workers" or sys.argv[i] == "-n":
+                workers = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--output" or sys.argv[i] == "-o":
+                output_file = sys.argv[i + 1]
+            elif sys.argv[i] == "--size" or sys.argv[i] == "-s":
+                size = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--iterations" or sys.argv[i] == "-i":
+                iterations = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--divergence" or sys.argv[i] == "-d":
+                divergence_val = float(sys.argv[i + 1])
+            elif sys.argv[i] == "--closed":
+                closed = sys.argv[i + 1] == "1"
+            elif sys.argv[i] == "--formula":
+                formula = sys.argv[i + 1]
+            elif sys.argv[i] == "--backend":
+                backend = Backends.parse_backends(sys.argv[i + 1])[0]
+            elif sys.argv[i] == "--colormap":
+                colormap = sys.argv[i + 1]
+            elif sys.argv[i] == "--width" or sys.argv[i] == "-w":
+                width = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--height" or sys.argv[i] == "-h":
+                height = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--points" or sys.argv[i] == "-p":
+                num_points = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--seed":
+                seed = int(sys.argv[i + 1])
+            else:
+                print_help()
+                exit(0)
+            i += 2
+        except IndexError:
+            print("Index out of range error. The expected number of arguments "
+                  "were not provided.")
+            exit(1)
+
+    if mode == "julia":
+        animate_julia(julia_path([parse_c(c) for c in targets.split(",")],
+                                 frames, closed),
+                      output_file, iterations, divergence_val, Viewport(size),
+                      Formulas.parse_formula(formula) if len(formula) > 0
+                      else None,
+                      backend, colormap, workers, fps)
+    elif mode == "ifs":
+        names = targets.split(",")
+        if len(names) != 2:
+            raise ValueError("An IFS morph needs two fractals")
+        animate_ifs_morph(constants.ifs_fractals[names[0]],
+                          constants.ifs_fractals[names[1]], frames,
+                          output_file, width, height, num_points, seed=seed,
+                          workers=workers, fps=fps)
+    else:
+        print_help()
+
+
+if __name__ == '__main__':
+    parse_input_args()
@@ -0,0 +1,183 @@
+"""
+Julia set atlases for choosing c values: many small Julia sets rendered
+together in one vectorized pass over a shared pixel plane, saved as one
+contact sheet image plus the iteration counts of every c value.
+
+Run with: python3 Atlas.py --sets all or --grid {re_min,re_max,im_min,
+im_max,columns,rows}
+"""
+import sys
+
+import numpy as np
+from PIL import Image
+
+import Backends
+import Formulas
+import Instrumentation
+import Utilities
+import constants
+from Viewport import Viewport
+
+
+def c_grid(re_min=-2.0, re_max=0.5, im_min=-1.25, im_max=1.25, columns=8,
+           rows=8):
+    """
+    Grid of c values over a region of the Mandelbrot plane, in reading
+    order: left to right, then top to bottom from the largest imaginary
+    part.
+    :return: flat complex array of columns * rows c values
+    """
+    real = np.linspace(re_min, re_max, columns)
+    imag = np.linspace(im_max, im_min, rows)
+    return (real[np.newaxis, :] + 1j * imag[:, np.newaxis]).ravel()
+
+
+def parse_grid(text):
+    """
+    Parse a "re_min,re_max,im_min,im_max,columns,rows" grid.
+    :return: c values of the grid and its number of columns
+    """
+    parts = text.split(",")
+    if len(parts) != 6:
+        raise ValueError("Grid must be given as "
+                         "re_min,re_max,im_min,im_max,columns,rows")
+    columns, rows = int(parts[4]), int(parts[5])
+    return c_grid(*[float(part) for part in parts[:4]], columns, rows), \
+        columns
+
+
+def parse_sets(text):
+    """
+    Parse "all" or comma separated Julia set numbers.
+    :return: set names and their c values
+    """
+    if text == "all":
+        names = list(constants.julia_fractals)
+    else:
+        names = ["set" + name.strip() for name in text.split(",")]
+    return names, np.array([constants.julia_fractals[name] for name in names],
+                           dtype=np.complex128)
+
+
+def render_atlas(c_values, iterations=200, divergence_value=10, viewport=None,
+                 formula=None, backend="cpu", phases=None):
+    """
+    :return: (len(c_values), width, height) array of iteration counts
+    """
+    return Backends.run(backend, "julia_atlas",
+                        c_values=c_values,
+                        iterations=iterations,
+                        divergence_value=divergence_value,
+                        viewport=viewport,
+                        formula=formula,
+                        phases=phases)
+
+
+def save_atlas(counts, c_values, iterations, output_file="atlas.png",
+               arrays_file="", columns=None, colormap="viridis", labels=None,
+               phases=None):
+    """
+    Save the contact sheet of an atlas and, optionally, its iteration
+    counts and c values to a compressed .npz file.
+    """
+    with Instrumentation.phase(phases, "rasterize"):
+        # one colour scale for every thumbnail so they can be compared;
+        # counts are indexed (w, h) and image rows run along h
+        sheet = Utilities.contact_sheet(counts.transpose(0, 2, 1), columns,
+                                        colormap=colormap,
+                                        count_range=(0, iterations),
+                                        labels=labels)
+    Utilities.save_image(Image.fromarray(sheet, 'RGB'), output_file, phases)
+    if len(arrays_file) > 0:
+        with Instrumentation.phase(phases, "encode"):
+            np.savez_compressed(arrays_file, counts=counts, c=c_values)
+        print("Saved iteration counts to", arrays_file)
+
+
+def print_help():
+    print("To render an atlas of Julia sets: --sets {all, or comma separated "
+          "sets 1-14} or --grid {re_min,re_max,im_min,im_max,columns,rows}")
+    print("Optional arguments: --size {width/height of each thumbnail}"
+          "--iterations {number of total iterations}"
+          "--divergence {divergence value}"
+          "--formula {" + ", ".join(Formulas.FORMULAS) + " or an expression "
+          "in z and c}"
+          "--backend {cpu, numba}"
+          "--columns {thumbnails per row}"
+          "--colormap {" + ", ".join(Utilities.COLORMAPS) + "}"
+          "--labels {1 to print the c value on each thumbnail}"
+          "--output {full path of the contact sheet png}"
+          "--arrays {full path of a .npz file for the iteration counts}")
+
+
+def parse_input_args():
+    names = None
+    c_values = None
+    columns = None
+    size = 64
+    iterations = 200
+    divergence_val = 10
+    formula = ""
+    backend = "cpu"
+    colormap = "viridis"
+    labels = False
+    output_file = "atlas.png"
+    arrays_file = ""
+    n = len(sys.argv)
+    i = 1
+    while i < n:
+        try:
+            if sys.argv[i] == "--sets":
+                names, c_values = parse_sets(sys.argv[i + 1])
+            elif sys.argv[i] == "--grid":
+                c_values, columns = parse_grid(sys.argv[i + 1])
+            elif sys.argv[i] == "--size" or sys.argv[i] == "-s":
+                size = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--iterations" or sys.argv[i] == "-i":
+                iterations = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--divergence" or sys.argv[i] == "-d":
+                divergence_val = float(sys.argv[i + 1])
+            elif sys.argv[i] == "--formula":
+                formula = sys.argv[i + 1]
+            elif sys.argv[i] == "--backend":
+                backend = Backends.parse_backends(sys.argv[i + 1])[0]
+            elif sys.argv[i] == "--columns":
+                columns = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--colormap":
+                colormap = sys.argv[i + 1]
+            elif sys.argv[i] == "--labels":
+                labels = sys.argv[i + 1] == "1"
+            elif sys.argv[i] == "--output" or sys.argv[i] == "-o":
+                output_file = sys.argv[i + 1]
+            elif sys.argv[i] == "--arrays":
+                arrays_file = sys.argv[i + 1]
+            else:
+                print_help()
+                exit(0)
+            i += 2
+        except IndexError:
+            print("Index out of range error. The expected number of arguments "
+                  "were not provided.")
+            exit(1)
+    if c_values is None:
+        print_help()
+        exit(1)
+
+    phases = Instrumentation.PhaseTimer()
+    counts = render_atlas(c_values, iterations, divergence_val,
+                          Viewport(size),
+                          Formulas.parse_formula(formula) if len(formula) > 0
+                          else None,
+                          backend, phases)
+    if labels:
+        labels = names or ["{:.3f}{:+.3f}i".format(c.real, c.imag)
+                           for c in c_values]
+    save_atlas(counts, c_values, iterations, output_file, arrays_file,
+               columns, colormap, labels or None, phases)
+    print("{} Julia sets, phases:".format(len(c_values)),
+          ", ".join("{} {:.6f} sec".format(name, phases.phases.get(name, 0.0))
+                    for name in Instrumentation.PHASES))
+
+
+if __name__ == '__main__':
+    parse_input_args()
@@ -0,0 +1,94 @@
+"""
+Registry of fractal backends. A backend module is only imported when the
+backend is selected, so e.g. a CPU-only run never loads pycuda or numba.
+"""
+import importlib
+import inspect
+
+# Each backend names its module and the functions implementing each kind of
+# run. julia and ifs render an image and return timings, julia_iterations,
+# julia_atlas and ifs_points only compute and return the raw arrays.
+BACKENDS = {
+    "cpu": {"module": "CPUTransformation",
+            "julia": "cpuDivergentFractal",
+            "ifs": "cpuIfsTransform",
+            "streaming_ifs": "cpuStreamingIfsTransform",
+            "julia_iterations": "cpuJuliaIterations",
+            "julia_atlas": "cpuJuliaAtlas",
+            "ifs_points": "cpuIfsPoints"},
+    "gpu": {"module": "GPUTransformation",
+            "julia": "gpu_divergent_fractal",
+            "ifs": "gpu_ifs_transform",
+            "streaming_ifs": "gpu_streaming_ifs_transform",
+            "julia_iterations": "gpu_julia_iterations",
+            "ifs_points": "gpu_ifs_points"},
+    "numba": {"module": "NumbaTransformation",
+              "julia": "numba_divergent_fractal",
+              "ifs": "numba_ifs_transform",
+              "streaming_ifs": "numba_streaming_ifs_transform",
+              "julia_iterations": "numba_julia_iterations",
+              "julia_atlas": "numba_julia_atlas",
+              "ifs_points": "numba_ifs_points"},
+}
+
+# Keyword arguments that are only passed to functions accepting them
+OPTIONAL_ARGUMENTS = ("workers", "block_size", "mode", "viewport",
+                      "buffer_file", "cache", "phases", "formula", "seed",
+                      "tolerance", "pipeline")
+
+
+def register_backend(name, module, **functions):
+    """
+    Add a backend to the registry. Nothing is imported until it is used.
+    :param name: Name used to select the backend with --backend
+    :param module: Name of the module implementing the backend
+    :param functions: Name of the function in the module for each kind of
+        run, e.g. julia="myDivergentFractal"
+    """
+    BACKENDS[name] = dict(functions, module=module)
+
+
+def parse_backends(text):
+    """
+    Parse a comma separated list of backend names.
+    """
+    names = [name.strip() for name in text.split(",") if name.strip()]
+    for name in names:
+        if name not in BACKENDS:
+            raise ValueError("Unknown backend '" + name + "'. Available "
+                             "backends: " + ", ".join(BACKENDS))
+    return names
+
+
+def get_function(name, kind):
+    """
+    Import the backend module on first use and return one of its functions.
+    :param name: Backend name
+    :param kind: One of julia, ifs, streaming_ifs, julia_iterations,
+        julia_atlas or ifs_points
+    """
+    spec = BACKENDS[name]
+    if spec.get(kind) is None:
+        raise ValueError("Backend '" + name + "' does not implement " + kind)
+    module = importlib.import_module(spec["module"])
+    return getattr(module, spec[kind])
+
+
+def accepts(name, kind, argument):
+    """
+    :return: whether the backend function takes the keyword argument
+    """
+    function = get_function(name, kind)
+    return argument in inspect.signature(function).parameters
+
+
+def run(name, kind, **kwargs):
+    """
+    Call a backend function, dropping the optional arguments it does not
+    accept.
+    """
+    function = get_function(name, kind)
+    parameters = inspect.signature(function).parameters
+    kwargs = {key: value for key, value in kwargs.items()
+              if key not in OPTIONAL_ARGUMENTS or key in parameters}
+    return function(**kwargs)
@@ -0,0 +1,244 @@
+"""
+Batch runner for many renders in one process pool. The workers live for the
+whole batch, so imports, compiled kernels and memoized tables are paid for
+once per worker instead of once per render. Outputs and timings are written
+as each job completes and the throughput is reported in jobs per minute.
+
+A job file is a JSON list of jobs, or an object with a "jobs" list. A job
+is an object such as
+    {"type": "julia", "set": 3, "size": 300, "iterations": 200,
+     "backend": "cpu"}
+    {"type": "ifs", "fractal": "fern", "points": 100000, "width": 600,
+     "height": 600, "backend": "numba"}
+Any field given as a list is expanded into one job per value, so
+    {"type": "ifs", "fractal": ["fern", "leaf"], "points": [1e4, 1e5]}
+describes four jobs.
+"""
+import itertools
+import json
+import os
+from multiprocessing import Pool, cpu_count, util
+from timeit import default_timer as timer
+
+import Backends
+import Formulas
+import FractalCache
+import Instrumentation
+import OutputPipeline
+import Utilities
+import constants
+from Viewport import Viewport
+
+JULIA_DEFAULTS = {"size": 300, "height": None, "iterations": 200,
+                  "divergence": 10, "block": 64, "backend": "cpu",
+                  "mode": "standard", "center": [0, 0], "scale": 1.0,
+                  "rotation": 0.0, "formula": "", "plane": None}
+IFS_DEFAULTS = {"width": 600, "height": 600, "points": 100000, "block": 64,
+                "backend": "cpu", "stream": 0, "seed": None,
+                "converge": None}
+
+# Raw data cache and background image writer of the worker process, opened
+# once by _warm_worker
+_cache = None
+_pipeline = None
+
+
+def expand_jobs(jobs):
+    """
+    Expand every list valued field into one job per value.
+    """
+    expanded = []
+    for job in jobs:
+        lists = {key: value for key, value in job.items()
+                 if isinstance(value, list) and key != "center"}
+        for values in itertools.product(*lists.values()):
+            expanded.append(dict(job, **dict(zip(lists, values))))
+    return expanded
+
+
+def load_jobs(job_file):
+    with open(job_file) as jobs:
+        jobs = json.load(jobs)
+    if isinstance(jobs, dict):
+        jobs = jobs["jobs"]
+    jobs = expand_jobs(jobs)
+    for job in jobs:
+        if job.get("type") not in ("julia", "ifs"):
+            raise ValueError("Job type must be julia or ifs: " + str(job))
+        defaults = JULIA_DEFAULTS if job["type"] == "julia" else IFS_DEFAULTS
+        for key, value in defaults.items():
+            job.setdefault(key, value)
+        Backends.parse_backends(job["backend"])
+        if job["type"] == "julia" and job["mode"] != "standard" and \
+                not Backends.accepts(job["backend"], "julia", "mode"):
+            raise ValueError("Backend '" + job["backend"] + "' does not "
+                             "support the " + job["mode"] + " mode: " +
+                             str(job))
+        if job["type"] == "ifs" and job["seed"] is not None and \
+                not Backends.accepts(job["backend"], _ifs_kind(job), "seed"):
+            raise ValueError("Backend '" + job["backend"] + "' does not "
+                             "support seeded runs: " + str(job))
+    return jobs
+
+
+def _ifs_kind(job):
+    """
+    :return: the kind of backend function that renders an IFS job
+    """
+    if int(job["stream"]) > 0 or job["converge"] is not None:
+        return "streaming_ifs"
+    return "ifs"
+
+
+def job_name(job):
+    if job["type"] == "julia":
+        return "set" + str(job["set"]).replace("set", "")
+    return job["fractal"]
+
+
+def job_cost(job):
+    """
+    Rough relative cost of a job, used to start the longest jobs first.
+    """
+    if job["type"] == "julia":
+        height = job["height"] or job["size"]
+        return job["size"] * height * job["iterations"]
+    return job["points"]
+
+
+def _warm_worker(backends, cache_dir, cache_size, write_queue=0,
+                 compression=6, raw=False):
+    global _cache, _pipeline
+    if len(cache_dir) > 0:
+        _cache = FractalCache.FractalCache(cache_dir, cache_size)
+    _pipeline = OutputPipeline.OutputPipeline(write_queue, compression, raw)
+    # the worker writes its last queued images before it exits
+    util.Finalize(_pipeline, _pipeline.close, exitpriority=10)
+    # import every backend module once, up front
+    for name in backends:
+        spec = Backends.BACKENDS[name]
+        for kind in ("julia", "ifs"):
+            if spec.get(kind) is not None:
+                Backends.get_function(name, kind)
+
+
+def run_job(indexed_job):
+    """
+    Render one job in a worker.
+    :return: structured record of the job, its phase timings and output
+    """
+    index, job = indexed_job
+    phases = Instrumentation.PhaseTimer()
+    start = timer()
+    name = job_name(job)
+    output_file = job["output"]
+    kind = "iterations" if job["type"] == "julia" else "density"
+    total_points = None
+    if job["type"] == "julia":
+        viewport = Viewport(job["size"], job["height"], tuple(job["center"]),
+                            job["scale"], job["rotation"])
+        formula = None
+        if len(job["formula"]) > 0:
+            formula = Formulas.parse_formula(job["formula"], job["plane"])
+            if not Backends.accepts(job["backend"], "julia", "formula"):
+                raise ValueError("Backend '" + job["backend"] + "' does not "
+                                 "support formulas")
+        Backends.run(job["backend"], "julia",
+                     c=constants.julia_fractals[name],
+                     iterations=int(job["iterations"]),
+                     divergence_value=job["divergence"],
+                     width=job["size"],
+                     block_size=job["block"],
+                     mode=job["mode"],
+                     viewport=viewport,
+                     formula=formula,
+                     cache=_cache,
+                     pipeline=_pipeline,
+                     phases=phases,
+                     output_file=output_file)
+    else:
+        chunk_size = int(job["stream"])
+        arguments = {}
+        if job["converge"] is not None:
+            # convergence is checked after every chunk
+            chunk_size = chunk_size or Utilities.CONVERGENCE_CHUNK_SIZE
+            arguments["tolerance"] = job["converge"]
+        kind = _ifs_kind(job)
+        if chunk_size > 0:
+            arguments["chunk_size"] = chunk_size
+        _, total_points = Backends.run(
+            job["backend"], kind,
+            transformation=constants.ifs_fractals[name],
+            width=job["width"],
+            height=job["height"],
+            num_points=int(job["points"]),
+            block_size=job["block"],
+            seed=job["seed"],
+            cache=_cache,
+            pipeline=_pipeline,
+            phases=phases,
+            output_file=output_file,
+            **arguments)
+    fields = {key: value for key, value in job.items()
+              if key not in ("output", "center")}
+    if _pipeline is not None:
+        output_file = _pipeline.output_file(kind, output_file)
+    return phases.record(job=index, transformation=name, output=output_file,
+                         wall_sec=timer() - start, worker=os.getpid(),
+                         total_points=total_points, **fields)
+
+
+def run_batch(job_file, workers=None, output_dir=".", timing_file="",
+              cache_dir="", cache_size=2 ** 30, write_queue=2, compression=6,
+              raw=False):
+    """
+    Render every job of a job file across a pool of warm workers, writing
+    each image and timing record as its job completes.
+    :param job_file: JSON job file
+    :param workers: Number of worker processes, defaults to the CPU count
+    :param output_dir: Directory for images of jobs that do not name one
+    :param timing_file: Optional JSON lines file to append one record per
+        job to
+    :param cache_dir: Optional directory of a raw data cache shared by the
+        workers
+    :param cache_size: Disk budget of the cache in bytes
+    :param write_queue: Images each worker queues for its background writer
+        thread, so encoding one job overlaps computing the next. 0 writes
+        each image before the job returns
+    :param compression: PNG compression level, 0 to 9
+    :param raw: Save .npy arrays instead of PNG images
+    :return: list of job records
+    """
+    jobs = load_jobs(job_file)
+    if workers is None:
+        workers = cpu_count()
+    os.makedirs(output_dir, exist_ok=True)
+    for index, job in enumerate(jobs):
+        job.setdefault("output", os.path.join(
+            output_dir, "{}_{}_{}_{}.png".format(job["type"], job_name(job),
+                                                 job["backend"], index)))
+    backends = sorted(set(job["backend"] for job in jobs))
+    # longest first, so the slow jobs do not end up alone at the tail
+    ordered = sorted(enumerate(jobs), key=lambda job: -job_cost(job[1]))
+
+    print("Running {} jobs on {} workers".format(len(jobs), workers))
+    records = []
+    start = timer()
+    with Pool(workers, initializer=_warm_worker,
+              initargs=(backends, cache_dir, cache_size, write_queue,
+                        compression, raw)) as pool:
+        for record in pool.imap_unordered(run_job, ordered, chunksize=1):
+            records.append(record)
+            if len(timing_file) > 0:
+                Instrumentation.save_records([record], timing_file)
+            print("[{}/{}] {} {} {:.4f} sec -> {}".format(
+                len(records), len(jobs), record["transformation"],
+                record["backend"], record["run_time_sec"], record["output"]))
+        # let the workers exit normally so they finish their queued writes
+        pool.close()
+        pool.join()
+    elapsed = timer() - start
+
+    print("{} jobs in {:.2f} sec: {:.1f} jobs per minute".format(
+        len(records), elapsed, 60 * len(records) / elapsed))
+    return records
@@ -0,0 +1,235 @@
+"""
+In-process benchmark suite for the fractal backends. Every configuration of
+fractal x size x iterations/points x backend x block size runs inside one
+process, after warm-up passes, so imports and kernel compilation are paid
+once instead of on every sample.
+"""
+import csv
+import sys
+from os import path
+from timeit import default_timer as timer
+
+import numpy as np
+
+import Backends
+import Utilities
+import constants
+
+RESULT_FIELDS = ["fractal", "backend", "size", "iterations", "points",
+                 "block_size", "repeats", "median_sec", "iqr_sec", "min_sec",
+                 "throughput", "throughput_unit"]
+
+
+def print_help():
+    print("To benchmark Julia sets: --julia {comma separated sets 1-14, "
+          "or all}")
+    print("Optional arguments: --sizes {comma separated image sizes}"
+          "--iterations {comma separated iteration counts}")
+    print("To benchmark IFS fractals: --ifs {comma separated fractals, "
+          "or all}")
+    print("Optional arguments: --sizes {comma separated image sizes}"
+          "--points {comma separated point counts}")
+    print("Shared optional arguments: --backend {comma separated list of " +
+          ", ".join(Backends.BACKENDS) + "}"
+          "--block {comma separated gpu block sizes}"
+          "--warmup {number of untimed runs}"
+          "--repeats {number of timed runs}"
+          "--output {full path of csv file to append results to}"
+          "--images {directory to save one image per configuration to}")
+
+
+def time_runs(function, warmup=1, repeats=5):
+    """
+    Run a function warmup times untimed, then repeats times timed.
+    :return: list of run times in seconds, result of the last run
+    """
+    result = None
+    for _ in range(warmup):
+        result = function()
+    samples = []
+    for _ in range(repeats):
+        start = timer()
+        result = function()
+        samples.append(timer() - start)
+    return samples, result
+
+
+def summarize(samples, work, unit):
+    """
+    :param samples: Run times in seconds
+    :param work: Pixels or points produced by one run
+    :param unit: Throughput unit to report
+    :return: median, interquartile range, minimum and throughput
+    """
+    q1, median, q3 = np.percentile(samples, [25, 50, 75])
+    return {"repeats": len(samples),
+            "median_sec": median,
+            "iqr_sec": q3 - q1,
+            "min_sec": min(samples),
+            "throughput": work / median,
+            "throughput_unit": unit}
+
+
+def sweep_block_sizes(name, kind, block_sizes):
+    # backends without a block size are only run once per configuration
+    if Backends.accepts(name, kind, "block_size"):
+        return block_sizes
+    return [None]
+
+
+def benchmark_julia(sets, sizes, iterations, backends, block_sizes,
+                    warmup=1, repeats=5, image_dir=""):
+    """
+    Sweep Julia set x size x iterations x backend x block size.
+    :return: generator of result records
+    """
+    for julia_set in sets:
+        c = constants.julia_fractals["set" + julia_set]
+        for size in sizes:
+            for iteration in iterations:
+                for name in backends:
+                    for block in sweep_block_sizes(name, "julia_iterations",
+                                                   block_sizes):
+                        samples, data = time_runs(
+                            lambda: Backends.run(name, "julia_iterations",
+                                                 c=c,
+                                                 iterations=iteration,
+                                                 width=size,
+                                                 block_size=block),
+                            warmup, repeats)
+                        if len(image_dir) > 0:
+                            Utilities.write_fractal_image(
+                                data, output_file=path.join(
+                                    image_dir, "{}Out_{}_{}.png".format(
+                                        name, julia_set, iteration)))
+                        record = {"fractal": "set" + julia_set,
+                                  "backend": name,
+                                  "size": size,
+                                  "iterations": iteration,
+                                  "block_size": block}
+                        record.update(summarize(samples, size * size,
+                                                "pixels/sec"))
+                        yield record
+
+
+def benchmark_ifs(fractals, sizes, points, backends, block_sizes, warmup=1,
+                  repeats=5, image_dir=""):
+    """
+    Sweep IFS fractal x size x points x backend x block size. The size only
+    affects the saved images, as rasterizing is not part of the timed run.
+    :return: generator of result records
+    """
+    for fractal in fractals:
+        transformation = constants.ifs_fractals[fractal]
+        for size in sizes:
+            for num_points in points:
+                for name in backends:
+                    for block in sweep_block_sizes(name, "ifs_points",
+                                                   block_sizes):
+                        samples, (x, y) = time_runs(
+                            lambda: Backends.run(name, "ifs_points",
+                                                 transformation=transformation,
+                                                 num_points=num_points,
+                                                 block_size=block),
+                            warmup, repeats)
+                        if len(image_dir) > 0:
+                            Utilities.draw_image(
+                                x, y, size, size, path.join(
+                                    image_dir, "{}_{}_{}.png".format(
+                                        name, fractal, num_points)))
+                        record = {"fractal": fractal,
+                                  "backend": name,
+                                  "size": size,
+                                  "points": num_points,
+                                  "block_size": block}
+                        record.update(summarize(samples, num_points,
+                                                "points/sec"))
+                        yield record
+
+
+def report(records, output_file=""):
+    """
+    Print each record as it completes and append it to a csv file.
+    """
+    for record in records:
+        if "iterations" in record:
+            workload = "iterations {}".format(record["iterations"])
+        else:
+            workload = "points {}".format(record["points"])
+        print("{fractal:<14} {backend:<6} size {size} {workload} block "
+              "{block_size}: median {median_sec:.6f} sec, IQR {iqr_sec:.6f} "
+              "sec, {throughput:.4g} {throughput_unit}".format(
+                  workload=workload, **record))
+        if len(output_file) > 0:
+            write_header = not path.exists(output_file)
+            with open(output_file, "a", newline="") as results:
+                writer = csv.DictWriter(results, fieldnames=RESULT_FIELDS)
+                if write_header:
+                    writer.writeheader()
+                writer.writerow(record)
+
+
+def parse_list(text, cast=str):
+    return [cast(value) for value in text.split(",") if value]
+
+
+def parse_input_args():
+    n = len(sys.argv)
+    if n < 3 or sys.argv[1] not in ("--julia", "--ifs"):
+        print("Error: A fractal type must be provided.")
+        print_help()
+        exit(0)
+    kind = sys.argv[1]
+    if kind == "--julia":
+        names = [name[len("set"):] for name in constants.julia_fractals]
+    else:
+        names = list(constants.ifs_fractals)
+    if sys.argv[2] != "all":
+        names = parse_list(sys.argv[2])
+    sizes = [300]
+    iterations = [100, 150, 200, 250, 300]
+    points = [10000, 50000, 100000, 150000, 300000, 2000000]
+    backends = ["cpu", "gpu"]
+    block_sizes = [8]
+    warmup = 1
+    repeats = 5
+    output_file = ""
+    image_dir = ""
+    i = 3
+    while i < n:
+        try:
+            if sys.argv[i] == "--sizes" or sys.argv[i] == "-s":
+                sizes = parse_list(sys.argv[i + 1], int)
+            elif sys.argv[i] == "--iterations" or sys.argv[i] == "-i":
+                iterations = parse_list(sys.argv[i + 1], int)
+            elif sys.argv[i] == "--points" or sys.argv[i] == "-p":
+                points = parse_list(sys.argv[i + 1], int)
+            elif sys.argv[i] == "--backend":
+                backends = Backends.parse_backends(sys.argv[i + 1])
+            elif sys.argv[i] == "--block" or sys.argv[i] == "-b":
+                block_sizes = parse_list(sys.argv[i + 1], int)
+            elif sys.argv[i] == "--warmup":
+                warmup = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--repeats" or sys.argv[i] == "-r":
+                repeats = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--output" or sys.argv[i] == "-o":
+                output_file = sys.argv[i + 1]
+            elif sys.argv[i] == "--images":
+                image_dir = sys.argv[i + 1]
+            i += 2
+        except IndexError:
+            print("Index out of range error. The expected number of arguments "
+                  "were not provided.")
+            exit(1)
+
+    if kind == "--julia":
+        records = benchmark_julia(names, sizes, iterations, backends,
+                                  block_sizes, warmup, repeats, image_dir)
+    else:
+        records = benchmark_ifs(names, sizes, points, backends, block_sizes,
+                                warmup, repeats, image_dir)
+    report(records, output_file)
+
+
+if __name__ == '__main__':
+    parse_input_args()
@@ -1,18 +1,209 @@
-from random import uniform
+import json
+import os
+from decimal import Decimal, localcontext
+from multiprocessing import cpu_count, get_context
+from os import path
 import numpy as np
+import CompiledTransformation
+import FractalCache
+import Instrumentation
 import Utilities
 import constants
-from timeit import default_timer as timer
+from Viewport import Viewport
+
+# Worker pools start fresh interpreters: forking after Numba has started its
+# threading layer, e.g. when the numba backend ran first, deadlocks
+_pool_context = get_context("spawn")
+
+
+def cpuIfsChunks(transformation=constants.ifs_fractals["fern"],
+                 num_points=100000,
+                 chunk_size=1000000,
+                 chains=10000,
+                 burn_in=20,
+                 rng=None,
+                 start=None):
+    """
+    Batched NumPy chaos game. A batch of independent chains is advanced in
+    lock step: one vectorized alias-method draw picks a transformation for
+    every chain, and each transformation group is then mapped in bulk.
+    Points are produced in fixed-size chunks so callers can consume them
+    without holding every point in memory.
+    :param transformation: A transformation matrix with 7 columns
+        representing [a, b, c, d, e, f, prob] for the IFS function
+        x_(n+1) = ax_n + by_n + e and y_(n+1) = cx_n + dy_n + f
+    :param num_points: Total number of points to generate
+    :param chunk_size: Maximum number of points per chunk
+    :param chains: Number of chains advanced together per step
+    :param burn_in: Number of initial steps discarded while the chains
+        converge onto the attractor
+    :param rng: numpy random Generator, a fresh one is created if omitted
+    :param start: Optional (x, y) arrays of points to start the chains from
+        instead of the origin, e.g. points of a nearby attractor, which need
+        little or no burn-in. Their length takes the place of chains
+    :return: generator of (x, y) array chunks
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    compiled = CompiledTransformation.compile_transformation(transformation)
+    if start is None:
+        chains = max(1, min(chains, chunk_size, num_points))
+        x = np.zeros(chains)
+        y = np.zeros(chains)
+    else:
+        x = np.array(start[0], dtype=np.float64)
+        y = np.array(start[1], dtype=np.float64)
+        chains = x.size
+
+    new_x = np.empty(chains)
+    new_y = np.empty(chains)
+    generated = 0
+    step = 0
+
+    while generated < num_points:
+        size = min(chunk_size, num_points - generated)
+        points_x = np.empty(size)
+        points_y = np.empty(size)
+        filled = 0
+
+        while filled < size:
+            # decide which transformation to apply to every chain at once
+            choice = compiled.choose(rng, chains)
+            for i, (a, b, c, d, e, f) in enumerate(compiled.matrix):
+                group = choice == i
+                group_x = x[group]
+                group_y = y[group]
+                # x_(n+1) = ax_n + by_n + e
+                new_x[group] = a * group_x + b * group_y + e
+                # y_(n+1) = cx_n + dy_n + f
+                new_y[group] = c * group_x + d * group_y + f
+            x, new_x = new_x, x
+            y, new_y = new_y, y
+
+            step += 1
+            if step > burn_in:
+                count = min(chains, size - filled)
+                points_x[filled:filled + count] = x[:count]
+                points_y[filled:filled + count] = y[:count]
+                filled += count
+
+        generated += size
+        yield points_x, points_y
+
+
+def cpuIfsPoints(transformation=constants.ifs_fractals["fern"],
+                 num_points=100000,
+                 chains=10000,
+                 burn_in=20,
+                 rng=None):
+    """
+    Run the batched chaos game of cpuIfsChunks and return every point.
+    :return: x and y arrays of length num_points
+    """
+    return next(cpuIfsChunks(transformation=transformation,
+                             num_points=num_points,
+                             chunk_size=num_points,
+                             chains=chains,
+                             burn_in=burn_in,
+                             rng=rng))
+
+
+def _chain_histogram(task):
+    """
+    Run one seeded stream of chains and bin its points.
+    :return: (height, width) int64 histogram of the stream's points
+    """
+    transformation, num_points, width, height, bounds, seed, chunk_size, \
+        chains, burn_in = task
+    chunks = cpuIfsChunks(transformation=transformation,
+                          num_points=num_points,
+                          chunk_size=chunk_size,
+                          chains=chains,
+                          burn_in=burn_in,
+                          rng=np.random.default_rng(seed))
+    return Utilities.stream_to_histogram(chunks, width, height, bounds)
+
+
+def cpuParallelIfsHistogram(transformation=constants.ifs_fractals["fern"],
+                            width=600,
+                            height=600,
+                            num_points=100000,
+                            workers=None,
+                            seed=None,
+                            streams=32,
+                            chunk_size=1000000,
+                            chains=None,
+                            burn_in=20,
+                            bounds=None,
+                            phases=None):
+    """
+    Multi-core chaos game. The points are split over a fixed number of
+    independent streams, each with its own generator spawned from one
+    numpy.random.SeedSequence and its own burn-in. A process pool runs the
+    streams and their integer histograms are summed, so for a given seed
+    the result is the same bit for bit whatever the number of workers.
+    :param workers: Number of worker processes, defaults to the CPU count
+    :param seed: Seed of the SeedSequence, None for fresh entropy
+    :param streams: Number of independent streams the points are split
+        into. Changing it changes the result for a seed
+    :param chunk_size: Maximum number of points a stream holds at once
+    :param chains: Chains advanced together in each stream, defaults to
+        enough that the burn-in stays a small part of a stream's steps
+    :param burn_in: Steps each chain discards before its points are kept
+    :param bounds: (min_x, max_x, min_y, max_y) viewport. Defaults to the
+        attractor bounds of the compiled transformation, or is estimated
+        from a seeded warm-up run if those are not known
+    :param phases: Optional Instrumentation.PhaseTimer to record per-phase
+        timings in
+    :return: (height, width) int64 histogram of point counts
+    """
+    if workers is None:
+        workers = cpu_count()
+    streams = max(1, min(streams, num_points))
+    sequences = np.random.SeedSequence(seed).spawn(streams + 1)
+    with Instrumentation.phase(phases, "setup"):
+        if bounds is None:
+            bounds = CompiledTransformation.compile_transformation(
+                transformation).bounds
+        if bounds is None:
+            bounds = Utilities.warm_up_bounds(
+                *cpuIfsPoints(transformation=transformation,
+                              num_points=min(num_points, 100000),
+                              burn_in=burn_in,
+                              rng=np.random.default_rng(sequences[-1])))
+    # the first num_points % streams streams take one point more
+    share, extra = divmod(num_points, streams)
+    if chains is None:
+        chains = int(np.clip(share // 20, 256, 8192))
+    tasks = [(transformation, share + (stream < extra), width, height, bounds,
+              sequences[stream], chunk_size, chains, burn_in)
+             for stream in range(streams)]
+
+    counts = np.zeros((height, width), dtype=np.int64)
+    with Instrumentation.phase(phases, "compute"):
+        if workers > 1:
+            with _pool_context.Pool(workers) as pool:
+                for histogram in pool.imap_unordered(_chain_histogram, tasks):
+                    counts += histogram
+        else:
+            for task in tasks:
+                counts += _chain_histogram(task)
+    return counts
 
 
 def cpuIfsTransform(transformation=constants.ifs_fractals["fern"],
                     width=600,
                     height=600,
                     num_points=100000,
-                    output_file="cpuOut.png"):
+                    output_file="cpuOut.png",
+                    workers=1,
+                    seed=None,
+                    cache=None,
+                    pipeline=None,
+                    phases=None):
     """
     This function will perform the Iterated Function System (IFS) fractal
-    algorithm in the traditional, iterative process
+    algorithm on the CPU with the batched chaos game in cpuIfsPoints
     :param transformation: transformation: A transformation matrix with 7 columns
         representing [a, b, c, d, e, f, prob] for the IFS function
         x_(n+1) = ax_n + by_n + e and y_(n+1) = cx_n + dy_n + f
@@ -20,43 +211,1066 @@ def cpuIfsTransform(transformation=constants.ifs_fractals["fern"],
     :param height: Height of the image in pixels
     :param num_points: Number of points in the fractal
     :param output_file: File to save the image to
+    :param workers: Number of worker processes. More than one, or a seed,
+        runs the seeded multi-stream chaos game of cpuParallelIfsHistogram
+    :param seed: Seed making the image reproducible whatever the number of
+        workers
+    :param cache: Optional FractalCache.FractalCache. The density histogram
+        is reused from it when cached and stored in it when not
+    :param pipeline: Optional OutputPipeline.OutputPipeline that writes
+        the image in the background while the caller carries on
+    :param phases: Optional Instrumentation.PhaseTimer to record per-phase
+        timings in
     :return: algorithm run time in seconds, number of points
     """
-    start = timer()
-    probabilityJoin = sum(t[6] for t in transformation)
-    points = set([(0, 0)])
-    while len(points) <= num_points:
-        newPoints = set()
-
-        # for each point
-        for (x, y) in points:
-            # decide which transformation to apply
-            rnd = uniform(0, probabilityJoin)
-            pSum = 0
-            for i in range(len(transformation)):
-                pSum += transformation[i][6]
-                if rnd <= pSum:
-                    # x_(n+1) = ax_n + by_n + e
-                    x0 = x * transformation[i][0] + y * transformation[i][1] + \
-                         transformation[i][4]
-                    # y_(n+1) = cx_n + dy_n + f
-                    y = x * transformation[i][2] + y * transformation[i][3] + \
-                        transformation[i][5]
-                    x = x0
-                    newPoints.add((x, y))
+    if phases is None:
+        phases = Instrumentation.PhaseTimer()
+
+    def compute():
+        if workers > 1 or seed is not None:
+            return cpuParallelIfsHistogram(transformation=transformation,
+                                           width=width,
+                                           height=height,
+                                           num_points=num_points,
+                                           workers=workers,
+                                           seed=seed,
+                                           phases=phases)
+        with phases.phase("compute"):
+            x, y = cpuIfsPoints(transformation=transformation,
+                                num_points=num_points)
+        with phases.phase("rasterize"):
+            return Utilities.bin_points(
+                x, y, width, height,
+                CompiledTransformation.compile_transformation(
+                    transformation).bounds)
+
+    counts = FractalCache.cached(cache, compute, phases, kind="ifs",
+                                 backend="cpu", transformation=transformation,
+                                 num_points=num_points, width=width,
+                                 height=height, seed=seed)
+    Utilities.save_density(counts, output_file, phases, pipeline)
+    return phases.total(), num_points
+
+
+def cpuStreamingIfsTransform(transformation=constants.ifs_fractals["fern"],
+                             width=600,
+                             height=600,
+                             num_points=100000,
+                             chunk_size=1000000,
+                             bounds=None,
+                             output_file="cpuOut.png",
+                             workers=1,
+                             seed=None,
+                             tolerance=None,
+                             cache=None,
+                             pipeline=None,
+                             phases=None):
+    """
+    Constant-memory version of cpuIfsTransform. Points are generated in
+    fixed-size chunks and each chunk is binned straight into the pixel
+    histogram, so memory stays flat regardless of the number of points.
+    :param num_points: Number of points, or the most points to generate
+        when a tolerance is given
+    :param chunk_size: Number of points generated per chunk
+    :param bounds: (min_x, max_x, min_y, max_y) viewport. Defaults to the
+        attractor bounds of the compiled transformation, or is estimated
+        from a short warm-up run if those are not known
+    :param workers: Number of worker processes. More than one, or a seed,
+        runs the seeded multi-stream chaos game of cpuParallelIfsHistogram
+    :param seed: Seed making the image reproducible whatever the number of
+        workers
+    :param tolerance: Stop once a chunk changes less than this fraction of
+        the occupied pixels, see Utilities.stream_until_converged. Runs a
+        single stream of chains
+    :param cache: Optional FractalCache.FractalCache. The density histogram
+        is reused from it when cached and stored in it when not
+    :param pipeline: Optional OutputPipeline.OutputPipeline that writes
+        the image in the background while the caller carries on
+    :param phases: Optional Instrumentation.PhaseTimer to record per-phase
+        timings in
+    :return: algorithm run time in seconds, number of points used
+    """
+    if phases is None:
+        phases = Instrumentation.PhaseTimer()
+    if tolerance is not None and workers > 1:
+        raise ValueError("Convergence runs a single stream of chains, use "
+                         "one worker")
+    used = []
+
+    def compute():
+        if tolerance is None and (workers > 1 or seed is not None):
+            return cpuParallelIfsHistogram(transformation=transformation,
+                                           width=width,
+                                           height=height,
+                                           num_points=num_points,
+                                           workers=workers,
+                                           seed=seed,
+                                           chunk_size=chunk_size,
+                                           bounds=bounds,
+                                           phases=phases)
+        histogram_bounds = bounds
+        with phases.phase("setup"):
+            if histogram_bounds is None:
+                histogram_bounds = CompiledTransformation.\
+                    compile_transformation(transformation).bounds
+            if histogram_bounds is None:
+                histogram_bounds = Utilities.warm_up_bounds(
+                    *cpuIfsPoints(transformation=transformation,
+                                  num_points=min(num_points, 100000)))
+        chunks = cpuIfsChunks(transformation=transformation,
+                              num_points=num_points,
+                              chunk_size=chunk_size,
+                              rng=np.random.default_rng(seed))
+        if tolerance is None:
+            return Utilities.stream_to_histogram(chunks, width, height,
+                                                 histogram_bounds, phases)
+        counts, points = Utilities.stream_until_converged(
+            chunks, width, height, histogram_bounds, tolerance,
+            phases=phases)
+        used.append(points)
+        return counts
+
+    counts = FractalCache.cached(cache, compute, phases, kind="streaming_ifs",
+                                 backend="cpu", transformation=transformation,
+                                 num_points=num_points, width=width,
+                                 height=height, chunk_size=chunk_size,
+                                 bounds=bounds, seed=seed, tolerance=tolerance)
+    Utilities.save_density(counts, output_file, phases, pipeline)
+    if tolerance is None:
+        return phases.total(), num_points
+    # a cached histogram holds every point it was converged with
+    return phases.total(), used[0] if used else int(counts.sum())
+
+
+def _escape_counts(z, c, iterations, divergence_value, out=None,
+                   formula=None):
+    """
+    Iterate 'z = z^2 + c' over a flat array of points with an active-pixel
+    mask, dropping pixels from the working set as they diverge.
+    :param z: flat complex array of starting points, modified in place
+    :param c: Complex value, or a flat array with a c value per point
+    :param out: optional float32 array to write the counts into
+    :param formula: Optional Formulas.Formula to iterate instead of the
+        quadratic map. z then holds the pixels of the formula's plane
+    :return: flat array holding the number of iterations completed before
+        each point escaped, or iterations if it never did
+    """
+    if out is None:
+        out = np.empty(z.size, dtype=np.float32)
+    out[:] = iterations
+    active = np.arange(z.size)
+    if formula is not None:
+        return _formula_escape_counts(z, c, iterations, divergence_value, out,
+                                      formula)
+    per_pixel = np.ndim(c) > 0
+
+    for i in range(iterations):
+        np.multiply(z, z, out=z)
+        z += c
+        escaped = np.abs(z) > divergence_value
+        if escaped.any():
+            out[active[escaped]] = i
+            remaining = ~escaped
+            z = z[remaining]
+            if per_pixel:
+                c = c[remaining]
+            active = active[remaining]
+            if active.size == 0:
+                break
+
+    return out
+
+
+def _formula_escape_counts(points, c, iterations, divergence_value, out,
+                           formula):
+    """
+    _escape_counts for a compiled formula. A parameter plane formula has a
+    c per pixel, which is dropped from the working set along with z.
+    """
+    z, c = formula.start(points, c)
+    per_pixel = np.ndim(c) > 0
+    active = np.arange(z.size)
+
+    with np.errstate(all="ignore"):
+        for i in range(iterations):
+            z = formula.step(z, c)
+            # overflowing formulas produce inf and nan, which have escaped
+            escaped = ~(np.abs(z) <= divergence_value)
+            if escaped.any():
+                out[active[escaped]] = i
+                remaining = ~escaped
+                z = z[remaining]
+                if per_pixel:
+                    c = c[remaining]
+                active = active[remaining]
+                if active.size == 0:
+                    break
+
+    return out
+
+
+def cpuJuliaIterations(c=constants.julia_fractals["set1"],
+                       iterations=200,
+                       divergence_value=10,
+                       width=300,
+                       height=None,
+                       viewport=None,
+                       formula=None):
+    """
+    Whole-grid NumPy escape-time engine for the quadratic map 'z = z^2 + c'.
+    The complex plane is built once and only the pixels that have not yet
+    diverged are iterated; escaped pixels are dropped from the working set.
+    :param c: Complex value representation
+    :param iterations: total number of iterations
+    :param divergence_value: divergence value for algorithm
+    :param width: Width of the image in pixels
+    :param height: Height of the image in pixels, defaults to the width
+    :param viewport: Optional Viewport.Viewport to render. Its size takes
+        the place of width and height
+    :param formula: Optional Formulas.Formula to iterate instead of the
+        quadratic map
+    :return: (width, height) array of iteration counts
+    """
+    if viewport is None:
+        viewport = Viewport(width, height)
+    z = viewport.plane()
+    points = _escape_counts(z, c, iterations, float(divergence_value),
+                            formula=formula)
+    return points.reshape(viewport.width, viewport.height)
+
+
+def cpuJuliaAtlas(c_values=tuple(constants.julia_fractals.values()),
+                  iterations=200,
+                  divergence_value=10,
+                  width=64,
+                  height=None,
+                  viewport=None,
+                  formula=None,
+                  batch_pixels=2 ** 22,
+                  phases=None):
+    """
+    Render the Julia sets of many c values in one vectorized pass. The pixel
+    plane is built once and stacked once per c value, with a matching
+    array of c values, so the sets are iterated together instead of paying
+    the per-call setup of cpuJuliaIterations for every thumbnail.
+    :param c_values: Sequence of complex c values
+    :param iterations: total number of iterations
+    :param divergence_value: divergence value for algorithm
+    :param width: Width of each image in pixels
+    :param height: Height of each image in pixels, defaults to the width
+    :param viewport: Optional Viewport.Viewport shared by every image. Its
+        size takes the place of width and height
+    :param formula: Optional Julia plane Formulas.Formula to iterate
+        instead of the quadratic map
+    :param batch_pixels: Maximum number of pixels iterated at once. The c
+        values are split into batches of whole images to bound memory
+    :param phases: Optional Instrumentation.PhaseTimer to record per-phase
+        timings in
+    :return: (len(c_values), width, height) array of iteration counts
+    """
+    if viewport is None:
+        viewport = Viewport(width, height)
+    if formula is not None and formula.plane != "z":
+        raise ValueError("An atlas varies c per image, so its formula must "
+                         "iterate the Julia plane")
+    c_values = np.asarray(c_values, dtype=np.complex128).ravel()
+    divergence_value = float(divergence_value)
+    with Instrumentation.phase(phases, "setup"):
+        plane = viewport.plane()
+        counts = np.empty((c_values.size, plane.size), dtype=np.float32)
+    per_batch = max(1, batch_pixels // plane.size)
+
+    with Instrumentation.phase(phases, "compute"):
+        for first in range(0, c_values.size, per_batch):
+            batch = c_values[first:first + per_batch]
+            z = np.tile(plane, batch.size)
+            c = np.repeat(batch, plane.size)
+            _escape_counts(z, c, iterations, divergence_value,
+                           out=counts[first:first + batch.size].reshape(-1),
+                           formula=formula)
+    return counts.reshape(c_values.size, viewport.width, viewport.height)
+
+
+# Shared iteration buffer attached by each tile worker
+_tile_buffer = None
+
+
+def _attach_tile_buffer(buffer, width, height):
+    global _tile_buffer
+    _tile_buffer = np.frombuffer(buffer, dtype=np.float32).reshape(width,
+                                                                  height)
+
+
+def _attach_tile_memmap(buffer_file, width, height):
+    global _tile_buffer
+    _tile_buffer = np.memmap(buffer_file, dtype=np.float32, mode="r+",
+                             shape=(width, height))
+
+
+def _render_rows(buffer, tile):
+    c, iterations, divergence_value, viewport, row_start, row_stop, \
+        formula = tile
+    z = viewport.plane(row_start, row_stop)
+    _escape_counts(z, c, iterations, divergence_value,
+                   out=buffer[row_start:row_stop].reshape(-1),
+                   formula=formula)
+    if isinstance(buffer, np.memmap):
+        buffer.flush()
+    return row_start
+
+
+def _render_tile(tile):
+    return _render_rows(_tile_buffer, tile)
+
+
+def _schedule_tiles(c, iterations, divergence_value, viewport, tile_rows,
+                    probe_size=32, formula=None):
+    """
+    Split the image into row tiles and order them longest-first. The cost of
+    each tile is estimated from a coarse, low resolution probe render so the
+    expensive interior tiles are handed out before the cheap exterior ones.
+    """
+    width = viewport.width
+    probe_rows = min(probe_size, width)
+    probe = cpuJuliaIterations(c, iterations, divergence_value,
+                               viewport=viewport.resized(
+                                   probe_rows,
+                                   min(probe_size, viewport.height)),
+                               formula=formula)
+    row_cost = probe.sum(axis=1) + 1
+
+    tiles = []
+    for row_start in range(0, width, tile_rows):
+        row_stop = min(row_start + tile_rows, width)
+        first = row_start * probe_rows // width
+        last = max(first + 1, -(-row_stop * probe_rows // width))
+        cost = row_cost[first:last].mean() * (row_stop - row_start)
+        tiles.append((cost, row_start, row_stop))
+    tiles.sort(reverse=True)
+    return [(c, iterations, divergence_value, viewport, row_start, row_stop,
+             formula)
+            for _, row_start, row_stop in tiles]
+
+
+def cpuTiledJuliaIterations(c=constants.julia_fractals["set1"],
+                            iterations=200,
+                            divergence_value=10,
+                            width=300,
+                            height=None,
+                            workers=None,
+                            tile_rows=None,
+                            viewport=None,
+                            formula=None):
+    """
+    Multi-core version of cpuJuliaIterations. The image is split into row
+    tiles that a process pool renders straight into one shared iteration
+    buffer, so no per-tile arrays are pickled back to the parent.
+    :param workers: Number of worker processes, defaults to the CPU count
+    :param tile_rows: Rows per tile, defaults to roughly eight tiles per
+        worker so uneven tiles can be balanced dynamically
+    :param viewport: Optional Viewport.Viewport to render. Its size takes
+        the place of width and height
+    :param formula: Optional Formulas.Formula to iterate instead of the
+        quadratic map
+    :return: (width, height) array of iteration counts
+    """
+    if viewport is None:
+        viewport = Viewport(width, height)
+    width, height = viewport.width, viewport.height
+    if workers is None:
+        workers = cpu_count()
+    if tile_rows is None:
+        tile_rows = max(1, width // (workers * 8))
+    divergence_value = float(divergence_value)
+
+    buffer = _pool_context.RawArray('f', width * height)
+    tiles = _schedule_tiles(c, iterations, divergence_value, viewport,
+                            tile_rows, formula=formula)
+    with _pool_context.Pool(workers, initializer=_attach_tile_buffer,
+                            initargs=(buffer, width, height)) as pool:
+        for _ in pool.imap_unordered(_render_tile, tiles, chunksize=1):
+            pass
+
+    return np.frombuffer(buffer, dtype=np.float32).reshape(width, height)
+
+
+def _load_progress(progress_file, parameters):
+    """
+    :return: set of the first rows of the tiles already rendered into the
+        buffer with these parameters, empty if there is no matching progress
+    """
+    if not path.exists(progress_file):
+        return set()
+    with open(progress_file) as progress:
+        saved = json.load(progress)
+    if saved.get("parameters") != parameters:
+        return set()
+    return set(saved["done"])
+
+
+def _save_progress(progress_file, parameters, done):
+    # replace the file in one step so an interrupted run never leaves a
+    # truncated progress file behind
+    with open(progress_file + ".tmp", "w") as progress:
+        json.dump({"parameters": parameters, "done": sorted(done)}, progress)
+    os.replace(progress_file + ".tmp", progress_file)
+
+
+def cpuOutOfCoreJuliaIterations(c=constants.julia_fractals["set1"],
+                                iterations=200,
+                                divergence_value=10,
+                                buffer_file="julia.buffer",
+                                viewport=None,
+                                workers=1,
+                                tile_rows=None,
+                                formula=None):
+    """
+    Render into a np.memmap iteration buffer on disk one row tile at a time,
+    for images too large for memory. Finished tiles are recorded in a
+    progress file next to the buffer, so an interrupted render started
+    again with the same parameters only renders the missing tiles.
+    :param c: Complex value representation
+    :param iterations: total number of iterations
+    :param divergence_value: divergence value for algorithm
+    :param buffer_file: File holding the float32 iteration buffer
+    :param viewport: Viewport.Viewport to render
+    :param workers: Number of worker processes rendering tiles
+    :param tile_rows: Rows per tile, defaults to about 4 million pixels per
+        tile to bound the memory each worker needs
+    :param formula: Optional Formulas.Formula to iterate instead of the
+        quadratic map
+    :return: (width, height) np.memmap of iteration counts
+    """
+    if viewport is None:
+        viewport = Viewport()
+    width, height = viewport.width, viewport.height
+    if tile_rows is None:
+        tile_rows = max(1, 2 ** 22 // height)
+    divergence_value = float(divergence_value)
+
+    progress_file = buffer_file + ".progress"
+    parameters = {"c": [float(np.real(c)), float(np.imag(c))],
+                  "iterations": iterations,
+                  "divergence_value": divergence_value,
+                  "viewport": repr(viewport), "tile_rows": tile_rows,
+                  "formula": repr(formula)}
+    done = _load_progress(progress_file, parameters)
+    expected_bytes = width * height * np.dtype(np.float32).itemsize
+    if not path.exists(buffer_file) or \
+            path.getsize(buffer_file) != expected_bytes:
+        done = set()
+        np.memmap(buffer_file, dtype=np.float32, mode="w+",
+                  shape=(width, height)).flush()
+    _save_progress(progress_file, parameters, done)
+
+    tiles = [tile for tile in _schedule_tiles(c, iterations, divergence_value,
+                                              viewport, tile_rows,
+                                              formula=formula)
+             if tile[4] not in done]
+    if done:
+        print("Resuming render, {} of {} tiles left".format(
+            len(tiles), len(tiles) + len(done)))
+    if workers > 1:
+        with _pool_context.Pool(workers, initializer=_attach_tile_memmap,
+                                initargs=(buffer_file, width,
+                                          height)) as pool:
+            for row_start in pool.imap_unordered(_render_tile, tiles,
+                                                 chunksize=1):
+                done.add(row_start)
+                _save_progress(progress_file, parameters, done)
+    else:
+        buffer = np.memmap(buffer_file, dtype=np.float32, mode="r+",
+                           shape=(width, height))
+        for tile in tiles:
+            done.add(_render_rows(buffer, tile))
+            _save_progress(progress_file, parameters, done)
+        del buffer
+
+    return np.memmap(buffer_file, dtype=np.float32, mode="r",
+                     shape=(width, height))
+
+
+def _periodic_escape_counts(z, c, iterations, divergence_value,
+                            formula=None):
+    """
+    Version of _escape_counts with Brent-style periodicity checking. Each
+    orbit is compared against a saved value that is refreshed at power of
+    two iterations; an orbit that lands exactly on its saved value is
+    cycling and can never escape, so it is dropped from the working set
+    with the full iteration count.
+    :param z: flat complex array of starting points, modified in place
+    :param formula: Optional Formulas.Formula to iterate instead of the
+        quadratic map. z then holds the pixels of the formula's plane
+    :return: flat array of iteration counts and a flat boolean array marking
+        the points proven to be bounded
+    """
+    counts = np.full(z.size, iterations, dtype=np.float32)
+    bounded = np.zeros(z.size, dtype=bool)
+    active = np.arange(z.size)
+    per_pixel = False
+    if formula is not None:
+        z, c = formula.start(z, c)
+        per_pixel = np.ndim(c) > 0
+    saved = z.copy()
+    next_save = 1
+
+    with np.errstate(all="ignore"):
+        for i in range(iterations):
+            if formula is None:
+                np.multiply(z, z, out=z)
+                z += c
+            else:
+                z = formula.step(z, c)
+            escaped = ~(np.abs(z) <= divergence_value)
+            cycled = z == saved
+            done = escaped | cycled
+            if done.any():
+                counts[active[escaped]] = i
+                bounded[active[cycled & ~escaped]] = True
+                remaining = ~done
+                z = z[remaining]
+                saved = saved[remaining]
+                if per_pixel:
+                    c = c[remaining]
+                active = active[remaining]
+                if active.size == 0:
                     break
+            if i + 1 == next_save:
+                saved[:] = z
+                next_save *= 2
+
+    return counts, bounded
+
+
+def _rectangle_border(w0, w1, h0, h1):
+    """
+    :return: row and column indices of the border pixels of the rectangle
+        [w0, w1) x [h0, h1)
+    """
+    inner = np.arange(w0 + 1, w1 - 1)
+    rows = np.concatenate([np.full(h1 - h0, w0), np.full(h1 - h0, w1 - 1),
+                           inner, inner])
+    columns = np.concatenate([np.arange(h0, h1), np.arange(h0, h1),
+                              np.full(inner.size, h0),
+                              np.full(inner.size, h1 - 1)])
+    return rows, columns
+
+
+def cpuAcceleratedJuliaIterations(c=constants.julia_fractals["set1"],
+                                  iterations=200,
+                                  divergence_value=10,
+                                  width=300,
+                                  height=None,
+                                  min_size=8,
+                                  viewport=None,
+                                  formula=None):
+    """
+    Escape-time engine for high iteration counts, where confirming interior
+    points dominates. Produces the same counts as cpuJuliaIterations using
+    three shortcuts:
+    - periodicity checking stops orbits that have started cycling
+    - Mariani-Silver subdivision: a rectangle whose whole border is proven
+      bounded lies inside the filled Julia set, which has no holes, so its
+      interior is filled without being iterated. Only the sets of
+      polynomial maps are free of holes, so other formulas skip this
+    - the set is symmetric under z -> -z, so when the viewport is centred
+      on the origin pixel (w, h) is copied from (width - w, height - h) for
+      half the image. Of the other formulas only the even Julia plane
+      maps, f(-z) = f(z), share this symmetry
+    :param c: Complex value representation
+    :param iterations: total number of iterations
+    :param divergence_value: divergence value for algorithm
+    :param width: Width of the image in pixels
+    :param height: Height of the image in pixels, defaults to the width
+    :param min_size: Rectangles this many pixels wide or less are iterated
+        directly instead of subdivided
+    :param viewport: Optional Viewport.Viewport to render. Its size takes
+        the place of width and height
+    :param formula: Optional Formulas.Formula to iterate instead of the
+        quadratic map
+    :return: (width, height) array of iteration counts
+    """
+    if viewport is None:
+        viewport = Viewport(width, height)
+    width, height = viewport.width, viewport.height
+    divergence_value = float(divergence_value)
+    points = np.full((width, height), -1, dtype=np.float32)
+    bounded = np.zeros((width, height), dtype=bool)
+
+    def iterate(rows, columns):
+        pending = points[rows, columns] < 0
+        rows, columns = rows[pending], columns[pending]
+        if rows.size:
+            z = viewport.points(rows, columns)
+            points[rows, columns], bounded[rows, columns] = \
+                _periodic_escape_counts(z, c, iterations, divergence_value,
+                                        formula)
+
+    # rows past the middle mirror rows 1..width // 2, except column 0 whose
+    # mirror lies outside the image. The rectangles of one subdivision level
+    # are iterated together to keep the number of NumPy passes small.
+    if formula is None:
+        symmetric = viewport.is_centred()
+    else:
+        symmetric = formula.symmetric(viewport)
+    half = width // 2 + 1 if symmetric else width
+    if formula is None or formula.polynomial:
+        level = [(0, half, 0, height)]
+        small = []
+    else:
+        level = []
+        small = [(0, half, 0, height)]
+    while level:
+        large = []
+        for rectangle in level:
+            w0, w1, h0, h1 = rectangle
+            if w1 - w0 <= min_size or h1 - h0 <= min_size:
+                small.append(rectangle)
+            else:
+                large.append(rectangle)
+        borders = [_rectangle_border(*rectangle) for rectangle in large]
+        if borders:
+            iterate(np.concatenate([rows for rows, _ in borders]),
+                    np.concatenate([columns for _, columns in borders]))
+
+        level = []
+        for (w0, w1, h0, h1), (rows, columns) in zip(large, borders):
+            if bounded[rows, columns].all():
+                points[w0 + 1:w1 - 1, h0 + 1:h1 - 1] = iterations
+                bounded[w0 + 1:w1 - 1, h0 + 1:h1 - 1] = True
+            else:
+                w_mid = (w0 + w1) // 2
+                h_mid = (h0 + h1) // 2
+                level += [(w0, w_mid, h0, h_mid), (w0, w_mid, h_mid, h1),
+                          (w_mid, w1, h0, h_mid), (w_mid, w1, h_mid, h1)]
+
+    blocks = [np.mgrid[w0:w1, h0:h1].reshape(2, -1)
+              for w0, w1, h0, h1 in small]
+    if blocks:
+        rows, columns = np.concatenate(blocks, axis=1)
+        iterate(rows, columns)
+
+    if symmetric:
+        iterate(np.arange(half, width), np.zeros(width - half, dtype=int))
+        points[half:, 1:] = points[width - half:0:-1, height - 1:0:-1]
+    return points
+
+
+def _continue_orbits(z, c, first, last, divergence_value, formula=None):
+    """
+    Advance orbits from iteration first to last, counting escapes as
+    _escape_counts does from iteration 0.
+    :param z: flat complex array of the orbits at iteration first. Orbits
+        that do not escape are left holding their value at iteration last
+    :param c: Complex value, or a flat array with a c value per orbit
+    :return: flat float32 array of the iteration each orbit escaped at, or
+        last if it did not
+    """
+    out = np.full(z.size, last, dtype=np.float32)
+    active = np.arange(z.size)
+    orbit = z.copy()
+    per_pixel = np.ndim(c) > 0
+
+    with np.errstate(all="ignore"):
+        for i in range(first, last):
+            if formula is None:
+                np.multiply(orbit, orbit, out=orbit)
+                orbit += c
+            else:
+                orbit = formula.step(orbit, c)
+            escaped = ~(np.abs(orbit) <= divergence_value)
+            if escaped.any():
+                out[active[escaped]] = i
+                remaining = ~escaped
+                orbit = orbit[remaining]
+                if per_pixel:
+                    c = c[remaining]
+                active = active[remaining]
+                if active.size == 0:
+                    break
+    z[active] = orbit
+    return out
+
+
+def _lattice_neighbours(mask):
+    """
+    :return: whether any of the 8 neighbours of each element of a 2D mask
+        is set
+    """
+    padded = np.pad(mask, 1)
+    width, height = mask.shape
+    found = np.zeros_like(mask)
+    for dw in (0, 1, 2):
+        for dh in (0, 1, 2):
+            if dw != 1 or dh != 1:
+                found |= padded[dw:dw + width, dh:dh + height]
+    return found
+
+
+def _differs_from_neighbours(counts):
+    """
+    :return: whether any of the 8 neighbours of each pixel has a different
+        count
+    """
+    padded = np.pad(counts, 1, mode="edge")
+    width, height = counts.shape
+    differs = np.zeros(counts.shape, dtype=bool)
+    for dw in (0, 1, 2):
+        for dh in (0, 1, 2):
+            if dw != 1 or dh != 1:
+                differs |= padded[dw:dw + width, dh:dh + height] != counts
+    return differs
+
+
+def cpuProgressiveJuliaIterations(c=constants.julia_fractals["set1"],
+                                  iterations=200,
+                                  divergence_value=10,
+                                  width=300,
+                                  height=None,
+                                  start_step=8,
+                                  viewport=None,
+                                  formula=None,
+                                  callback=None,
+                                  phases=None):
+    """
+    Coarse-to-fine escape-time engine for previews. The first pass iterates
+    every start_step-th pixel in each direction with a fraction of the
+    iteration budget, and each further pass halves the step and doubles the
+    budget until every pixel is known at the full budget:
+    - counts of earlier passes are kept. A new pixel whose enclosing cell
+      of the previous pass has four corners with the same count takes that
+      count without being iterated; only pixels where the corners disagree,
+      and those of the partial cells along the right and bottom edges, are
+      iterated
+    - the orbit of every iterated pixel is kept, so when the budget rises
+      the pixels that had not escaped continue where they stopped. Before
+      the final pass only those next to an escaped pixel, near the
+      boundary, are continued; the others are taken to be inside the set
+    The final pass assumes nothing about the interior: every pixel that
+    has not escaped is iterated to the full budget, only escaped counts of
+    polynomial maps are filled, away from the image edges, and every
+    filled pixel next to a different count is iterated until none is
+    left. The result then matches cpuJuliaIterations, except for a detail
+    thin enough to cross a cell of the previous pass between its corners.
+    The start step is reduced until the first pass has a whole cell.
+    :param c: Complex value representation
+    :param iterations: total number of iterations of the final pass
+    :param divergence_value: divergence value for algorithm
+    :param width: Width of the image in pixels
+    :param height: Height of the image in pixels, defaults to the width
+    :param start_step: Pixel step of the first pass, a power of two
+    :param viewport: Optional Viewport.Viewport to render. Its size takes
+        the place of width and height
+    :param formula: Optional Formulas.Formula to iterate instead of the
+        quadratic map
+    :param callback: Optional function called after every pass with the
+        counts of that pass's pixels, counts[::step, ::step], the step and
+        the iteration budget. Returning True stops the render early
+    :param phases: Optional Instrumentation.PhaseTimer to record per-phase
+        timings in
+    :return: (width, height) array of iteration counts. When stopped early,
+        the pixels of the last pass are repeated over their cells
+    """
+    if start_step < 1 or start_step & (start_step - 1):
+        raise ValueError("The start step of a progressive render must be a "
+                         "power of two")
+    if viewport is None:
+        viewport = Viewport(width, height)
+    width, height = viewport.width, viewport.height
+    divergence_value = float(divergence_value)
+    # the first pass needs at least one whole cell
+    while start_step > 1 and start_step >= min(width, height):
+        start_step >>= 1
+    levels = start_step.bit_length() - 1
+    polynomial = formula is None or formula.polynomial
+
+    with Instrumentation.phase(phases, "setup"):
+        counts = np.full((width, height), -1, dtype=np.float32)
+        orbits = np.zeros((width, height), dtype=np.complex128)
+        # iteration each pixel's orbit has reached, -1 if never iterated
+        reached = np.full((width, height), -1, dtype=np.int64)
+        constants_plane = None
+        if formula is not None and formula.plane == "c":
+            constants_plane = np.zeros((width, height), dtype=np.complex128)
+
+    def advance(rows, columns, last):
+        # start new orbits, then continue every orbit up to last
+        new = reached[rows, columns] < 0
+        if new.any():
+            start = viewport.points(rows[new], columns[new])
+            if formula is not None:
+                start, k = formula.start(start, c)
+                if constants_plane is not None:
+                    constants_plane[rows[new], columns[new]] = k
+            orbits[rows[new], columns[new]] = start
+            reached[rows[new], columns[new]] = 0
+        first = reached[rows, columns]
+        for value in np.unique(first):
+            group = first == value
+            r, k = rows[group], columns[group]
+            z = orbits[r, k]
+            constant = c if constants_plane is None else constants_plane[r, k]
+            counts[r, k] = _continue_orbits(z, constant, int(value), last,
+                                            divergence_value, formula)
+            orbits[r, k] = z
+            reached[r, k] = last
+
+    step = start_step
+    budget = 0
+    for level in range(levels + 1):
+        previous_step, previous_budget = step, budget
+        step = start_step >> level
+        budget = max(1, iterations >> (levels - level))
+        with Instrumentation.phase(phases, "compute"):
+            if level > 0 and budget > previous_budget:
+                # continue the unresolved pixels outwards in from the escaped
+                # ones until a ring of them stays unresolved
+                lattice = counts[::previous_step, ::previous_step]
+                pending = lattice >= previous_budget
+                continued = np.zeros_like(pending)
+                while True:
+                    escaped = lattice < np.where(continued, budget,
+                                                 previous_budget)
+                    near = pending & _lattice_neighbours(escaped)
+                    if not near.any():
+                        break
+                    rows, columns = np.nonzero(near)
+                    advance(rows * previous_step, columns * previous_step,
+                            budget)
+                    continued |= near
+                    pending &= ~near
+                if level < levels:
+                    lattice[pending] = budget
+                else:
+                    # the final pass assumes nothing about the interior
+                    rows, columns = np.nonzero(pending)
+                    advance(rows * previous_step, columns * previous_step,
+                            budget)
+
+            rows, columns = np.nonzero(counts[::step, ::step] < 0)
+            rows, columns = rows * step, columns * step
+            if level > 0:
+                # corners of the enclosing cell of the previous pass. The
+                # partial cells on the right and bottom edges have no far
+                # corners and are always iterated
+                w0 = rows - rows % previous_step
+                h0 = columns - columns % previous_step
+                whole = (w0 + previous_step < width) & \
+                    (h0 + previous_step < height)
+                w1 = np.minimum(w0 + previous_step, width - 1)
+                h1 = np.minimum(h0 + previous_step, height - 1)
+                corner = counts[w0, h0]
+                agree = whole & (counts[w0, h1] == corner) & \
+                    (counts[w1, h0] == corner) & (counts[w1, h1] == corner)
+                if level == levels:
+                    # only escaped counts of polynomial maps are filled in
+                    # the final pass, and not along the image edges, where
+                    # details can cut across a cell without reaching its
+                    # corners
+                    agree &= polynomial & (corner < budget) & (rows > 0) & \
+                        (rows < width - 1) & (columns > 0) & \
+                        (columns < height - 1)
+                counts[rows[agree], columns[agree]] = corner[agree]
+                rows, columns = rows[~agree], columns[~agree]
+            advance(rows, columns, budget)
 
-        points.update(newPoints)
-    run_time = timer() - start
-    Utilities.draw_image(points, width, height, output_file)
-    return run_time, len(points)
+            if step == 1:
+                # iterate filled and assumed interior pixels that border a
+                # different count, until none is left next to an edge
+                while True:
+                    exact = (reached >= 0) & ((counts < reached) |
+                                              (reached == budget))
+                    rows, columns = np.nonzero(
+                        ~exact & _differs_from_neighbours(counts))
+                    if rows.size == 0:
+                        break
+                    advance(rows, columns, budget)
+
+        if callback is not None and callback(counts[::step, ::step], step,
+                                             budget):
+            if step > 1:
+                coarse = counts[::step, ::step]
+                counts = np.repeat(np.repeat(coarse, step, axis=0), step,
+                                   axis=1)[:width, :height]
+            break
+    return counts
+
+
+def _reference_orbit(c, iterations, divergence_value, reference, precision):
+    """
+    Iterate 'z = z^2 + c' from a reference point in Decimal arithmetic.
+    :param reference: (re, im) pair of Decimals
+    :return: complex128 array of the orbit, starting with the reference
+        point and ending after iterations steps or at the first point past
+        the divergence value
+    """
+    with localcontext() as context:
+        context.prec = precision
+        c_re = Decimal(float(c.real))
+        c_im = Decimal(float(c.imag))
+        limit = Decimal(divergence_value) ** 2
+        z_re, z_im = reference
+        orbit = [complex(float(z_re), float(z_im))]
+        for _ in range(iterations):
+            z_re, z_im = z_re * z_re - z_im * z_im + c_re, \
+                2 * z_re * z_im + c_im
+            orbit.append(complex(float(z_re), float(z_im)))
+            if z_re * z_re + z_im * z_im > limit:
+                break
+    return np.array(orbit)
+
+
+def _perturbed_escape_counts(orbit, delta, iterations, divergence_value,
+                             counts, glitch_tolerance):
+    """
+    Iterate pixels as float64 offsets 'delta' from a reference orbit Z using
+    delta' = 2 Z delta + delta^2, so z = Z + delta never has to be held at
+    full precision. Pixels whose orbit comes much closer to zero than the
+    reference (Pauldelbrot's criterion), or that outlive an escaping
+    reference, have lost precision and are returned as glitched.
+    :param counts: flat float32 array the counts are written into
+    :return: indices of the glitched pixels
+    """
+    active = np.arange(delta.size)
+    glitched = []
+    for i in range(iterations):
+        if i + 1 >= orbit.size:
+            glitched.append(active)
+            break
+        delta = (2 * orbit[i] + delta) * delta
+        magnitude = np.abs(orbit[i + 1] + delta)
+        escaped = magnitude > divergence_value
+        lost = magnitude < glitch_tolerance * abs(orbit[i + 1])
+        done = escaped | lost
+        if done.any():
+            counts[active[escaped]] = i
+            glitched.append(active[lost & ~escaped])
+            remaining = ~done
+            delta = delta[remaining]
+            active = active[remaining]
+            if active.size == 0:
+                break
+    if not glitched:
+        return active[:0]
+    return np.concatenate(glitched)
+
+
+def cpuDeepZoomIterations(c=constants.julia_fractals["set1"],
+                          iterations=200,
+                          divergence_value=10,
+                          viewport=None,
+                          max_references=32,
+                          glitch_tolerance=1e-3):
+    """
+    Perturbation escape-time engine for zooms past float64 precision. One
+    reference orbit is iterated in Decimal arithmetic at the precision the
+    zoom needs, and every other pixel is iterated as a float64 offset from
+    it. Glitched pixels are re-rendered against a new reference picked from
+    among them.
+    :param c: Complex value representation
+    :param iterations: total number of iterations
+    :param divergence_value: divergence value for algorithm
+    :param viewport: Viewport.Viewport to render, usually with a Decimal
+        centre and a large scale
+    :param max_references: Maximum number of reference orbits. Pixels still
+        glitched after that are iterated directly in float64
+    :param glitch_tolerance: Pixels whose orbit comes closer to zero than
+        this fraction of the reference orbit are treated as glitched
+    :return: (width, height) array of iteration counts
+    """
+    if viewport is None:
+        viewport = Viewport()
+    divergence_value = float(divergence_value)
+    precision = viewport.precision()
+    rows, columns = np.mgrid[0:viewport.width, 0:viewport.height]
+    offsets = viewport.offsets(rows.ravel(), columns.ravel())
+    counts = np.full(offsets.size, iterations, dtype=np.float32)
+
+    pending = np.arange(offsets.size)
+    reference_offset = 0j
+    for _ in range(max_references):
+        orbit = _reference_orbit(c, iterations, divergence_value,
+                                 viewport.reference(reference_offset,
+                                                    precision),
+                                 precision)
+        pending_counts = counts[pending]
+        glitched = _perturbed_escape_counts(
+            orbit, offsets[pending] - reference_offset, iterations,
+            divergence_value, pending_counts, glitch_tolerance)
+        counts[pending] = pending_counts
+        pending = pending[glitched]
+        if pending.size == 0:
+            break
+        reference_offset = offsets[pending[pending.size // 2]]
+    else:
+        rows, columns = np.divmod(pending, viewport.height)
+        counts[pending] = _escape_counts(viewport.points(rows, columns), c,
+                                         iterations, divergence_value)
+
+    return counts.reshape(viewport.width, viewport.height)
+
+
+def _report_pass(counts, step, budget):
+    print("Progressive pass at 1/{} resolution, {} iterations".format(
+        step, budget))
+
+
+def _julia_points(c, iterations, divergence_value, viewport, workers, mode,
+                  phases, formula=None):
+    """
+    Run the in-memory Julia engine selected by mode and workers.
+    """
+    with phases.phase("compute"):
+        if mode == "deep":
+            if formula is not None:
+                raise ValueError("Deep zoom mode only supports the quadratic "
+                                 "map")
+            return cpuDeepZoomIterations(c=c,
+                                         iterations=iterations,
+                                         divergence_value=divergence_value,
+                                         viewport=viewport)
+        if mode == "progressive":
+            return cpuProgressiveJuliaIterations(
+                c=c,
+                iterations=iterations,
+                divergence_value=divergence_value,
+                viewport=viewport,
+                formula=formula,
+                callback=_report_pass)
+        if mode == "accelerated":
+            return cpuAcceleratedJuliaIterations(
+                c=c,
+                iterations=iterations,
+                divergence_value=divergence_value,
+                viewport=viewport,
+                formula=formula)
+        if workers > 1:
+            return cpuTiledJuliaIterations(c=c,
+                                           iterations=iterations,
+                                           divergence_value=divergence_value,
+                                           workers=workers,
+                                           viewport=viewport,
+                                           formula=formula)
+        return cpuJuliaIterations(c=c,
+                                  iterations=iterations,
+                                  divergence_value=divergence_value,
+                                  viewport=viewport,
+                                  formula=formula)
 
 
 def cpuDivergentFractal(c=constants.julia_fractals["set1"],
                         iterations=200,
                         divergence_value=10,
                         width=300,
-                        output_file="cpuOut.png"):
+                        output_file="cpuOut.png",
+                        workers=1,
+                        mode="standard",
+                        viewport=None,
+                        buffer_file="",
+                        cache=None,
+                        pipeline=None,
+                        phases=None,
+                        formula=None):
     """
     CPU implementation of divergent quadratic map 'z = z^2 + c' for nIterations
     :param c: Complex value representation
@@ -65,25 +1279,57 @@ def cpuDivergentFractal(c=constants.julia_fractals["set1"],
     :param width: Width of the image in pixels. The same value will be used for
         the image height
     :param output_file: Filename to save image as
+    :param workers: Number of worker processes. More than one renders the
+        image as tiles across a process pool
+    :param mode: 'standard' iterates every pixel, 'accelerated' uses
+        cpuAcceleratedJuliaIterations, which pays off at high iteration
+        counts on sets with large interiors, 'progressive' uses the
+        coarse-to-fine cpuProgressiveJuliaIterations, and 'deep' uses the
+        perturbation engine cpuDeepZoomIterations for zooms past float64
+        precision
+    :param viewport: Optional Viewport.Viewport to render, for zooming,
+        panning, rotating or non-square images. Its size takes the place of
+        width
+    :param buffer_file: If given, render out of core into a memory-mapped
+        iteration buffer in this file and stream the image to disk in
+        strips, for images too large for memory. An interrupted render is
+        resumed when run again with the same parameters
+    :param cache: Optional FractalCache.FractalCache. The iteration counts
+        are reused from it when cached and stored in it when not
+    :param pipeline: Optional OutputPipeline.OutputPipeline that writes
+        the image in the background while the caller carries on
+    :param phases: Optional Instrumentation.PhaseTimer to record per-phase
+        timings in
+    :param formula: Optional Formulas.Formula to iterate instead of the
+        quadratic map, e.g. a higher power or a Mandelbrot-type formula
     :return: algorithm runtime in seconds
     """
-    start = timer()
-    height = width
-    points = np.zeros((width, height), dtype=np.float32)
-
-    for w in range(width):
-        for h in range(height):
-            cX = 1.5 * (w - width / 2) / (0.5 * width)
-            cY = (h - height / 2) / (0.5 * height)
-            z = complex(cX, cY)
-            count = 0
-            for i in range(iterations):
-                z = (z * z) + c
-                count += 1
-                if abs(z) > divergence_value:
-                    break
-                points[w, h] = count
-
-    run_time = timer() - start
-    Utilities.plot_fractal(points, output_file=output_file)
-    return run_time
+    if phases is None:
+        phases = Instrumentation.PhaseTimer()
+    if viewport is None:
+        viewport = Viewport(width)
+    if len(buffer_file) > 0:
+        with phases.phase("compute"):
+            points = cpuOutOfCoreJuliaIterations(
+                c=c,
+                iterations=iterations,
+                divergence_value=divergence_value,
+                buffer_file=buffer_file,
+                viewport=viewport,
+                workers=workers,
+                formula=formula)
+    else:
+        points = FractalCache.cached(
+            cache,
+            lambda: _julia_points(c, iterations, divergence_value, viewport,
+                                  workers, mode, phases, formula),
+            phases, kind="julia", backend="cpu", c=c, iterations=iterations,
+            divergence_value=float(divergence_value), viewport=repr(viewport),
+            mode=mode, formula=repr(formula))
+    if len(buffer_file) > 0:
+        Utilities.write_fractal_image_striped(points, output_file=output_file,
+                                              phases=phases)
+    else:
+        Utilities.write_fractal_image(points, output_file=output_file,
+                                      phases=phases, pipeline=pipeline)
+    return phases.total()
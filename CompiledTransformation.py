@@ -0,0 +1,168 @@
+"""
+IFS transformation tables compiled once for the samplers and rasterizers.
+Compiling validates and normalizes the probability column, builds a Walker
+alias table so a transformation is picked in O(1) instead of by scanning
+the cumulative probabilities, and computes each map's contraction factor
+and a bounding box guaranteed to contain the attractor, so points can be
+binned into pixels without first scanning them for their extent.
+"""
+import numpy as np
+
+# Compiled tables memoized by the contents of the table
+_compiled = {}
+
+
+def _alias_table(probabilities):
+    """
+    Build Walker's alias table with Vose's method.
+    :return: acceptance probability and alias index for each column
+    """
+    n = probabilities.size
+    scaled = probabilities * n
+    accept = np.ones(n)
+    alias = np.arange(n)
+    small = [i for i in range(n) if scaled[i] < 1.0]
+    large = [i for i in range(n) if scaled[i] >= 1.0]
+    while small and large:
+        low = small.pop()
+        high = large.pop()
+        accept[low] = scaled[low]
+        alias[low] = high
+        scaled[high] -= 1.0 - scaled[low]
+        if scaled[high] < 1.0:
+            small.append(high)
+        else:
+            large.append(high)
+    # whatever is left over is 1 up to rounding
+    return accept, alias
+
+
+def _convex_hull(points):
+    """
+    Andrew's monotone chain convex hull.
+    :param points: (n, 2) array
+    :return: (m, 2) array of the hull vertices in counter-clockwise order
+    """
+    points = np.unique(points, axis=0)
+    if len(points) < 3:
+        return points
+
+    def half_hull(ordered):
+        hull = []
+        for point in ordered:
+            while len(hull) >= 2:
+                (x1, y1), (x2, y2) = hull[-2], hull[-1]
+                if (x2 - x1) * (point[1] - y1) - \
+                        (y2 - y1) * (point[0] - x1) > 0:
+                    break
+                hull.pop()
+            hull.append(point)
+        return hull[:-1]
+
+    listed = points.tolist()
+    return np.array(half_hull(listed) + half_hull(listed[::-1]))
+
+
+def _attractor_bounds(matrix, contraction, max_steps=5000, tolerance=1e-9):
+    """
+    Bounding box guaranteed to contain the attractor A. A lies in a ball
+    around any point p of radius max_i |f_i(p) - p| / (1 - s), s being the
+    largest contraction factor. Since A is the union of the f_i(A), the
+    convex hull of the f_i(P) contains A for any convex polygon P that
+    does, so starting from the ball's square that step is repeated; it
+    converges on the convex hull of A from outside.
+    :return: (min_x, max_x, min_y, max_y), or None if a map does not
+        contract in the Euclidean norm
+    """
+    largest = contraction.max()
+    if largest >= 1.0:
+        return None
+    linear = matrix[:, :4].reshape(-1, 2, 2)
+    offset = matrix[:, 4:6]
+    # centre the ball on the fixed point of the first map
+    point = np.linalg.solve(np.eye(2) - linear[0], offset[0])
+    images = np.einsum("nij,j->ni", linear, point) + offset
+    radius = np.linalg.norm(images - point, axis=1).max() / (1.0 - largest)
+
+    polygon = point + radius * np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]])
+    bounds = np.concatenate([polygon.min(axis=0), polygon.max(axis=0)])
+    for _ in range(max_steps):
+        images = np.einsum("nij,vj->nvi", linear, polygon) + \
+            offset[:, np.newaxis, :]
+        polygon = _convex_hull(images.reshape(-1, 2))
+        new_bounds = np.concatenate([polygon.min(axis=0),
+                                     polygon.max(axis=0)])
+        change = np.abs(new_bounds - bounds).max()
+        bounds = new_bounds
+        if change <= tolerance * radius:
+            break
+    return bounds[0], bounds[2], bounds[1], bounds[3]
+
+
+class CompiledTransformation:
+    """
+    Validated IFS table with precomputed sampling and bounds data. Build it
+    with compile_transformation, which memoizes one per table.
+    :param transformation: A transformation matrix with 7 columns
+        representing [a, b, c, d, e, f, prob] for the IFS function
+        x_(n+1) = ax_n + by_n + e and y_(n+1) = cx_n + dy_n + f
+    """
+
+    def __init__(self, transformation):
+        table = np.array(transformation, dtype=np.float64)
+        if table.ndim != 2 or table.shape[1] != 7 or table.shape[0] == 0:
+            raise ValueError("A transformation must have rows of 7 columns "
+                             "[a, b, c, d, e, f, prob]")
+        if not np.isfinite(table).all():
+            raise ValueError("Transformation contains non-finite values")
+        probabilities = table[:, 6]
+        if (probabilities < 0).any() or probabilities.sum() <= 0:
+            raise ValueError("Transformation probabilities must be "
+                             "non-negative and not all zero")
+        table[:, 6] = probabilities / probabilities.sum()
+
+        # table with normalized probabilities, as the CUDA kernel expects
+        self.table = table
+        self.matrix = table[:, :6]
+        self.probabilities = table[:, 6]
+        self.accept, self.alias = _alias_table(self.probabilities)
+        # largest singular value of each map's linear part
+        self.contraction = np.linalg.norm(table[:, :4].reshape(-1, 2, 2),
+                                          ord=2, axis=(1, 2))
+        # maps that are never picked do not shape the attractor
+        used = self.probabilities > 0
+        self.bounds = _attractor_bounds(self.matrix[used],
+                                        self.contraction[used])
+
+    def __len__(self):
+        return self.table.shape[0]
+
+    def choose(self, rng, size):
+        """
+        Draw transformation indices by the alias method.
+        :param rng: numpy random Generator
+        :param size: Number of indices to draw
+        """
+        # the integer part of one uniform draw picks the column and the
+        # fractional part decides between it and its alias
+        draw = rng.random(size) * len(self)
+        column = draw.astype(np.intp)
+        draw -= column
+        return np.where(draw < self.accept[column], column,
+                        self.alias[column])
+
+
+def compile_transformation(transformation):
+    """
+    :return: the memoized CompiledTransformation of a table. A compiled
+        table is returned as it is
+    """
+    if isinstance(transformation, CompiledTransformation):
+        return transformation
+    table = np.asarray(transformation, dtype=np.float64)
+    key = (table.shape, table.tobytes())
+    compiled = _compiled.get(key)
+    if compiled is None:
+        compiled = CompiledTransformation(transformation)
+        _compiled[key] = compiled
+    return compiled
@@ -0,0 +1,332 @@
+"""
+User-defined escape-time formulas. An expression in z and c, such as
+'z**3 + c' or 'fold(z)**2 + c', is parsed against a whitelist of operators
+and functions and compiled once into a vectorized NumPy step for the CPU
+engines and, on first use, into a Numba kernel. Compiled formulas are
+memoized by a hash of the parsed expression, so a sweep over many sets
+compiles each formula only once per process.
+
+A formula iterates over the Julia plane, where each pixel is the starting
+z and c is fixed, or over the parameter plane, where each pixel is c and z
+starts at 0 as for the Mandelbrot set.
+"""
+import ast
+import cmath
+import hashlib
+
+import numpy as np
+
+# Functions allowed in expressions, with their NumPy and scalar Numba forms
+FUNCTIONS = {
+    "abs": ("np.abs", "abs"),
+    "conj": ("np.conj", "_conj"),
+    "real": ("np.real", "_real"),
+    "imag": ("np.imag", "_imag"),
+    "fold": ("_fold", "_fold"),
+    "exp": ("np.exp", "cmath.exp"),
+    "log": ("np.log", "cmath.log"),
+    "sqrt": ("np.sqrt", "cmath.sqrt"),
+    "sin": ("np.sin", "cmath.sin"),
+    "cos": ("np.cos", "cmath.cos"),
+    "tan": ("np.tan", "cmath.tan"),
+    "sinh": ("np.sinh", "cmath.sinh"),
+    "cosh": ("np.cosh", "cmath.cosh"),
+    "tanh": ("np.tanh", "cmath.tanh"),
+}
+
+OPERATORS = {ast.Add: "+", ast.Sub: "-", ast.Mult: "*", ast.Div: "/"}
+UNARY_OPERATORS = {ast.USub: "-", ast.UAdd: "+"}
+
+# Named formulas, as (expression, plane)
+FORMULAS = {
+    "quadratic": ("z**2 + c", "z"),
+    "cubic": ("z**3 + c", "z"),
+    "quartic": ("z**4 + c", "z"),
+    "quintic": ("z**5 + c", "z"),
+    "burning_ship_julia": ("fold(z)**2 + c", "z"),
+    "mandelbrot": ("z**2 + c", "c"),
+    "multibrot3": ("z**3 + c", "c"),
+    "burning_ship": ("fold(z)**2 + c", "c"),
+    "tricorn": ("conj(z)**2 + c", "c"),
+}
+
+PLANES = ("z", "c")
+
+# Integer powers up to this are expanded into multiplications
+MAX_EXPANDED_POWER = 16
+
+# Compiled formulas memoized by Formula.key
+_compiled = {}
+
+
+def _fold(z):
+    # |Re z| + i |Im z|, the fold of the burning ship
+    return np.abs(z.real) + 1j * np.abs(z.imag)
+
+
+def _ipow(z, n):
+    # z ** n by repeated squaring, much faster than np.power for complex z
+    result = None
+    while n:
+        if n & 1:
+            result = z if result is None else result * z
+        n >>= 1
+        if n:
+            z = z * z
+    return result
+
+
+def _scalar_helpers():
+    from numba import njit
+
+    @njit
+    def _scalar_fold(z):
+        return complex(abs(z.real), abs(z.imag))
+
+    @njit
+    def _scalar_ipow(z, n):
+        result = complex(1.0, 0.0)
+        while n:
+            if n & 1:
+                result = result * z
+            n >>= 1
+            if n:
+                z = z * z
+        return result
+
+    @njit
+    def _conj(z):
+        return z.conjugate()
+
+    @njit
+    def _real(z):
+        return complex(z.real, 0.0)
+
+    @njit
+    def _imag(z):
+        return complex(z.imag, 0.0)
+
+    return {"_fold": _scalar_fold, "_ipow": _scalar_ipow, "_conj": _conj,
+            "_real": _real, "_imag": _imag}
+
+
+class _Emitter:
+    """
+    Translate a whitelisted expression tree into Python source.
+    :param scalar: emit scalar code for Numba instead of NumPy code
+    :param names: source name to emit for z and for c
+    """
+
+    def __init__(self, scalar=False, names=None):
+        self.scalar = scalar
+        self.names = names or {"z": "z", "c": "c"}
+
+    def emit(self, node):
+        if isinstance(node, ast.Expression):
+            return self.emit(node.body)
+        if isinstance(node, ast.Name):
+            if node.id not in self.names:
+                raise ValueError("Unknown name '" + node.id + "' in formula, "
+                                 "only z and c are defined")
+            return self.names[node.id]
+        if isinstance(node, ast.Constant):
+            if isinstance(node.value, bool) or \
+                    not isinstance(node.value, (int, float, complex)):
+                raise ValueError("Unsupported constant " + repr(node.value) +
+                                 " in formula")
+            return repr(complex(node.value) if self.scalar else node.value)
+        if isinstance(node, ast.UnaryOp) and \
+                type(node.op) in UNARY_OPERATORS:
+            return "({}{})".format(UNARY_OPERATORS[type(node.op)],
+                                   self.emit(node.operand))
+        if isinstance(node, ast.BinOp) and type(node.op) in OPERATORS:
+            return "({} {} {})".format(self.emit(node.left),
+                                       OPERATORS[type(node.op)],
+                                       self.emit(node.right))
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow):
+            exponent = node.right
+            if isinstance(exponent, ast.Constant) and \
+                    type(exponent.value) is int and \
+                    0 < exponent.value <= MAX_EXPANDED_POWER:
+                return "_ipow({}, {})".format(self.emit(node.left),
+                                              exponent.value)
+            return "({} ** {})".format(self.emit(node.left),
+                                       self.emit(exponent))
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or \
+                    node.func.id not in FUNCTIONS:
+                raise ValueError("Unsupported function in formula, the "
+                                 "available functions are " +
+                                 ", ".join(FUNCTIONS))
+            if node.keywords or len(node.args) != 1:
+                raise ValueError("Formula function " + node.func.id +
+                                 " takes exactly one argument")
+            function = FUNCTIONS[node.func.id][1 if self.scalar else 0]
+            if self.scalar and node.func.id == "abs":
+                return "complex(abs({}), 0.0)".format(self.emit(node.args[0]))
+            return "{}({})".format(function, self.emit(node.args[0]))
+        raise ValueError("Unsupported syntax in formula: " +
+                         type(node).__name__)
+
+
+class Formula:
+    """
+    Escape-time map z -> f(z, c) compiled from an expression. Build it with
+    compile_formula, which memoizes one per expression and plane.
+    :param expression: Expression in z and c, e.g. 'z**3 + c'
+    :param plane: 'z' to iterate the Julia plane, where each pixel is the
+        starting z, or 'c' to iterate the parameter plane, where each pixel
+        is c and z starts at 0
+    """
+
+    def __init__(self, expression, plane="z"):
+        tree, self.key = _parse(expression, plane)
+        self.expression = expression
+        self.plane = plane
+        self.source = _Emitter().emit(tree)
+        self._tree = tree
+        self._kernel = None
+
+        namespace = {"np": np, "_fold": _fold, "_ipow": _ipow}
+        exec("def step(z, c):\n    return " + self.source, namespace)
+        self.step = namespace["step"]
+        self.even = self._is_even()
+        self.polynomial = _is_polynomial(tree)
+
+    def __repr__(self):
+        return "Formula({!r}, plane={!r})".format(self.expression, self.plane)
+
+    def __reduce__(self):
+        # workers recompile from the expression rather than unpickling code
+        return compile_formula, (self.expression, self.plane)
+
+    def _is_even(self, samples=64):
+        """
+        :return: whether f(-z, c) = f(z, c), checked on random points. Only
+            then is a Julia set symmetric under z -> -z
+        """
+        rng = np.random.default_rng(0)
+        z = rng.uniform(-1, 1, samples) + 1j * rng.uniform(-1, 1, samples)
+        c = rng.uniform(-1, 1, samples) + 1j * rng.uniform(-1, 1, samples)
+        with np.errstate(all="ignore"):
+            return bool(np.allclose(self.step(z, c), self.step(-z, c),
+                                    rtol=1e-12, atol=1e-12))
+
+    def start(self, points, c):
+        """
+        :param points: flat complex array of the pixels
+        :return: starting z and the constant c for the pixels
+        """
+        if self.plane == "c":
+            return np.zeros_like(points), points.copy()
+        return points, c
+
+    def symmetric(self, viewport):
+        """
+        :return: whether pixel (w, h) maps to minus pixel
+            (width - w, height - h) in the image of the viewport
+        """
+        return self.plane == "z" and self.even and viewport.is_centred()
+
+    def numba_kernel(self):
+        """
+        Numba kernel with the arguments of NumbaTransformation's
+        _compute_fractal, compiled on first use.
+        """
+        if self._kernel is None:
+            from numba import njit, prange
+            names = {"z": "z", "c": "k"}
+            start = "complex(0.0, 0.0)" if self.plane == "c" else "p"
+            constant = "p" if self.plane == "c" else "c"
+            source = _KERNEL_SOURCE.format(
+                start=start, constant=constant,
+                step=_Emitter(scalar=True, names=names).emit(self._tree))
+            namespace = dict(_scalar_helpers(), prange=prange, cmath=cmath)
+            exec(source, namespace)
+            self._kernel = njit(parallel=True)(namespace["kernel"])
+        return self._kernel
+
+
+_KERNEL_SOURCE = """
+def kernel(points, c, width, height, max_iterations, divergence_value,
+           center_x, center_y, half_x, half_y, cos_r, sin_r):
+    for w in prange(width):
+        u = half_x * (w - width / 2) / (0.5 * width)
+        for h in range(height):
+            v = half_y * (h - height / 2) / (0.5 * height)
+            p = complex(center_x + (u * cos_r - v * sin_r),
+                        center_y + (u * sin_r + v * cos_r))
+            z = {start}
+            k = {constant}
+            count = 0
+            for i in range(max_iterations):
+                z = {step}
+                if not abs(z) <= divergence_value:
+                    break
+                count += 1
+            points[w, h] = count
+"""
+
+
+def _is_polynomial(node):
+    """
+    :return: whether an expression tree is a polynomial in z and c: sums,
+        differences and products of z, c and constants, raised to positive
+        integer powers. Only the sets of polynomial maps have no holes,
+        which filling a region from its boundary relies on
+    """
+    if isinstance(node, ast.Expression):
+        return _is_polynomial(node.body)
+    if isinstance(node, (ast.Name, ast.Constant)):
+        return True
+    if isinstance(node, ast.UnaryOp):
+        return _is_polynomial(node.operand)
+    if isinstance(node, ast.BinOp) and \
+            isinstance(node.op, (ast.Add, ast.Sub, ast.Mult)):
+        return _is_polynomial(node.left) and _is_polynomial(node.right)
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow):
+        exponent = node.right
+        return isinstance(exponent, ast.Constant) and \
+            type(exponent.value) is int and exponent.value > 0 and \
+            _is_polynomial(node.left)
+    return False
+
+
+def _parse(expression, plane):
+    """
+    :return: expression tree and the hash identifying the formula
+    """
+    if plane not in PLANES:
+        raise ValueError("Formula plane must be z or c")
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except SyntaxError as error:
+        raise ValueError("Cannot parse formula '" + expression + "': " +
+                         str(error))
+    # the dump ignores spacing, so 'z**3+c' and 'z ** 3 + c' share a key
+    key = hashlib.sha256((ast.dump(tree) + plane).encode()).hexdigest()
+    return tree, key
+
+
+def compile_formula(expression, plane="z"):
+    """
+    :return: the memoized Formula for an expression and plane
+    """
+    _, key = _parse(expression, plane)
+    formula = _compiled.get(key)
+    if formula is None:
+        formula = Formula(expression, plane)
+        _compiled[key] = formula
+    return formula
+
+
+def parse_formula(text, plane=None):
+    """
+    Parse a formula name from FORMULAS or an expression in z and c.
+    :param plane: Plane of the formula, defaults to the named formula's
+        plane or z
+    """
+    if text in FORMULAS:
+        expression, named_plane = FORMULAS[text]
+        return compile_formula(expression, plane or named_plane)
+    return compile_formula(text, plane or "z")
@@ -0,0 +1,128 @@
+"""
+Content-addressed on-disk cache of raw fractal data: Julia iteration counts
+and IFS density histograms. Entries are compressed .npz files named by a
+hash of every parameter that determines the data, so changing only how the
+data is colored or tone mapped reuses the cached array instead of
+recomputing it. The least recently used entries are evicted once the cache
+grows past its disk budget.
+"""
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+import Instrumentation
+
+
+def _normalize(value):
+    """
+    Convert numpy values and sequences to plain Python values with a stable
+    repr, so equal parameters always hash the same.
+    """
+    if isinstance(value, np.ndarray):
+        return _normalize(value.tolist())
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    if isinstance(value, np.generic):
+        return _normalize(value.item())
+    if isinstance(value, complex):
+        return [value.real, value.imag]
+    return value
+
+
+class FractalCache:
+    """
+    :param directory: Directory holding the cache entries
+    :param max_bytes: Total size the entries may take up
+    """
+
+    def __init__(self, directory, max_bytes=2 ** 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, **parameters):
+        """
+        :return: hex digest of the parameters
+        """
+        normalized = sorted((name, _normalize(value))
+                            for name, value in parameters.items())
+        return hashlib.sha256(repr(normalized).encode()).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def get(self, key):
+        """
+        :return: the cached array, or None on a miss
+        """
+        file_name = self._file(key)
+        try:
+            with np.load(file_name) as entry:
+                data = entry["data"]
+            # the modification time orders entries for eviction
+            os.utime(file_name)
+        except (OSError, KeyError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        # write to a temporary file first so readers never see half an entry
+        temporary = self._file(key) + "." + str(os.getpid()) + "." + \
+            str(threading.get_ident()) + ".tmp"
+        with open(temporary, "wb") as entry:
+            np.savez_compressed(entry, data=np.asarray(data))
+        os.replace(temporary, self._file(key))
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits its
+        budget. The newest entry is always kept.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".npz"):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, name, stat.st_size))
+        entries.sort()
+        size = sum(entry[2] for entry in entries)
+        for _, name, entry_size in entries[:-1]:
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            size -= entry_size
+
+
+def cached(cache, compute, phases=None, **parameters):
+    """
+    Return the array cached for the parameters, or compute and cache it.
+    :param cache: FractalCache, or None to always compute
+    :param compute: Function computing the array
+    :param phases: Optional Instrumentation.PhaseTimer. Cache reads and
+        writes are recorded as setup
+    :param parameters: Everything that determines the array
+    """
+    if cache is None:
+        return compute()
+    key = cache.key(**parameters)
+    with Instrumentation.phase(phases, "setup"):
+        data = cache.get(key)
+    if data is not None:
+        print("Cache hit, skipping computation")
+        return data
+    data = compute()
+    with Instrumentation.phase(phases, "setup"):
+        cache.put(key, data)
+    return data
@@ -1,18 +1,104 @@
-import sys
 import numpy as np
 import pycuda.autoinit  # noqa
+import pycuda.driver as cuda
 import pycuda.gpuarray as gpuarray
-from timeit import default_timer as timer
 from pycuda.compiler import SourceModule
 
+import CompiledTransformation
+import FractalCache
+import Instrumentation
 import KernelCode
 import Utilities
 import constants
+from Viewport import Viewport
+
+
+# SourceModules compiled so far, keyed by kernel source
+_compiled_modules = {}
+
+
+def get_kernel(source, name, no_extern_c=False):
+    """
+    Compile a kernel source once per process and return one of its
+    functions, so repeated runs don't pay the nvcc compile again.
+    :param source: CUDA source code from KernelCode
+    :param name: Name of the kernel function
+    """
+    key = (source, no_extern_c)
+    if key not in _compiled_modules:
+        _compiled_modules[key] = SourceModule(source, no_extern_c=no_extern_c)
+    return _compiled_modules[key].get_function(name)
+
+
+def _kernel_seed(seed):
+    """
+    :return: 64 bit curand seed derived from a SeedSequence seed, fresh
+        entropy if seed is None
+    """
+    return np.uint64(np.random.SeedSequence(seed).generate_state(
+        1, np.uint64)[0])
+
+
+def gpu_ifs_points(transformation=constants.ifs_fractals["fern"],
+                   num_points=100000, block_size=64, seed=None, phases=None):
+    """
+    Run the IFS chaos game on the GPU and copy the points back to the host.
+    :param transformation: A transformation matrix with 7 columns representing
+        [a, b, c, d, e, f, prob] for the IFS function x_(n+1) = ax_n + by_n + e
+        and y_(n+1) = cx_n + dy_n + f
+    :param num_points: Number of points in fractal
+    :param block_size: GPU Block Size
+    :param seed: Seed of the kernel's random streams, None for fresh entropy
+    :param phases: Optional Instrumentation.PhaseTimer to record per-phase
+        timings in
+    :return: x and y arrays of length num_points
+    """
+    block = (block_size, 1, 1)
+    grid = (num_points, 1, 1)
+
+    with Instrumentation.phase(phases, "compile"):
+        hammersley_func = get_kernel(KernelCode.gpu_hammersley_kernel_code,
+                                     "hammersley")
+        ifs_func = get_kernel(KernelCode.ifs_transform_kernel_code,
+                              "phase1Transform", no_extern_c=True)
+
+    with Instrumentation.phase(phases, "setup"):
+        gpu_x = gpuarray.to_gpu(np.zeros(num_points, np.float32))
+        gpu_y = gpuarray.to_gpu(np.zeros(num_points, np.float32))
+        compiled = CompiledTransformation.compile_transformation(
+            transformation)
+        transformation = compiled.table.astype(np.float32)
+        gpu_transform = gpuarray.to_gpu(transformation)
+        gpu_accept = gpuarray.to_gpu(compiled.accept.astype(np.float32))
+        gpu_alias = gpuarray.to_gpu(compiled.alias.astype(np.int32))
+        rows, cols = transformation.shape
+        kernel_seed = _kernel_seed(seed)
+
+    with Instrumentation.phase(phases, "compute"):
+        # Generate Hammersley sequence
+        hammersley_func(np.int32(num_points), gpu_x, gpu_y, block=block)
+        ifs_func(gpu_x, gpu_y, gpu_transform, gpu_accept, gpu_alias,
+                 np.int32(num_points), np.int32(rows), kernel_seed,
+                 np.int32(0), block=block, grid=grid,
+                 shared=transformation.nbytes)
+
+        curr_iter = 0
+        while curr_iter < 15:
+            ifs_func(gpu_x, gpu_y, gpu_transform, gpu_accept, gpu_alias,
+                     np.int32(num_points), np.int32(rows), kernel_seed,
+                     np.int32(curr_iter + 1), block=block, grid=grid,
+                     shared=transformation.nbytes)
+            curr_iter += 1
+        cuda.Context.synchronize()
+
+    with Instrumentation.phase(phases, "transfer"):
+        return gpu_x.get(), gpu_y.get()
 
 
 def gpu_ifs_transform(transformation=constants.ifs_fractals["fern"],
                       width=600, height=600, num_points=100000,
-                      block_size=64, output_file="gpuOut.png"):
+                      block_size=64, output_file="gpuOut.png", seed=None,
+                      cache=None, pipeline=None, phases=None):
     """
     This function will perform the Iterated Function System (IFS) fractal
     algorithm via CUDA.
@@ -24,42 +110,213 @@ def gpu_ifs_transform(transformation=constants.ifs_fractals["fern"],
     :param height: Height of the image in pixels
     :param num_points: Number of points in fractal
     :param output_file: File to save the image to
+    :param seed: Seed of the kernel's random streams, None for fresh entropy
+    :param cache: Optional FractalCache.FractalCache. The density histogram
+        is reused from it when cached and stored in it when not
+    :param pipeline: Optional OutputPipeline.OutputPipeline that writes
+        the image in the background while the caller carries on
+    :param phases: Optional Instrumentation.PhaseTimer to record per-phase
+        timings in
     :return: algorithm runtime in seconds, number of points
     """
-    start = timer()
-    # Generate Hammersley sequence
+    if phases is None:
+        phases = Instrumentation.PhaseTimer()
+
+    def compute():
+        x, y = gpu_ifs_points(transformation=transformation,
+                              num_points=num_points,
+                              block_size=block_size,
+                              seed=seed,
+                              phases=phases)
+        with phases.phase("rasterize"):
+            return Utilities.bin_points(
+                x, y, width, height,
+                CompiledTransformation.compile_transformation(
+                    transformation).bounds)
+
+    counts = FractalCache.cached(cache, compute, phases, kind="ifs",
+                                 backend="gpu", transformation=transformation,
+                                 num_points=num_points, width=width,
+                                 height=height, seed=seed)
+    Utilities.save_density(counts, output_file, phases, pipeline)
+    return phases.total(), num_points
+
+
+def gpu_ifs_chunks(transformation=constants.ifs_fractals["fern"],
+                   num_points=100000, chunk_size=1000000, block_size=64,
+                   burn_in=15, seed=None, phases=None):
+    """
+    Generate IFS points on the GPU in fixed-size chunks. One device buffer
+    of chunk_size points is reused: after the burn-in passes every further
+    pass of phase1Transform is copied back to the host as the next chunk.
+    :param num_points: Total number of points to generate
+    :param chunk_size: Number of points per chunk
+    :param block_size: GPU Block Size
+    :param burn_in: Number of passes before the first chunk is produced
+    :param seed: Seed of the kernel's random streams, None for fresh entropy
+    :param phases: Optional Instrumentation.PhaseTimer. Copying the chunks
+        back is timed as transfer
+    :return: generator of (x, y) array chunks
+    """
+    chunk_size = min(chunk_size, num_points)
     block = (block_size, 1, 1)
+    grid = ((chunk_size + block_size - 1) // block_size, 1, 1)
 
-    gpu_x = gpuarray.to_gpu(np.zeros(num_points, np.float32))
-    gpu_y = gpuarray.to_gpu(np.zeros(num_points, np.float32))
-    data_generation = SourceModule(KernelCode.gpu_hammersley_kernel_code)
-    hammersley_func = data_generation.get_function("hammersley")
-    hammersley_func(np.int32(num_points), gpu_x, gpu_y, block=block)
+    with Instrumentation.phase(phases, "compile"):
+        hammersley_func = get_kernel(KernelCode.gpu_hammersley_kernel_code,
+                                     "hammersley")
+        ifs_func = get_kernel(KernelCode.ifs_transform_kernel_code,
+                              "phase1Transform", no_extern_c=True)
 
-    transformation = np.array(transformation, np.float32)
-    gpu_transform = gpuarray.to_gpu(transformation)
-    rows, cols = transformation.shape
+    with Instrumentation.phase(phases, "setup"):
+        gpu_x = gpuarray.to_gpu(np.zeros(chunk_size, np.float32))
+        gpu_y = gpuarray.to_gpu(np.zeros(chunk_size, np.float32))
+        compiled = CompiledTransformation.compile_transformation(
+            transformation)
+        transformation = compiled.table.astype(np.float32)
+        gpu_transform = gpuarray.to_gpu(transformation)
+        gpu_accept = gpuarray.to_gpu(compiled.accept.astype(np.float32))
+        gpu_alias = gpuarray.to_gpu(compiled.alias.astype(np.int32))
+        rows, cols = transformation.shape
+        kernel_seed = _kernel_seed(seed)
+    passes = [0]
 
-    grid = (num_points, 1, 1)
-    mod = SourceModule(KernelCode.ifs_transform_kernel_code, no_extern_c=True)
-    ifs_func = mod.get_function("phase1Transform")
-    ifs_func(gpu_x, gpu_y, gpu_transform, np.int32(num_points), np.int32(rows),
-             block=block, grid=grid, shared=sys.getsizeof(gpu_transform))
-
-    curr_iter = 0
-    while curr_iter < 15:
-        ifs_func(gpu_x, gpu_y, gpu_transform,
-                 np.int32(num_points), np.int32(rows),
-                 block=block, grid=grid,
-                 shared=sys.getsizeof(gpu_transform))
-        curr_iter += 1
-
-    x = gpu_x.get()
-    y = gpu_y.get()
-    points = list(zip(x, y))
-    run_time = timer() - start
-    Utilities.draw_image(points, width, height, output_file)
-    return run_time, len(points)
+    def run_pass():
+        ifs_func(gpu_x, gpu_y, gpu_transform, gpu_accept, gpu_alias,
+                 np.int32(chunk_size), np.int32(rows), kernel_seed,
+                 np.int32(passes[0]), block=block, grid=grid,
+                 shared=transformation.nbytes)
+        passes[0] += 1
+
+    with Instrumentation.phase(phases, "compute"):
+        hammersley_func(np.int32(chunk_size), gpu_x, gpu_y, block=block,
+                        grid=grid)
+        for _ in range(burn_in):
+            run_pass()
+
+    generated = 0
+    while generated < num_points:
+        with Instrumentation.phase(phases, "compute"):
+            run_pass()
+            cuda.Context.synchronize()
+        size = min(chunk_size, num_points - generated)
+        generated += size
+        with Instrumentation.phase(phases, "transfer"):
+            x = gpu_x.get()[:size]
+            y = gpu_y.get()[:size]
+        yield x, y
+
+
+def gpu_streaming_ifs_transform(transformation=constants.ifs_fractals["fern"],
+                                width=600, height=600, num_points=100000,
+                                chunk_size=1000000, bounds=None,
+                                block_size=64, output_file="gpuOut.png",
+                                seed=None, tolerance=None, cache=None,
+                                pipeline=None, phases=None):
+    """
+    Constant-memory version of gpu_ifs_transform. Each chunk copied back from
+    the GPU is binned straight into the pixel histogram.
+    :param num_points: Number of points, or the most points to generate
+        when a tolerance is given
+    :param chunk_size: Number of points generated per chunk
+    :param bounds: (min_x, max_x, min_y, max_y) viewport. Defaults to the
+        attractor bounds of the compiled transformation, or is estimated
+        from the first chunk if those are not known
+    :param seed: Seed of the kernel's random streams, None for fresh entropy
+    :param tolerance: Stop once a chunk changes less than this fraction of
+        the occupied pixels instead of running a fixed number of passes, see
+        Utilities.stream_until_converged
+    :param cache: Optional FractalCache.FractalCache. The density histogram
+        is reused from it when cached and stored in it when not
+    :param pipeline: Optional OutputPipeline.OutputPipeline that writes
+        the image in the background while the caller carries on
+    :param phases: Optional Instrumentation.PhaseTimer to record per-phase
+        timings in
+    :return: algorithm runtime in seconds, number of points used
+    """
+    if phases is None:
+        phases = Instrumentation.PhaseTimer()
+    used = []
+
+    def compute():
+        histogram_bounds = bounds
+        if histogram_bounds is None:
+            histogram_bounds = CompiledTransformation.compile_transformation(
+                transformation).bounds
+        chunks = gpu_ifs_chunks(transformation=transformation,
+                                num_points=num_points,
+                                chunk_size=chunk_size,
+                                block_size=block_size,
+                                seed=seed,
+                                phases=phases)
+        if tolerance is not None:
+            counts, points = Utilities.stream_until_converged(
+                chunks, width, height, histogram_bounds, tolerance,
+                phases=phases)
+            used.append(points)
+            return counts
+        counts = np.zeros((height, width), dtype=np.int64)
+        for x, y in chunks:
+            with phases.phase("rasterize"):
+                if histogram_bounds is None:
+                    histogram_bounds = Utilities.warm_up_bounds(x, y)
+                Utilities.bin_points(x, y, width, height, histogram_bounds,
+                                     counts)
+        return counts
+
+    counts = FractalCache.cached(cache, compute, phases, kind="streaming_ifs",
+                                 backend="gpu", transformation=transformation,
+                                 num_points=num_points, width=width,
+                                 height=height, chunk_size=chunk_size,
+                                 bounds=bounds, seed=seed, tolerance=tolerance)
+    Utilities.save_density(counts, output_file, phases, pipeline)
+    if tolerance is None:
+        return phases.total(), num_points
+    # a cached histogram holds every point it was converged with
+    return phases.total(), used[0] if used else int(counts.sum())
+
+
+def gpu_julia_iterations(c=constants.julia_fractals["set1"],
+                         iterations=200,
+                         divergence_value=10,
+                         width=300,
+                         height=None,
+                         block_size=64,
+                         viewport=None,
+                         phases=None):
+    """
+    Run the computeFractal kernel and copy the iteration counts back.
+    :param c: Complex value representation
+    :param iterations: total number of iterations
+    :param divergence_value: divergence value for algorithm
+    :param width: Width of image in pixels
+    :param height: Height of image in pixels, defaults to the width
+    :param block_size: GPU block size
+    :param viewport: Optional Viewport.Viewport to render. Its size takes
+        the place of width and height
+    :param phases: Optional Instrumentation.PhaseTimer to record per-phase
+        timings in
+    :return: (width, height) array of iteration counts
+    """
+    if viewport is None:
+        viewport = Viewport(width, height)
+    width, height = viewport.width, viewport.height
+    block = (block_size, 1, 1)
+    grid = ((width + block_size - 1) // block_size, height, 1)
+
+    with Instrumentation.phase(phases, "compile"):
+        func = get_kernel(KernelCode.divergent_fractal_kernel_code,
+                          "computeFractal")
+    with Instrumentation.phase(phases, "setup"):
+        gpu_data = gpuarray.empty((width, height), np.int32)
+    with Instrumentation.phase(phases, "compute"):
+        func(gpu_data, np.complex64(c), np.int32(width), np.int32(height),
+             np.int32(iterations), np.int32(divergence_value),
+             *[np.float32(value) for value in viewport.kernel_parameters()],
+             block=block, grid=grid)
+        cuda.Context.synchronize()
+    with Instrumentation.phase(phases, "transfer"):
+        return gpu_data.get()
 
 
 def gpu_divergent_fractal(c=constants.julia_fractals["set1"],
@@ -67,7 +324,11 @@ def gpu_divergent_fractal(c=constants.julia_fractals["set1"],
                           divergence_value=10,
                           width=300,
                           block_size=64,
-                          output_file="gpuOut.png"):
+                          output_file="gpuOut.png",
+                          viewport=None,
+                          cache=None,
+                          pipeline=None,
+                          phases=None):
     """
     GPU implementation of divergent quadratic map 'z = z^2 + c' for nIterations.
     :param block_size: GPU block size
@@ -76,23 +337,31 @@ def gpu_divergent_fractal(c=constants.julia_fractals["set1"],
     :param c: Complex value representation
     :param iterations: total number of iterations
     :param divergence_value: divergence value for algorithm
+    :param viewport: Optional Viewport.Viewport to render, for zooming,
+        panning, rotating or non-square images. Its size takes the place of
+        width
+    :param cache: Optional FractalCache.FractalCache. The iteration counts
+        are reused from it when cached and stored in it when not
+    :param pipeline: Optional OutputPipeline.OutputPipeline that writes
+        the image in the background while the caller carries on
+    :param phases: Optional Instrumentation.PhaseTimer to record per-phase
+        timings in
     :return: algorithm runtime in seconds
     """
-    start = timer()
-    height = width
-    gpu_data = gpuarray.empty((width, height), np.int32)
-
-    mod = SourceModule(KernelCode.divergent_fractal_kernel_code)
-    block = (block_size, 1, 1)
-    grid = (width, height, 1)
-
-    func = mod.get_function("computeFractal")
-    func(gpu_data, c, np.int32(width), np.int32(height),
-         np.int32(iterations),
-         np.int32(divergence_value), block=block, grid=grid)
-    data = gpu_data.get()
-    run_time = timer() - start
-    Utilities.plot_fractal(fractal_data=data,
-                           img_size=width,
-                           output_file=output_file)
-    return run_time
+    if phases is None:
+        phases = Instrumentation.PhaseTimer()
+    if viewport is None:
+        viewport = Viewport(width)
+    data = FractalCache.cached(
+        cache,
+        lambda: gpu_julia_iterations(c=c,
+                                     iterations=iterations,
+                                     divergence_value=divergence_value,
+                                     block_size=block_size,
+                                     viewport=viewport,
+                                     phases=phases),
+        phases, kind="julia", backend="gpu", c=c, iterations=iterations,
+        divergence_value=float(divergence_value), viewport=repr(viewport))
+    Utilities.write_fractal_image(fractal_data=data, output_file=output_file,
+                                  phases=phases, pipeline=pipeline)
+    return phases.total()
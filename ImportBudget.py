@@ -0,0 +1,58 @@
+"""
+Measure the import cost of a CPU-only Julia run and check it against a
+budget. Run with: python3 ImportBudget.py [budget in seconds]
+"""
+import subprocess
+import sys
+
+# Import time allowed for a CPU-only --julia run, in seconds
+IMPORT_BUDGET_SEC = 0.5
+
+# Modules a CPU-only --julia run must never import
+HEAVY_MODULES = ("pycuda", "numba", "pandas", "tabulate", "matplotlib")
+
+CPU_JULIA_IMPORTS = ("import main; "
+                     "main.Backends.get_function('cpu', 'julia')")
+
+
+def measure_imports(statement=CPU_JULIA_IMPORTS):
+    """
+    Run a statement in a fresh interpreter with -X importtime.
+    :return: dict of top level module name to cumulative import time in
+        seconds, and the set of every module imported
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                             statement],
+                            stderr=subprocess.PIPE, universal_newlines=True,
+                            check=True)
+    times = {}
+    imported = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        imported.add(module.strip())
+        # nested imports are indented below the module that triggered them
+        if not module.startswith("  "):
+            times[module.strip()] = int(cumulative) / 1e6
+    return times, imported
+
+
+def check_budget(budget=IMPORT_BUDGET_SEC):
+    times, imported = measure_imports()
+    total = sum(times.values())
+    for module, seconds in sorted(times.items(), key=lambda t: -t[1])[:10]:
+        print("{:<30} {:8.4f} sec".format(module, seconds))
+    print("{:<30} {:8.4f} sec (budget {} sec)".format("total", total,
+                                                      budget))
+
+    heavy = sorted(module for module in imported
+                   if module.split(".")[0] in HEAVY_MODULES)
+    if heavy:
+        print("Heavy modules imported:", ", ".join(heavy))
+    return total <= budget and not heavy
+
+
+if __name__ == '__main__':
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else IMPORT_BUDGET_SEC
+    sys.exit(0 if check_budget(budget) else 1)
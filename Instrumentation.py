@@ -0,0 +1,103 @@
+"""
+Per-phase timing instrumentation shared by the backends. Each run records
+how long it spent in setup, kernel/JIT compilation, compute, host/device
+transfer, rasterizing and encoding, so backends can be compared phase by
+phase instead of through one mixed total.
+"""
+import cProfile
+import json
+import pstats
+import resource
+import sys
+from contextlib import contextmanager
+from timeit import default_timer as timer
+
+PHASES = ("setup", "compile", "compute", "transfer", "rasterize", "encode")
+
+# Phases counted in the run time the backends return. Rasterizing and
+# encoding the image are excluded so every backend reports the same thing.
+RUN_PHASES = ("setup", "compile", "compute", "transfer")
+
+
+class PhaseTimer:
+    """
+    Accumulates wall clock time per named phase.
+    """
+
+    def __init__(self):
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = timer()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + timer() - start
+
+    def total(self, names=RUN_PHASES):
+        return sum(self.phases.get(name, 0.0) for name in names)
+
+    def record(self, **fields):
+        """
+        Build a structured record of the phase timings and peak memory.
+        :param fields: Extra fields describing the run
+        """
+        record = dict(fields)
+        for name in PHASES:
+            record[name + "_sec"] = self.phases.get(name, 0.0)
+        record["run_time_sec"] = self.total()
+        record["peak_rss_mb"] = peak_rss_mb()
+        return record
+
+
+@contextmanager
+def phase(phases, name):
+    """
+    Time a phase on an optional PhaseTimer, doing nothing if it is None.
+    """
+    if phases is None:
+        yield
+    else:
+        with phases.phase(name):
+            yield
+
+
+def peak_rss_mb():
+    """
+    :return: Peak resident set size of this process in megabytes
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    if sys.platform == "darwin":
+        return peak / 2 ** 20
+    return peak / 2 ** 10
+
+
+def save_records(records, output_file):
+    """
+    Append records to a JSON lines file, one record per line.
+    """
+    with open(output_file, "a") as results:
+        for record in records:
+            results.write(json.dumps(record) + "\n")
+
+
+@contextmanager
+def profile(output_file, top=20):
+    """
+    Profile the enclosed block with cProfile, dump the stats to a file and
+    print the most expensive calls. Does nothing if output_file is empty.
+    """
+    if len(output_file) == 0:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(output_file)
+        print("Saved profile to ", output_file)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(top)
@@ -27,11 +27,19 @@ extern "C"
         __syncthreads();
     }
 
+    // transform holds normalized probabilities; accept and alias are the
+    // Walker alias table built by CompiledTransformation. Each thread draws
+    // from its own curand subsequence of the seed, skipping the numbers
+    // earlier passes used, so runs with the same seed draw the same numbers
     __global__ void phase1Transform(float *xPoints,
                                     float *yPoints, 
                                     float *transform,
+                                    float *accept,
+                                    int *alias,
                                     int numPoints,
-                                    int numTransform)
+                                    int numTransform,
+                                    unsigned long long seed,
+                                    int pass)
     {
         int index = blockIdx.x * blockDim.x + threadIdx.x;
     
@@ -42,35 +50,29 @@ extern "C"
         {
             curandState_t state;
     
-            curand_init((unsigned long long)clock(), index, 0, &state);
-            float random = curand_uniform(&state);
+            curand_init(seed, index, 3ull * pass, &state);
+            float random = curand_uniform(&state) * numTransform;
             float currX, currY;
             float randStart = (float) curand_uniform(&state);
             int randPoint = curand(&state) % numPoints;
             currX = xPoints[randPoint];
             currY = yPoints[randPoint];
     
-            int i = 0;
-            float pSum = 0;
-    
-            while (i < numTransform && pSum < random)
+            // O(1) alias method pick: the integer part of the draw is the
+            // column and the fractional part chooses it or its alias
+            int i = min((int) random, numTransform - 1);
+            if (random - i >= accept[i])
             {
-                // 6th column will always contain probability
-                pSum += transform[i * 7 + 6];
-    
-                if (random <= pSum)
-                {
-                    float newX = currX * sharedTransform[i * 7 + 0] + currY *
-                        sharedTransform[i * 7 + 1] + sharedTransform[i * 7 + 4];
-                    currY = currX * sharedTransform[i * 7 + 2] + currY *
-                        sharedTransform[i * 7 + 3] + sharedTransform[i * 7 + 5];
-                    currX = newX;
-                    xPoints[index] = currX;
-                    yPoints[index] = currY;
-                }
-    
-                ++i;
+                i = alias[i];
             }
+
+            float newX = currX * sharedTransform[i * 7 + 0] + currY *
+                sharedTransform[i * 7 + 1] + sharedTransform[i * 7 + 4];
+            currY = currX * sharedTransform[i * 7 + 2] + currY *
+                sharedTransform[i * 7 + 3] + sharedTransform[i * 7 + 5];
+            currX = newX;
+            xPoints[index] = currX;
+            yPoints[index] = currY;
         }
     }
 }
@@ -115,28 +117,41 @@ divergent_fractal_kernel_code = """
         return it;
     }
     
+    // Viewport mapping, see Viewport.py: the pixel offset from the centre
+    // is scaled by the half extents and rotated by (cosR, sinR)
     __device__ cTYPE convertToComplex(int x,
                                       int y,
                                       const int height,
-                                      const int width)
+                                      const int width,
+                                      TYPE centerX,
+                                      TYPE centerY,
+                                      TYPE halfX,
+                                      TYPE halfY,
+                                      TYPE cosR,
+                                      TYPE sinR)
     {
-        TYPE jx = 1.5 * (x - width / 2) / (0.5 * width);
-        TYPE jy = (y - height / 2) / (0.5 * height);
+        TYPE u = halfX * (x - width / (TYPE) 2) / ((TYPE) 0.5 * width);
+        TYPE v = halfY * (y - height / (TYPE) 2) / ((TYPE) 0.5 * height);
+        TYPE jx = centerX + u * cosR - v * sinR;
+        TYPE jy = centerY + u * sinR + v * cosR;
     
         return cMakecuComplex(jx, jy);
     }
     
     __global__ void computeFractal(int *data, cTYPE c, int width, int height,
-                                   int maxIterations, int divergenceVal)
+                                   int maxIterations, int divergenceVal,
+                                   TYPE centerX, TYPE centerY, TYPE halfX,
+                                   TYPE halfY, TYPE cosR, TYPE sinR)
     {
         int i =  blockIdx.x * blockDim.x + threadIdx.x;
         int j =  blockIdx.y * blockDim.y + threadIdx.y;
     
         if (i < width && j < height)
         {
-            cTYPE p = convertToComplex(i, j, height, width);
+            cTYPE p = convertToComplex(i, j, height, width, centerX, centerY,
+                                       halfX, halfY, cosR, sinR);
             int count = evolveComplexPoint(p, c, maxIterations, divergenceVal);
-            data[i * width + j] = count; 
+            data[i * height + j] = count; 
         }
     }
 """
@@ -0,0 +1,379 @@
+import numpy as np
+from numba import njit, prange
+
+import CompiledTransformation
+import FractalCache
+import Instrumentation
+import Utilities
+import constants
+from Viewport import Viewport
+
+
+@njit(parallel=True, cache=True)
+def _compute_fractal(points, c, width, height, max_iterations,
+                     divergence_value, center_x, center_y, half_x, half_y,
+                     cos_r, sin_r):
+    """
+    nopython port of the computeFractal/evolveComplexPoint CUDA kernels.
+    Rows are spread over threads with prange.
+    """
+    for w in prange(width):
+        u = half_x * (w - width / 2) / (0.5 * width)
+        for h in range(height):
+            v = half_y * (h - height / 2) / (0.5 * height)
+            z = complex(center_x + (u * cos_r - v * sin_r),
+                        center_y + (u * sin_r + v * cos_r))
+            count = 0
+            for i in range(max_iterations):
+                z = z * z + c
+                if abs(z) > divergence_value:
+                    break
+                count += 1
+            points[w, h] = count
+
+
+@njit(parallel=True, cache=True)
+def _compute_atlas(points, c_values, width, height, max_iterations,
+                   divergence_value, center_x, center_y, half_x, half_y,
+                   cos_r, sin_r):
+    """
+    _compute_fractal for a stack of c values sharing one pixel plane. The
+    rows of every image are spread over threads together.
+    """
+    for task in prange(c_values.size * width):
+        k = task // width
+        w = task % width
+        c = c_values[k]
+        u = half_x * (w - width / 2) / (0.5 * width)
+        for h in range(height):
+            v = half_y * (h - height / 2) / (0.5 * height)
+            z = complex(center_x + (u * cos_r - v * sin_r),
+                        center_y + (u * sin_r + v * cos_r))
+            count = 0
+            for i in range(max_iterations):
+                z = z * z + c
+                if abs(z) > divergence_value:
+                    break
+                count += 1
+            points[k, w, h] = count
+
+
+@njit(parallel=True, cache=True)
+def _chaos_game(points_x, points_y, transform, accept, alias, chains,
+                burn_in):
+    """
+    nopython port of the phase1Transform chaos-game step. Each of the
+    chains fills its own contiguous slice of the output arrays, picking
+    transformations from the alias table in accept and alias.
+    """
+    num_points = points_x.size
+    per_chain = (num_points + chains - 1) // chains
+    for chain in prange(chains):
+        first = chain * per_chain
+        last = min(first + per_chain, num_points)
+        x = 0.0
+        y = 0.0
+        for step in range(burn_in + last - first):
+            random = np.random.random() * accept.size
+            i = min(int(random), accept.size - 1)
+            if random - i >= accept[i]:
+                i = alias[i]
+            newX = x * transform[i, 0] + y * transform[i, 1] + transform[i, 4]
+            y = x * transform[i, 2] + y * transform[i, 3] + transform[i, 5]
+            x = newX
+            if step >= burn_in:
+                points_x[first + step - burn_in] = x
+                points_y[first + step - burn_in] = y
+
+
+def numba_julia_iterations(c=constants.julia_fractals["set1"],
+                           iterations=200,
+                           divergence_value=10,
+                           width=300,
+                           height=None,
+                           viewport=None,
+                           phases=None,
+                           formula=None):
+    """
+    Numba JIT escape-time engine for the quadratic map 'z = z^2 + c'. The
+    compiled kernel is cached on disk, so only the first invocation pays
+    the compile cost. Formula kernels are compiled once per process.
+    :param c: Complex value representation
+    :param iterations: total number of iterations
+    :param divergence_value: divergence value for algorithm
+    :param width: Width of the image in pixels
+    :param height: Height of the image in pixels, defaults to the width
+    :param viewport: Optional Viewport.Viewport to render. Its size takes
+        the place of width and height
+    :param phases: Optional Instrumentation.PhaseTimer to record per-phase
+        timings in
+    :param formula: Optional Formulas.Formula to iterate instead of the
+        quadratic map
+    :return: (width, height) array of iteration counts
+    """
+    if viewport is None:
+        viewport = Viewport(width, height)
+    width, height = viewport.width, viewport.height
+    kernel = _compute_fractal if formula is None else formula.numba_kernel()
+    with Instrumentation.phase(phases, "compile"):
+        if not kernel.signatures:
+            # compile, or load from the disk cache, on a 1x1 image
+            kernel(np.empty((1, 1), np.float32), 0j, 1, 1, 1, 1.0,
+                   0.0, 0.0, 1.5, 1.0, 1.0, 0.0)
+    with Instrumentation.phase(phases, "setup"):
+        points = np.empty((width, height), dtype=np.float32)
+    with Instrumentation.phase(phases, "compute"):
+        kernel(points, complex(c), width, height, iterations,
+               float(divergence_value), *viewport.kernel_parameters())
+    return points
+
+
+def numba_julia_atlas(c_values=tuple(constants.julia_fractals.values()),
+                      iterations=200,
+                      divergence_value=10,
+                      width=64,
+                      height=None,
+                      viewport=None,
+                      formula=None,
+                      phases=None):
+    """
+    Numba JIT version of CPUTransformation.cpuJuliaAtlas. The quadratic map
+    runs every image in one parallel kernel launch; a formula kernel is
+    launched once per c value.
+    :return: (len(c_values), width, height) array of iteration counts
+    """
+    if viewport is None:
+        viewport = Viewport(width, height)
+    if formula is not None and formula.plane != "z":
+        raise ValueError("An atlas varies c per image, so its formula must "
+                         "iterate the Julia plane")
+    width, height = viewport.width, viewport.height
+    c_values = np.asarray(c_values, dtype=np.complex128).ravel()
+    kernel = _compute_atlas if formula is None else formula.numba_kernel()
+    with Instrumentation.phase(phases, "compile"):
+        if not kernel.signatures:
+            if formula is None:
+                kernel(np.empty((1, 1, 1), np.float32),
+                       np.zeros(1, np.complex128), 1, 1, 1, 1.0, 0.0, 0.0,
+                       1.5, 1.0, 1.0, 0.0)
+            else:
+                kernel(np.empty((1, 1), np.float32), 0j, 1, 1, 1, 1.0,
+                       0.0, 0.0, 1.5, 1.0, 1.0, 0.0)
+    with Instrumentation.phase(phases, "setup"):
+        points = np.empty((c_values.size, width, height), dtype=np.float32)
+    with Instrumentation.phase(phases, "compute"):
+        if formula is None:
+            kernel(points, c_values, width, height, iterations,
+                   float(divergence_value), *viewport.kernel_parameters())
+        else:
+            for k, c in enumerate(c_values):
+                kernel(points[k], complex(c), width, height, iterations,
+                       float(divergence_value),
+                       *viewport.kernel_parameters())
+    return points
+
+
+def numba_ifs_points(transformation=constants.ifs_fractals["fern"],
+                     num_points=100000,
+                     chains=256,
+                     burn_in=20,
+                     phases=None):
+    """
+    Numba JIT chaos game run as independent chains across threads.
+    :param transformation: A transformation matrix with 7 columns
+        representing [a, b, c, d, e, f, prob] for the IFS function
+        x_(n+1) = ax_n + by_n + e and y_(n+1) = cx_n + dy_n + f
+    :param num_points: Number of points to generate
+    :param chains: Number of independent chains
+    :param burn_in: Number of initial steps each chain discards
+    :param phases: Optional Instrumentation.PhaseTimer to record per-phase
+        timings in
+    :return: x and y arrays of length num_points
+    """
+    with Instrumentation.phase(phases, "compile"):
+        if not _chaos_game.signatures:
+            # compile, or load from the disk cache, on a single point
+            _chaos_game(np.empty(1), np.empty(1), np.zeros((1, 7)),
+                        np.ones(1), np.zeros(1, dtype=np.intp), 1, 0)
+    with Instrumentation.phase(phases, "setup"):
+        compiled = CompiledTransformation.compile_transformation(
+            transformation)
+        points_x = np.empty(num_points)
+        points_y = np.empty(num_points)
+    with Instrumentation.phase(phases, "compute"):
+        _chaos_game(points_x, points_y, compiled.table, compiled.accept,
+                    compiled.alias, max(1, min(chains, num_points)), burn_in)
+    return points_x, points_y
+
+
+def numba_ifs_transform(transformation=constants.ifs_fractals["fern"],
+                        width=600, height=600, num_points=100000,
+                        output_file="numbaOut.png", cache=None, pipeline=None,
+                        phases=None):
+    """
+    This function will perform the Iterated Function System (IFS) fractal
+    algorithm with the Numba JIT chaos game.
+    :param transformation: A transformation matrix with 7 columns representing
+        [a, b, c, d, e, f, prob] for the IFS function x_(n+1) = ax_n + by_n + e
+        and y_(n+1) = cx_n + dy_n + f
+    :param width: Width of the image in pixels
+    :param height: Height of the image in pixels
+    :param num_points: Number of points in fractal
+    :param output_file: File to save the image to
+    :param cache: Optional FractalCache.FractalCache. The density histogram
+        is reused from it when cached and stored in it when not
+    :param pipeline: Optional OutputPipeline.OutputPipeline that writes
+        the image in the background while the caller carries on
+    :param phases: Optional Instrumentation.PhaseTimer to record per-phase
+        timings in
+    :return: algorithm runtime in seconds, number of points
+    """
+    if phases is None:
+        phases = Instrumentation.PhaseTimer()
+
+    def compute():
+        x, y = numba_ifs_points(transformation=transformation,
+                                num_points=num_points,
+                                phases=phases)
+        with phases.phase("rasterize"):
+            return Utilities.bin_points(
+                x, y, width, height,
+                CompiledTransformation.compile_transformation(
+                    transformation).bounds)
+
+    counts = FractalCache.cached(cache, compute, phases, kind="ifs",
+                                 backend="numba",
+                                 transformation=transformation,
+                                 num_points=num_points, width=width,
+                                 height=height)
+    Utilities.save_density(counts, output_file, phases, pipeline)
+    return phases.total(), num_points
+
+
+def numba_ifs_chunks(transformation=constants.ifs_fractals["fern"],
+                     num_points=100000, chunk_size=1000000):
+    """
+    Generate Numba JIT chaos-game points in fixed-size chunks.
+    :return: generator of (x, y) array chunks
+    """
+    generated = 0
+    while generated < num_points:
+        size = min(chunk_size, num_points - generated)
+        generated += size
+        yield numba_ifs_points(transformation=transformation, num_points=size)
+
+
+def numba_streaming_ifs_transform(
+        transformation=constants.ifs_fractals["fern"], width=600, height=600,
+        num_points=100000, chunk_size=1000000, bounds=None,
+        output_file="numbaOut.png", tolerance=None, cache=None, pipeline=None,
+        phases=None):
+    """
+    Constant-memory version of numba_ifs_transform. Each chunk is binned
+    straight into the pixel histogram.
+    :param num_points: Number of points, or the most points to generate
+        when a tolerance is given
+    :param chunk_size: Number of points generated per chunk
+    :param bounds: (min_x, max_x, min_y, max_y) viewport. Defaults to the
+        attractor bounds of the compiled transformation, or is estimated
+        from a short warm-up run if those are not known
+    :param tolerance: Stop once a chunk changes less than this fraction of
+        the occupied pixels, see Utilities.stream_until_converged
+    :param cache: Optional FractalCache.FractalCache. The density histogram
+        is reused from it when cached and stored in it when not
+    :param pipeline: Optional OutputPipeline.OutputPipeline that writes
+        the image in the background while the caller carries on
+    :param phases: Optional Instrumentation.PhaseTimer to record per-phase
+        timings in
+    :return: algorithm runtime in seconds, number of points used
+    """
+    if phases is None:
+        phases = Instrumentation.PhaseTimer()
+    used = []
+
+    def compute():
+        histogram_bounds = bounds
+        if histogram_bounds is None:
+            histogram_bounds = CompiledTransformation.compile_transformation(
+                transformation).bounds
+        if histogram_bounds is None:
+            # the warm-up run also pays the JIT compile, recorded as compile
+            histogram_bounds = Utilities.warm_up_bounds(
+                *numba_ifs_points(transformation=transformation,
+                                  num_points=min(num_points, 100000),
+                                  phases=phases))
+        chunks = numba_ifs_chunks(transformation=transformation,
+                                  num_points=num_points,
+                                  chunk_size=chunk_size)
+        if tolerance is None:
+            return Utilities.stream_to_histogram(chunks, width, height,
+                                                 histogram_bounds, phases)
+        counts, points = Utilities.stream_until_converged(
+            chunks, width, height, histogram_bounds, tolerance,
+            phases=phases)
+        used.append(points)
+        return counts
+
+    counts = FractalCache.cached(cache, compute, phases, kind="streaming_ifs",
+                                 backend="numba",
+                                 transformation=transformation,
+                                 num_points=num_points, width=width,
+                                 height=height, chunk_size=chunk_size,
+                                 bounds=bounds, tolerance=tolerance)
+    Utilities.save_density(counts, output_file, phases, pipeline)
+    if tolerance is None:
+        return phases.total(), num_points
+    # a cached histogram holds every point it was converged with
+    return phases.total(), used[0] if used else int(counts.sum())
+
+
+def numba_divergent_fractal(c=constants.julia_fractals["set1"],
+                            iterations=200,
+                            divergence_value=10,
+                            width=300,
+                            output_file="numbaOut.png",
+                            viewport=None,
+                            cache=None,
+                            pipeline=None,
+                            phases=None,
+                            formula=None):
+    """
+    Numba JIT implementation of divergent quadratic map 'z = z^2 + c' for
+    nIterations.
+    :param c: Complex value representation
+    :param iterations: total number of iterations
+    :param divergence_value: divergence value for algorithm
+    :param width: Width of the image in pixels. The same value will be used for
+        the image height
+    :param output_file: Filename to save image as
+    :param viewport: Optional Viewport.Viewport to render, for zooming,
+        panning, rotating or non-square images. Its size takes the place of
+        width
+    :param cache: Optional FractalCache.FractalCache. The iteration counts
+        are reused from it when cached and stored in it when not
+    :param pipeline: Optional OutputPipeline.OutputPipeline that writes
+        the image in the background while the caller carries on
+    :param phases: Optional Instrumentation.PhaseTimer to record per-phase
+        timings in
+    :param formula: Optional Formulas.Formula to iterate instead of the
+        quadratic map
+    :return: algorithm runtime in seconds
+    """
+    if phases is None:
+        phases = Instrumentation.PhaseTimer()
+    if viewport is None:
+        viewport = Viewport(width)
+    points = FractalCache.cached(
+        cache,
+        lambda: numba_julia_iterations(c=c,
+                                       iterations=iterations,
+                                       divergence_value=divergence_value,
+                                       viewport=viewport,
+                                       phases=phases,
+                                       formula=formula),
+        phases, kind="julia", backend="numba", c=c, iterations=iterations,
+        divergence_value=float(divergence_value), viewport=repr(viewport),
+        formula=repr(formula))
+    Utilities.write_fractal_image(points, output_file=output_file,
+                                  phases=phases, pipeline=pipeline)
+    return phases.total()
@@ -0,0 +1,152 @@
+"""
+Background output stage for the engines. Rendered arrays are handed to a
+bounded queue and a writer thread colorizes, compresses and saves them
+while the caller moves on to the next computation. PNG compression and
+file writes release the GIL, so encoding really overlaps with compute.
+When the queue is full the caller blocks until the writer catches up, so
+memory stays bounded however far compute runs ahead of the disk.
+"""
+import queue
+import threading
+from os import path
+from timeit import default_timer as timer
+
+import numpy as np
+from PIL import Image
+
+import Instrumentation
+import Utilities
+
+# Kinds of data an engine can hand to the pipeline
+KINDS = ("density", "iterations", "image")
+
+
+class OutputPipeline:
+    """
+    :param max_pending: Number of outputs that may wait for the writer
+        thread before submit blocks. 0 writes every output synchronously in
+        the caller, which is how the engines behave without a pipeline
+    :param compression: zlib level of the PNGs, 0 (fastest, largest) to 9
+    :param raw: Save density histograms and iteration counts as .npy arrays
+        next to the output file name instead of as PNG images
+    """
+
+    def __init__(self, max_pending=2, compression=6, raw=False):
+        if not 0 <= compression <= 9:
+            raise ValueError("PNG compression level must be from 0 to 9")
+        if max_pending < 0:
+            raise ValueError("The pipeline queue size cannot be negative")
+        self.compression = compression
+        self.raw = raw
+        self.written = 0
+        # time the writer spent encoding and the callers spent blocked
+        self.encode_sec = 0.0
+        self.wait_sec = 0.0
+        self._error = None
+        self._queue = None
+        self._thread = None
+        if max_pending > 0:
+            self._queue = queue.Queue(maxsize=max_pending)
+            self._thread = threading.Thread(target=self._run,
+                                            name="OutputPipeline",
+                                            daemon=True)
+            self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def output_file(self, kind, output_file):
+        """
+        :return: the file an output of this kind is actually written to
+        """
+        if self.raw and kind != "image":
+            return path.splitext(output_file)[0] + ".npy"
+        return output_file
+
+    def submit(self, kind, data, output_file, phases=None, **options):
+        """
+        Queue data to be written, blocking while the queue is full. The
+        caller must not modify data afterwards.
+        :param kind: density for an IFS histogram, iterations for Julia
+            iteration counts, or image for a PIL image
+        :param options: tol and colormap of Utilities.colorize for
+            iteration counts
+        :param phases: Optional PhaseTimer. Time blocked on a full queue,
+            or the whole write when synchronous, is recorded as encode
+        """
+        if kind not in KINDS:
+            raise ValueError("Unknown output kind '" + kind + "'")
+        self._raise_error()
+        print("Saving image to: " + self.output_file(kind, output_file))
+        if self._thread is None:
+            self._write(kind, data, output_file, options, phases)
+            return
+        start = timer()
+        with Instrumentation.phase(phases, "encode"):
+            self._queue.put((kind, data, output_file, options))
+        self.wait_sec += timer() - start
+
+    def close(self):
+        """
+        Wait for every queued output to be written and stop the writer.
+        Raises the first error the writer hit.
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is None:
+                try:
+                    self._write(*item)
+                except Exception as error:
+                    # reported to the caller by the next submit or close
+                    self._error = error
+
+    def _write(self, kind, data, output_file, options, phases=None):
+        start = timer()
+        output_file = self.output_file(kind, output_file)
+        if kind == "image":
+            image = data
+        elif self.raw:
+            with Instrumentation.phase(phases, "encode"):
+                np.save(output_file, data)
+            image = None
+        else:
+            with Instrumentation.phase(phases, "rasterize"):
+                if kind == "density":
+                    image = Utilities.density_to_image(data)
+                else:
+                    image = Image.fromarray(
+                        Utilities.colorize(data.T, options.get("tol", .1),
+                                           options.get("colormap", "viridis")),
+                        'RGB')
+        if image is not None:
+            with Instrumentation.phase(phases, "encode"):
+                image.save(output_file, "PNG",
+                           compress_level=self.compression)
+        self.encode_sec += timer() - start
+        self.written += 1
+
+    def summary(self):
+        """
+        :return: one line describing the outputs written and the time the
+            callers spent waiting for the writer
+        """
+        return "{} outputs written, {:.4f} sec encoding, {:.4f} sec " \
+               "waiting for the writer".format(self.written, self.encode_sec,
+                                               self.wait_sec)
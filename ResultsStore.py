@@ -0,0 +1,260 @@
+"""
+Append-only store of run times in a local SQLite database. Every run adds
+one row per backend in a single short transaction, so saving a result costs
+the same however long the history is, and concurrent runs writing to the
+same store never overwrite each other's rows. The store can be queried and
+aggregated, and regenerates the run time boxplots such as JuliaCPUBoxPlot.jpg
+straight from the stored rows. Timing CSVs written by earlier versions can be
+imported.
+
+Run with: python3 ResultsStore.py --store {database} [--import_csv {csv}]
+    [--summary] [--boxplot {image file} --kind {julia, ifs} --backend cpu]
+"""
+import csv
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+# Columns of a result row besides its id. kind is julia or ifs and
+# total_points the number of points a backend actually generated.
+COLUMNS = ("recorded_at", "kind", "transformation", "backend", "time_sec",
+           "iterations", "image_width", "image_height", "points",
+           "total_points", "block_size")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    recorded_at REAL NOT NULL,
+    kind TEXT NOT NULL,
+    transformation TEXT NOT NULL,
+    backend TEXT NOT NULL,
+    time_sec REAL NOT NULL,
+    iterations INTEGER,
+    image_width INTEGER,
+    image_height INTEGER,
+    points INTEGER,
+    total_points INTEGER,
+    block_size INTEGER
+);
+CREATE INDEX IF NOT EXISTS results_kind
+    ON results (kind, transformation, backend);
+"""
+
+PLOT_TITLES = {"julia": "Julia Sets", "ifs": "IFS Fractal"}
+
+
+class ResultsStore:
+    """
+    :param database: Path of the SQLite database, created if missing
+    :param timeout: Seconds a writer waits for another writer's transaction
+    """
+
+    def __init__(self, database, timeout=60.0):
+        self.database = database
+        self.timeout = timeout
+        with self._connect() as connection:
+            # readers do not block the writer and vice versa
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.database, timeout=self.timeout)
+
+    def append(self, rows):
+        """
+        Add result rows in one transaction.
+        :param rows: dicts with kind, transformation, backend and time_sec
+            and any of the other COLUMNS
+        """
+        now = time.time()
+        values = []
+        for row in rows:
+            unknown = set(row) - set(COLUMNS)
+            if unknown:
+                raise ValueError("Unknown result columns: " +
+                                 ", ".join(sorted(unknown)))
+            row = dict(row)
+            row.setdefault("recorded_at", now)
+            values.append(tuple(row.get(column) for column in COLUMNS))
+        with self._connect() as connection:
+            connection.executemany(
+                "INSERT INTO results ({}) VALUES ({})".format(
+                    ", ".join(COLUMNS), ", ".join("?" * len(COLUMNS))),
+                values)
+        return len(values)
+
+    def query(self, **filters):
+        """
+        :param filters: column=value, or column=list of accepted values
+        :return: list of matching rows as dicts, oldest first
+        """
+        clauses = []
+        arguments = []
+        for column, value in filters.items():
+            if column not in COLUMNS:
+                raise ValueError("Unknown result column '" + column + "'")
+            if isinstance(value, (list, tuple, set)):
+                value = list(value)
+                clauses.append("{} IN ({})".format(
+                    column, ", ".join("?" * len(value))))
+                arguments.extend(value)
+            else:
+                clauses.append(column + " = ?")
+                arguments.append(value)
+        sql = "SELECT {} FROM results".format(", ".join(COLUMNS))
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY id"
+        with self._connect() as connection:
+            rows = connection.execute(sql, arguments).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def aggregate(self, by=("kind", "transformation", "backend"),
+                  value="time_sec", **filters):
+        """
+        Summarize a column per group of rows.
+        :param by: Columns to group by
+        :param value: Column to summarize
+        :param filters: Row filters, as for query
+        :return: list of dicts of the group columns with the count, min,
+            quartiles, median, mean and max of the value
+        """
+        groups = {}
+        for row in self.query(**filters):
+            if row[value] is not None:
+                key = tuple(row[column] for column in by)
+                groups.setdefault(key, []).append(row[value])
+        summary = []
+        for key in sorted(groups, key=lambda key: [str(part) for part in key]):
+            values = np.array(groups[key], dtype=np.float64)
+            q1, median, q3 = np.percentile(values, (25, 50, 75))
+            summary.append(dict(zip(by, key), count=values.size,
+                                min=values.min(), q1=q1, median=median,
+                                mean=values.mean(), q3=q3, max=values.max()))
+        return summary
+
+    def boxplot(self, output_file, kind, backend, by="transformation",
+                value="time_sec"):
+        """
+        Draw one box per group of a backend's results, as in
+        JuliaCPUBoxPlot.jpg, and save it to output_file.
+        """
+        # pandas and matplotlib are only needed for plotting
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+        import pandas as pd
+        rows = self.query(kind=kind, backend=backend)
+        if not rows:
+            raise ValueError("No {} results for backend '{}'".format(
+                kind, backend))
+        results_table = pd.DataFrame(rows)
+        axes = results_table.boxplot(column=value, by=by, rot=90, fontsize=12,
+                                     figsize=(10, 8))
+        figure = axes.get_figure()
+        figure.suptitle("")
+        axes.set_title("Boxplot {} Time for {}".format(
+            backend.upper(), PLOT_TITLES.get(kind, kind)))
+        figure.savefig(output_file)
+        plt.close(figure)
+        print("Saved boxplot to", output_file)
+
+    def import_csv(self, csv_file, kind):
+        """
+        Import a timing CSV written by earlier versions of main.py, which
+        had one row per run and a {backend}_time or {backend}_time_sec
+        column per backend.
+        :return: number of rows added
+        """
+        rows = []
+        with open(csv_file, newline="") as results:
+            for line in csv.DictReader(results):
+                for column, text in line.items():
+                    if not column.endswith(("_time", "_time_sec")) or \
+                            text in ("", None):
+                        continue
+                    backend = column.rsplit("_time", 1)[0]
+                    row = {"kind": kind,
+                           "transformation": line["transformation"],
+                           "backend": backend,
+                           "time_sec": float(text)}
+                    for name, source in (("iterations", "iterations"),
+                                         ("image_width", "image_size"),
+                                         ("image_height", "image_size"),
+                                         ("image_width", "img_width"),
+                                         ("image_height", "img_height"),
+                                         ("points", "points"),
+                                         ("total_points",
+                                          backend + "_points"),
+                                         ("block_size", "block_size")):
+                        if line.get(source) not in ("", None):
+                            row[name] = int(float(line[source]))
+                    rows.append(row)
+        return self.append(rows)
+
+
+def print_help():
+    print("Usage: --store {SQLite database of results}")
+    print("Optional arguments: --import_csv {timing csv written by main.py}"
+          "--kind {julia, ifs}"
+          "--summary"
+          "--boxplot {full path of the image to save}"
+          "--backend {backend to plot}"
+          "--by {column to group the boxes by}")
+
+
+def parse_input_args():
+    from tabulate import tabulate
+    store_file = ""
+    csv_file = ""
+    kind = "julia"
+    summary = False
+    plot_file = ""
+    backend = "cpu"
+    by = "transformation"
+    n = len(sys.argv)
+    i = 1
+    while i < n:
+        try:
+            if sys.argv[i] == "--summary":
+                summary = True
+                i += 1
+                continue
+            if sys.argv[i] == "--store":
+                store_file = sys.argv[i + 1]
+            elif sys.argv[i] == "--import_csv":
+                csv_file = sys.argv[i + 1]
+            elif sys.argv[i] == "--kind":
+                kind = sys.argv[i + 1]
+            elif sys.argv[i] == "--boxplot":
+                plot_file = sys.argv[i + 1]
+            elif sys.argv[i] == "--backend":
+                backend = sys.argv[i + 1]
+            elif sys.argv[i] == "--by":
+                by = sys.argv[i + 1]
+            else:
+                print_help()
+                exit(0)
+            i += 2
+        except IndexError:
+            print("Index out of range error. The expected number of arguments "
+                  "were not provided.")
+            exit(1)
+    if len(store_file) == 0:
+        print_help()
+        exit(1)
+
+    store = ResultsStore(store_file)
+    if len(csv_file) > 0:
+        print("Imported", store.import_csv(csv_file, kind), "results from",
+              csv_file)
+    if summary:
+        print(tabulate(store.aggregate(), headers="keys"))
+    if len(plot_file) > 0:
+        store.boxplot(plot_file, kind, backend, by)
+
+
+if __name__ == '__main__':
+    parse_input_args()
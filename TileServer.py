@@ -0,0 +1,380 @@
+"""
+Local HTTP tile server for browsing the Julia sets interactively. Tiles are
+served at slippy-map URLs /{set}/{z}/{x}/{y}.png and rendered on demand by a
+backend's escape-time engine. Rendered tiles are kept in an in-memory LRU
+and in a size-bounded on-disk cache, and concurrent requests for a tile
+that is already being rendered wait for that render instead of starting
+another. Cache hit rates and tile latency percentiles are served at /stats.
+
+Run with: python3 TileServer.py [--port 8000] [--cache_dir tiles]
+"""
+import hashlib
+import io
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from timeit import default_timer as timer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+from PIL import Image
+
+import Backends
+import Utilities
+import constants
+from Viewport import Viewport
+
+TILE_SIZE = 256
+
+# Zoom level 0 is a single tile covering the default Julia viewport
+WORLD_CENTER = 0j
+WORLD_ASPECT = 1.5
+
+
+def tile_viewport(z, x, y, tile_size=TILE_SIZE):
+    """
+    :return: Viewport covering tile (x, y) at zoom level z. Each zoom level
+        halves the extent of the tiles of the level above
+    """
+    tiles = 2 ** z
+    center = complex(
+        WORLD_CENTER.real + WORLD_ASPECT * (2 * (x + 0.5) / tiles - 1),
+        WORLD_CENTER.imag + 2 * (y + 0.5) / tiles - 1)
+    return Viewport(tile_size, tile_size, center, tiles, aspect=WORLD_ASPECT)
+
+
+def default_iterations(z, base=200):
+    """
+    Deeper tiles need more iterations to resolve the boundary.
+    """
+    return base + 50 * z
+
+
+class DiskCache:
+    """
+    Directory of tile files bounded in total size, evicting the least
+    recently used files first.
+    :param directory: Directory holding the cached tiles
+    :param max_bytes: Total size the cached files may take up
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.files = OrderedDict()
+        self.size = 0
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(directory):
+            if name.endswith(".png"):
+                stat = os.stat(os.path.join(directory, name))
+                entries.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self.files[name] = size
+            self.size += size
+
+    def get(self, key):
+        name = key + ".png"
+        with self.lock:
+            if name not in self.files:
+                return None
+            self.files.move_to_end(name)
+        file_name = os.path.join(self.directory, name)
+        try:
+            with open(file_name, "rb") as tile:
+                data = tile.read()
+            # keep the recency order across restarts
+            os.utime(file_name)
+        except OSError:
+            return None
+        return data
+
+    def put(self, key, data):
+        name = key + ".png"
+        # write to a temporary file first so readers never see half a tile
+        temporary = os.path.join(self.directory,
+                                 name + "." + str(threading.get_ident()))
+        with open(temporary, "wb") as tile:
+            tile.write(data)
+        os.replace(temporary, os.path.join(self.directory, name))
+        with self.lock:
+            self.size += len(data) - self.files.pop(name, 0)
+            self.files[name] = len(data)
+            while self.size > self.max_bytes and len(self.files) > 1:
+                oldest, size = self.files.popitem(last=False)
+                self.size -= size
+                try:
+                    os.remove(os.path.join(self.directory, oldest))
+                except OSError:
+                    pass
+
+
+class TileRenderer:
+    """
+    Renders Julia tiles through a memory LRU, a disk cache and request
+    coalescing, and keeps the statistics reported at /stats.
+    :param backend: Name of the backend whose julia_iterations renders tiles
+    :param memory_tiles: Number of tiles kept in the in-memory LRU
+    :param disk_cache: Optional DiskCache
+    :param tile_size: Width and height of a tile in pixels
+    :param divergence_value: divergence value for algorithm
+    :param colormap: Name of a colormap in Utilities.COLORMAPS
+    """
+
+    def __init__(self, backend="cpu", memory_tiles=1024, disk_cache=None,
+                 tile_size=TILE_SIZE, divergence_value=10,
+                 colormap="viridis"):
+        self.backend = backend
+        self.memory_tiles = memory_tiles
+        self.disk_cache = disk_cache
+        self.tile_size = tile_size
+        self.divergence_value = divergence_value
+        self.colormap = colormap
+        self.memory = OrderedDict()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "memory_hits": 0, "disk_hits": 0,
+                       "coalesced": 0, "renders": 0}
+        self.latencies = deque(maxlen=10000)
+        self.render_times = deque(maxlen=10000)
+
+    def key(self, set_name, z, x, y, iterations):
+        """
+        :return: Cache key built from every parameter that changes the tile
+        """
+        parameters = [set_name, constants.julia_fractals[set_name], z, x, y,
+                      iterations, self.divergence_value, self.tile_size,
+                      self.colormap, self.backend]
+        return hashlib.sha256(repr(parameters).encode()).hexdigest()
+
+    def render(self, set_name, z, x, y, iterations):
+        """
+        :return: PNG bytes of the tile
+        """
+        viewport = tile_viewport(z, x, y, self.tile_size)
+        start = timer()
+        counts = Backends.run(self.backend, "julia_iterations",
+                              c=constants.julia_fractals[set_name],
+                              iterations=iterations,
+                              divergence_value=self.divergence_value,
+                              viewport=viewport)
+        # counts are indexed [x, y]; image rows run along y
+        image = Image.fromarray(
+            Utilities.colorize(np.asarray(counts).T, colormap=self.colormap,
+                               count_range=(0, iterations)), 'RGB')
+        output = io.BytesIO()
+        image.save(output, format="PNG")
+        self.render_times.append(timer() - start)
+        return output.getvalue()
+
+    def _remember(self, key, data):
+        with self.lock:
+            self.memory[key] = data
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_tiles:
+                self.memory.popitem(last=False)
+
+    def tile(self, set_name, z, x, y, iterations=None):
+        """
+        Look a tile up in memory, then on disk, and render it if neither
+        has it. Only the first of several concurrent requests for the same
+        tile renders it; the others wait for its result.
+        :return: PNG bytes of the tile
+        """
+        if iterations is None:
+            iterations = default_iterations(z)
+        start = timer()
+        key = self.key(set_name, z, x, y, iterations)
+        with self.lock:
+            self.counts["requests"] += 1
+            data = self.memory.get(key)
+            if data is not None:
+                self.memory.move_to_end(key)
+                self.counts["memory_hits"] += 1
+            else:
+                future = self.pending.get(key)
+                owner = future is None
+                if owner:
+                    future = Future()
+                    self.pending[key] = future
+                else:
+                    self.counts["coalesced"] += 1
+
+        if data is None and not owner:
+            data = future.result()
+        elif data is None:
+            try:
+                if self.disk_cache is not None:
+                    data = self.disk_cache.get(key)
+                if data is not None:
+                    with self.lock:
+                        self.counts["disk_hits"] += 1
+                else:
+                    data = self.render(set_name, z, x, y, iterations)
+                    with self.lock:
+                        self.counts["renders"] += 1
+                    if self.disk_cache is not None:
+                        self.disk_cache.put(key, data)
+                self._remember(key, data)
+                future.set_result(data)
+            except Exception as error:
+                future.set_exception(error)
+                raise
+            finally:
+                with self.lock:
+                    del self.pending[key]
+
+        self.latencies.append(timer() - start)
+        return data
+
+    def stats(self):
+        """
+        :return: dict of request counts, hit rates and latency percentiles
+        """
+        with self.lock:
+            stats = dict(self.counts)
+            stats["memory_tiles"] = len(self.memory)
+        requests = max(stats["requests"], 1)
+        stats["memory_hit_rate"] = stats["memory_hits"] / requests
+        stats["disk_hit_rate"] = stats["disk_hits"] / requests
+        stats["coalesced_rate"] = stats["coalesced"] / requests
+        if self.disk_cache is not None:
+            stats["disk_tiles"] = len(self.disk_cache.files)
+            stats["disk_bytes"] = self.disk_cache.size
+        for name, samples in (("latency", self.latencies),
+                              ("render", self.render_times)):
+            samples = list(samples)
+            if samples:
+                for percentile in (50, 90, 99):
+                    stats["{}_p{}_ms".format(name, percentile)] = \
+                        float(np.percentile(samples, percentile)) * 1000
+        return stats
+
+
+def parse_tile_path(path):
+    """
+    Parse /{set}/{z}/{x}/{y}.png, where set is e.g. set3 or 3.
+    :return: set name, z, x, y, or None if the path is not a valid tile
+    """
+    parts = path.strip("/").split("/")
+    if len(parts) != 4 or not parts[3].endswith(".png"):
+        return None
+    set_name = parts[0] if parts[0].startswith("set") else "set" + parts[0]
+    if set_name not in constants.julia_fractals:
+        return None
+    try:
+        z, x, y = int(parts[1]), int(parts[2]), int(parts[3][:-len(".png")])
+    except ValueError:
+        return None
+    if z < 0 or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return None
+    return set_name, z, x, y
+
+
+class TileHandler(BaseHTTPRequestHandler):
+    renderer = None
+
+    def send_body(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/stats":
+            body = json.dumps(self.renderer.stats(), indent=2).encode()
+            self.send_body(200, "application/json", body)
+            return
+        tile = parse_tile_path(url.path)
+        if tile is None:
+            self.send_body(404, "text/plain", b"Unknown tile\n")
+            return
+        query = parse_qs(url.query)
+        iterations = None
+        if "iterations" in query:
+            iterations = int(query["iterations"][0])
+        self.send_body(200, "image/png",
+                       self.renderer.tile(*tile, iterations=iterations))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(renderer, port=8000):
+    TileHandler.renderer = renderer
+    server = ThreadingHTTPServer(("", port), TileHandler)
+    print("Serving tiles at http://localhost:{}/{{set}}/{{z}}/{{x}}/{{y}}.png"
+          .format(port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def print_help():
+    print("Optional arguments: --port {port to serve on}"
+          "--backend {backend rendering the tiles}"
+          "--tile_size {tile width/height in pixels}"
+          "--memory_tiles {number of tiles kept in memory}"
+          "--cache_dir {directory for the on-disk tile cache}"
+          "--cache_size {on-disk tile cache size in megabytes}"
+          "--divergence {divergence value}"
+          "--colormap {" + ", ".join(Utilities.COLORMAPS) + "}")
+
+
+def parse_input_args():
+    port = 8000
+    backend = "cpu"
+    tile_size = TILE_SIZE
+    memory_tiles = 1024
+    cache_dir = ""
+    cache_size = 512
+    divergence_val = 10
+    colormap = "viridis"
+    n = len(sys.argv)
+    i = 1
+    while i < n:
+        try:
+            if sys.argv[i] == "--port":
+                port = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--backend":
+                backend = Backends.parse_backends(sys.argv[i + 1])[0]
+            elif sys.argv[i] == "--tile_size":
+                tile_size = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--memory_tiles":
+                memory_tiles = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--cache_dir":
+                cache_dir = sys.argv[i + 1]
+            elif sys.argv[i] == "--cache_size":
+                cache_size = float(sys.argv[i + 1])
+            elif sys.argv[i] == "--divergence" or sys.argv[i] == "-d":
+                divergence_val = float(sys.argv[i + 1])
+            elif sys.argv[i] == "--colormap":
+                colormap = sys.argv[i + 1]
+            else:
+                print_help()
+                exit(0)
+            i += 2
+        except IndexError:
+            print("Index out of range error. The expected number of arguments "
+                  "were not provided.")
+            exit(1)
+
+    disk_cache = None
+    if len(cache_dir) > 0:
+        disk_cache = DiskCache(cache_dir, int(cache_size * 2 ** 20))
+    serve(TileRenderer(backend, memory_tiles, disk_cache, tile_size,
+                       divergence_val, colormap), port)
+
+
+if __name__ == '__main__':
+    parse_input_args()
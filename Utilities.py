@@ -1,38 +1,607 @@
-from PIL import Image, ImageDraw
-import matplotlib.pyplot as plt
+import io
+import struct
+import zlib
+
+from PIL import Image
 import numpy as np
 
+import Instrumentation
+
+# Points per chunk of a convergence run that does not choose a chunk size
+CONVERGENCE_CHUNK_SIZE = 100000
+
+
+def points_bounds(x, y):
+    """
+    :return: (min_x, max_x, min_y, max_y) of the point arrays
+    """
+    return x.min(), x.max(), y.min(), y.max()
+
+
+def bin_points(x, y, width, height, bounds=None, counts=None):
+    """
+    Bin points into a pixel-count histogram in one vectorized pass. Points
+    are scaled uniformly so the bounds fit the image and the y axis points
+    up. Points that fall outside the bounds are dropped.
+    :param x: Array of x coordinates
+    :param y: Array of y coordinates
+    :param width: Width of the image in pixels
+    :param height: Height of the image in pixels
+    :param bounds: (min_x, max_x, min_y, max_y) viewport, defaults to the
+        extent of the points
+    :param counts: Optional (height, width) histogram to accumulate into
+    :return: (height, width) int64 array of point counts per pixel
+    """
+    if bounds is None:
+        bounds = points_bounds(x, y)
+    min_x, max_x, min_y, max_y = bounds
+    scale = min(width / ((max_x - min_x) or 1.0),
+                height / ((max_y - min_y) or 1.0))
+
+    inside = (x >= min_x) & (x <= max_x) & (y >= min_y) & (y <= max_y)
+    if not inside.all():
+        x = x[inside]
+        y = y[inside]
+    col = ((x - min_x) * scale).astype(np.intp)
+    row = height - 1 - ((y - min_y) * scale).astype(np.intp)
+    np.clip(col, 0, width - 1, out=col)
+    np.clip(row, 0, height - 1, out=row)
+
+    binned = np.bincount(row * width + col, minlength=width * height)
+    binned = binned.reshape(height, width)
+    if counts is None:
+        return binned
+    counts += binned
+    return counts
+
+
+def density_to_image(counts, gamma=2.2):
+    """
+    Tone-map a pixel-count histogram with log-density scaling as in the
+    fractal flame algorithm, so sparse and dense regions both stay visible.
+    :param counts: (height, width) array of point counts per pixel
+    :param gamma: Gamma correction applied after the log scaling
+    :return: Greyscale PIL image
+    """
+    return Image.fromarray(density_levels(counts, gamma).astype(np.uint8),
+                           'L')
+
+
+def density_levels(counts, gamma=2.2):
+    """
+    :return: float array of the 0-255 grey levels density_to_image draws
+    """
+    peak = counts.max()
+    if peak == 0:
+        return np.zeros(counts.shape)
+    alpha = np.log1p(counts) / np.log1p(peak)
+    return 255 * alpha ** (1 / gamma)
+
+
+def warm_up_bounds(x, y, margin=0.02):
+    """
+    Estimate viewport bounds from a short warm-up run. The extent is padded
+    by a margin so the rare points the warm-up missed still land inside.
+    :return: (min_x, max_x, min_y, max_y)
+    """
+    min_x, max_x, min_y, max_y = points_bounds(x, y)
+    pad_x = (max_x - min_x) * margin
+    pad_y = (max_y - min_y) * margin
+    return min_x - pad_x, max_x + pad_x, min_y - pad_y, max_y + pad_y
+
+
+def stream_to_histogram(chunks, width, height, bounds, phases=None):
+    """
+    Accumulate a stream of (x, y) point chunks into one pixel histogram.
+    Only the current chunk and the histogram are held in memory.
+    :param chunks: iterable of (x, y) array pairs
+    :param bounds: (min_x, max_x, min_y, max_y) viewport
+    :param phases: Optional PhaseTimer. Producing a chunk is timed as
+        compute and binning it as rasterize
+    :return: (height, width) array of point counts per pixel
+    """
+    counts = np.zeros((height, width), dtype=np.int64)
+    chunks = iter(chunks)
+    while True:
+        with Instrumentation.phase(phases, "compute"):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return counts
+        with Instrumentation.phase(phases, "rasterize"):
+            bin_points(chunk[0], chunk[1], width, height, bounds, counts)
+
+
+class CoverageMonitor:
+    """
+    Decide when a growing IFS histogram has stopped changing at the target
+    resolution. After each chunk the histogram is tone-mapped as in
+    density_to_image, and a pixel counts as changed when it became occupied
+    or its grey level moved by more than level_tolerance.
+    :param tolerance: Fraction of the occupied pixels allowed to change
+        between two checks for the image to count as converged
+    :param patience: Number of consecutive converged checks needed to stop
+    :param level_tolerance: Grey level change below which a pixel counts as
+        unchanged, so single level flips from rounding are ignored
+    """
+
+    def __init__(self, tolerance=0.01, patience=2, level_tolerance=2,
+                 gamma=2.2):
+        if not 0 < tolerance < 1:
+            raise ValueError("Convergence tolerance must be between 0 and 1")
+        self.tolerance = tolerance
+        self.patience = patience
+        self.level_tolerance = level_tolerance
+        self.gamma = gamma
+        self.levels = None
+        self.streak = 0
+        # (points, occupied fraction, changed fraction) after each check
+        self.history = []
+
+    def update(self, counts, points):
+        """
+        :param counts: Histogram of every point so far
+        :param points: Number of points binned into counts
+        :return: whether the image has converged
+        """
+        levels = density_levels(counts, self.gamma)
+        occupied = np.count_nonzero(counts)
+        if self.levels is None:
+            changed = 1.0
+        else:
+            moved = np.abs(levels - self.levels) > self.level_tolerance
+            changed = np.count_nonzero(moved) / max(occupied, 1)
+        self.levels = levels
+        self.history.append((points, occupied / counts.size, changed))
+        self.streak = self.streak + 1 if changed < self.tolerance else 0
+        return self.streak >= self.patience
+
+
+def stream_until_converged(chunks, width, height, bounds, tolerance=0.01,
+                           patience=2, phases=None):
+    """
+    Accumulate a stream of (x, y) point chunks like stream_to_histogram,
+    but stop drawing chunks once a CoverageMonitor finds the image has
+    converged. The stream's total number of points is the budget.
+    :param bounds: (min_x, max_x, min_y, max_y) viewport, or None to
+        estimate it from the first chunk
+    :param tolerance: Fraction of the occupied pixels allowed to change
+        between chunks
+    :param patience: Number of consecutive converged chunks needed to stop
+    :return: (height, width) array of point counts per pixel, number of
+        points used
+    """
+    monitor = CoverageMonitor(tolerance, patience)
+    counts = np.zeros((height, width), dtype=np.int64)
+    chunks = iter(chunks)
+    points = 0
+    while True:
+        with Instrumentation.phase(phases, "compute"):
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+        with Instrumentation.phase(phases, "rasterize"):
+            if bounds is None:
+                bounds = warm_up_bounds(chunk[0], chunk[1])
+            bin_points(chunk[0], chunk[1], width, height, bounds, counts)
+            points += len(chunk[0])
+            converged = monitor.update(counts, points)
+        if converged:
+            break
+    if hasattr(chunks, "close"):
+        # release a generator's buffers, e.g. the GPU chunk buffers
+        chunks.close()
+    return counts, points
+
+
+def save_image(image, output_file, phases=None):
+    with Instrumentation.phase(phases, "encode"):
+        print("Saving image to: " + output_file)
+        image.save(output_file, "PNG")
+
+
+def save_density(counts, output_file="output.png", phases=None,
+                 pipeline=None):
+    """
+    Tone-map a pixel-count histogram and save it.
+    :param pipeline: Optional OutputPipeline.OutputPipeline to hand the
+        histogram to instead of writing it before returning
+    """
+    if pipeline is not None:
+        pipeline.submit("density", counts, output_file, phases)
+        return
+    with Instrumentation.phase(phases, "rasterize"):
+        image = density_to_image(counts)
+    save_image(image, output_file, phases)
+
+
+def draw_image(x, y, width, height, output_file="output.png", bounds=None,
+               phases=None):
+    with Instrumentation.phase(phases, "rasterize"):
+        counts = bin_points(x, y, width, height, bounds)
+    save_density(counts, output_file, phases)
+
+
+# Colormap anchor colours at evenly spaced positions, sampled from
+# matplotlib so images match the previous imshow output without importing it
+COLORMAPS = {
+    "viridis": [
+        (0.2670, 0.0049, 0.3294), (0.2823, 0.0950, 0.4173),
+        (0.2788, 0.1755, 0.4834), (0.2590, 0.2515, 0.5247),
+        (0.2297, 0.3224, 0.5457), (0.1994, 0.3876, 0.5546),
+        (0.1727, 0.4488, 0.5579), (0.1490, 0.5081, 0.5573),
+        (0.1276, 0.5669, 0.5506), (0.1206, 0.6258, 0.5335),
+        (0.1579, 0.6838, 0.5017), (0.2461, 0.7389, 0.4520),
+        (0.3692, 0.7889, 0.3829), (0.5160, 0.8312, 0.2943),
+        (0.6785, 0.8637, 0.1895), (0.8456, 0.8873, 0.0997),
+        (0.9932, 0.9062, 0.1439)],
+    "magma": [
+        (0.0015, 0.0005, 0.0139), (0.0396, 0.0311, 0.1335),
+        (0.1131, 0.0655, 0.2768), (0.2117, 0.0620, 0.4186),
+        (0.3167, 0.0717, 0.4854), (0.4147, 0.1104, 0.5047),
+        (0.5128, 0.1482, 0.5076), (0.6136, 0.1818, 0.4985),
+        (0.7164, 0.2150, 0.4753), (0.8169, 0.2559, 0.4365),
+        (0.9043, 0.3196, 0.3881), (0.9609, 0.4183, 0.3596),
+        (0.9867, 0.5356, 0.3822), (0.9961, 0.6537, 0.4462),
+        (0.9969, 0.7696, 0.5349), (0.9924, 0.8843, 0.6401),
+        (0.9871, 0.9914, 0.7495)],
+    "grey": [(0.0, 0.0, 0.0), (1.0, 1.0, 1.0)],
+}
+
+_colormap_luts = {}
+
+
+def colormap_lut(colormap="viridis"):
+    """
+    Build, once per colormap, a 256 entry uint8 RGB lookup table by
+    interpolating between the colormap anchors.
+    :return: (256, 3) uint8 array
+    """
+    if colormap not in _colormap_luts:
+        anchors = np.array(COLORMAPS[colormap])
+        positions = np.linspace(0, 1, len(anchors))
+        levels = np.linspace(0, 1, 256)
+        lut = np.column_stack([np.interp(levels, positions, anchors[:, i])
+                               for i in range(3)])
+        _colormap_luts[colormap] = np.round(lut * 255).astype(np.uint8)
+    return _colormap_luts[colormap]
 
-def draw_image(points, width, height, output_file="output.png"):
-    # find out image limits determine scaling and translating
-    min_x = min(points, key=lambda p: p[0])[0]
-    max_x = max(points, key=lambda p: p[0])[0]
-    min_y = min(points, key=lambda p: p[1])[1]
-    max_y = max(points, key=lambda p: p[1])[1]
-    p_width = max_x - min_x
-    p_height = max_y - min_y
 
-    width_scale = (width / p_width)
-    height_scale = (height / p_height)
-    scale = min(width_scale, height_scale)
+def colorize(fractal_data, tol=.1, colormap="viridis", count_range=None):
+    """
+    Map iteration counts through a colormap lookup table. Counts are scaled
+    as -log(count + tol) and normalized to the full colormap range.
+    :param count_range: (min, max) counts to normalize over instead of the
+        range of this array, so separately colorized tiles or strips share
+        one color scale
+    :return: uint8 RGB array with one pixel per iteration count
+    """
+    img = -np.log(fractal_data + tol)
+    if count_range is None:
+        low = img.min()
+        span = (img.max() - low) or 1.0
+    else:
+        # in the dtype of the counts, so the levels round exactly as they
+        # do when the range is taken from the array itself
+        ends = -np.log(np.asarray(count_range, dtype=fractal_data.dtype) +
+                       tol)
+        low = ends[1]
+        span = (ends[0] - low) or 1.0
+    index = ((img - low) * (255 / span)).astype(np.uint8)
+    return colormap_lut(colormap)[index]
+
+
+def write_fractal_image(fractal_data, tol=.1, output_file="out.png",
+                        colormap="viridis", phases=None, pipeline=None):
+    """
+    Write iteration counts straight to a PNG with one pixel per count.
+    :param fractal_data: (width, height) array of iteration counts
+    :param tol: Offset added before taking the log of the counts
+    :param output_file: Filename to save image as
+    :param colormap: Name of a colormap in COLORMAPS
+    :param phases: Optional PhaseTimer to record rasterize/encode time in
+    :param pipeline: Optional OutputPipeline.OutputPipeline to hand the
+        counts to instead of writing them before returning
+    """
+    if pipeline is not None:
+        pipeline.submit("iterations", fractal_data, output_file, phases,
+                        tol=tol, colormap=colormap)
+        return
+    with Instrumentation.phase(phases, "rasterize"):
+        # counts are indexed (w, h) and image rows run along h
+        image = Image.fromarray(colorize(fractal_data.T, tol, colormap),
+                                'RGB')
+    save_image(image, output_file, phases)
+
+
+def contact_sheet(fractal_stack, columns=None, tol=.1, colormap="viridis",
+                  count_range=None, padding=2, labels=None):
+    """
+    Lay a stack of iteration count arrays out as a grid of thumbnails.
+    :param fractal_stack: (n, rows, columns) array of iteration counts
+    :param columns: Thumbnails per row of the sheet, defaults to a square
+        grid
+    :param count_range: (min, max) counts every thumbnail is colorized
+        over, defaults to the range of the whole stack
+    :param padding: Pixels between thumbnails
+    :param labels: Optional text drawn on each thumbnail
+    :return: uint8 RGB array of the sheet
+    """
+    count, rows, cols = fractal_stack.shape
+    if columns is None:
+        columns = int(np.ceil(np.sqrt(count)))
+    grid_rows = -(-count // columns)
+    if count_range is None:
+        count_range = (fractal_stack.min(), fractal_stack.max())
+    sheet = np.zeros((grid_rows * (rows + padding) + padding,
+                      columns * (cols + padding) + padding, 3), np.uint8)
+    for k in range(count):
+        top = padding + (k // columns) * (rows + padding)
+        left = padding + (k % columns) * (cols + padding)
+        sheet[top:top + rows, left:left + cols] = colorize(
+            fractal_stack[k], tol, colormap, count_range)
+    if labels is not None:
+        from PIL import ImageDraw
+        image = Image.fromarray(sheet, 'RGB')
+        draw = ImageDraw.Draw(image)
+        for k, label in enumerate(labels):
+            draw.text((padding + (k % columns) * (cols + padding) + 2,
+                       padding + (k // columns) * (rows + padding) + 1),
+                      label, fill=(255, 255, 255))
+        sheet = np.asarray(image)
+    return sheet
+
+
+class PngWriter:
+    """
+    Streaming 8-bit RGB PNG encoder. Rows are compressed as they are
+    written, so an image never has to be held in memory in full.
+    :param output_file: Filename to save the image as
+    :param width: Width of the image in pixels
+    :param height: Height of the image in pixels
+    :param compression: zlib compression level, 0-9
+    """
+
+    def __init__(self, output_file, width, height, compression=6):
+        self.file = open(output_file, "wb")
+        self.width = width
+        self.height = height
+        self.rows = 0
+        self.compressor = zlib.compressobj(compression)
+        self.file.write(b"\x89PNG\r\n\x1a\n")
+        # 8 bits per channel, colour type 2 (RGB), no interlacing
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0,
+                                         0, 0))
+
+    def _chunk(self, kind, data):
+        self.file.write(struct.pack(">I", len(data)) + kind + data)
+        self.file.write(struct.pack(">I", zlib.crc32(kind + data)))
+
+    def write_rows(self, rgb):
+        """
+        :param rgb: (rows, width, 3) uint8 array of the next image rows
+        """
+        rows = np.empty((rgb.shape[0], 1 + 3 * self.width), dtype=np.uint8)
+        # each scanline starts with filter type 0 (none)
+        rows[:, 0] = 0
+        rows[:, 1:] = rgb.reshape(rgb.shape[0], -1)
+        data = self.compressor.compress(rows.tobytes())
+        if data:
+            self._chunk(b"IDAT", data)
+        self.rows += rgb.shape[0]
+
+    def close(self):
+        if self.rows != self.height:
+            raise ValueError("PNG has {} rows, {} were written".format(
+                self.height, self.rows))
+        self._chunk(b"IDAT", self.compressor.flush())
+        self._chunk(b"IEND", b"")
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+        else:
+            self.file.close()
+
+
+class GifWriter:
+    """
+    Streaming animated GIF encoder. Each frame is encoded and written as it
+    arrives, so an animation never has to be held in memory in full.
+    Frames are LZW-encoded by PIL and keep their own colour table.
+    :param output_file: Filename to save the animation as
+    :param width: Width of the frames in pixels
+    :param height: Height of the frames in pixels
+    :param fps: Frames per second
+    :param loop: Number of times the animation repeats, 0 for forever
+    """
+
+    def __init__(self, output_file, width, height, fps=20, loop=0):
+        self.file = open(output_file, "wb")
+        self.width = width
+        self.height = height
+        self.frames = 0
+        # GIF delays are in hundredths of a second
+        self.delay = max(2, int(round(100 / fps)))
+        # logical screen without a global colour table
+        self.file.write(b"GIF89a" + struct.pack("<HHBBB", width, height, 0,
+                                                0, 0))
+        self.file.write(b"\x21\xff\x0bNETSCAPE2.0\x03\x01" +
+                        struct.pack("<H", loop) + b"\x00")
+
+    def write_frame(self, frame):
+        """
+        :param frame: (height, width, 3) uint8 RGB or (height, width) uint8
+            greyscale array
+        """
+        image = Image.fromarray(frame)
+        if image.mode == "RGB":
+            image = image.quantize(256)
+        encoded = io.BytesIO()
+        image.save(encoded, format="GIF")
+        data = encoded.getvalue()
 
-    # create new image
-    image = Image.new('RGB', (width, height))
-    draw = ImageDraw.Draw(image)
+        # move the frame's global colour table into a local one
+        flags = data[10]
+        position = 13
+        table = b""
+        if flags & 0x80:
+            table = data[position:position + 3 * 2 ** ((flags & 7) + 1)]
+            position += len(table)
+        # graphic control extension with the frame delay
+        self.file.write(b"\x21\xf9\x04\x00" +
+                        struct.pack("<H", self.delay) + b"\x00\x00")
+        while data[position] != 0x3b:
+            if data[position] == 0x21:
+                # drop PIL's own extensions
+                position = _skip_sub_blocks(data, position + 2)
+                continue
+            descriptor = bytearray(data[position:position + 10])
+            position += 10
+            if table:
+                descriptor[9] = (descriptor[9] & 0x70) | 0x80 | (flags & 7)
+            self.file.write(bytes(descriptor) + table)
+            end = _skip_sub_blocks(data, position + 1)
+            self.file.write(data[position:end])
+            position = end
+        self.frames += 1
 
-    for point in points:
-        x = (point[0] - min_x) * scale
-        y = height - (point[1] - min_y) * scale
-        draw.point((x, y))
+    def close(self):
+        self.file.write(b"\x3b")
+        self.file.close()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+        else:
+            self.file.close()
+
+
+def _skip_sub_blocks(data, position):
+    # GIF data sub-blocks are length prefixed and end with a zero length
+    while data[position] != 0:
+        position += data[position] + 1
+    return position + 1
+
+
+class FfmpegWriter:
+    """
+    Video encoder that pipes raw RGB frames to an ffmpeg process, so the
+    frames are encoded as they arrive.
+    :param output_file: Filename to save the video as. ffmpeg picks the
+        container and codec from its extension
+    :param width: Width of the frames in pixels
+    :param height: Height of the frames in pixels
+    :param fps: Frames per second
+    """
+
+    def __init__(self, output_file, width, height, fps=20):
+        import shutil
+        import subprocess
+        if shutil.which("ffmpeg") is None:
+            raise ValueError("ffmpeg was not found, it is needed to write " +
+                             output_file + ". Write a .gif instead")
+        self.width = width
+        self.height = height
+        self.frames = 0
+        self.process = subprocess.Popen(
+            ["ffmpeg", "-loglevel", "error", "-y", "-f", "rawvideo",
+             "-pix_fmt", "rgb24", "-s", "{}x{}".format(width, height),
+             "-r", str(fps), "-i", "-", "-pix_fmt", "yuv420p", output_file],
+            stdin=subprocess.PIPE)
+
+    def write_frame(self, frame):
+        """
+        :param frame: (height, width, 3) uint8 RGB or (height, width) uint8
+            greyscale array
+        """
+        if frame.ndim == 2:
+            frame = np.repeat(frame[:, :, np.newaxis], 3, axis=2)
+        self.process.stdin.write(np.ascontiguousarray(frame).tobytes())
+        self.frames += 1
+
+    def close(self):
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise ValueError("ffmpeg failed to encode the video")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+        else:
+            self.process.kill()
+
+
+def open_video_writer(output_file, width, height, fps=20):
+    """
+    :return: GifWriter for .gif files, otherwise an FfmpegWriter
+    """
+    if output_file.lower().endswith(".gif"):
+        return GifWriter(output_file, width, height, fps)
+    return FfmpegWriter(output_file, width, height, fps)
+
+
+def write_fractal_image_striped(fractal_data, tol=.1, output_file="out.png",
+                                colormap="viridis", strip_rows=256,
+                                compression=6, phases=None):
+    """
+    Out-of-core version of write_fractal_image for iteration buffers too big
+    to colorize at once, such as a np.memmap. The counts are read in strips
+    of image rows, colorized against the range of the whole buffer and
+    streamed to a PngWriter, so the full RGB image never exists in memory.
+    :param fractal_data: (width, height) array of iteration counts
+    :param strip_rows: Number of image rows colorized and encoded at a time
+    :param compression: zlib compression level, 0-9
+    """
+    width, height = fractal_data.shape
+    with Instrumentation.phase(phases, "rasterize"):
+        low = min(fractal_data[w:w + strip_rows].min()
+                  for w in range(0, width, strip_rows))
+        high = max(fractal_data[w:w + strip_rows].max()
+                   for w in range(0, width, strip_rows))
     print("Saving image to: " + output_file)
-    image.save(output_file, "PNG")
+    with PngWriter(output_file, width, height, compression) as png:
+        # image rows run along h, the second axis of the counts
+        for row in range(0, height, strip_rows):
+            with Instrumentation.phase(phases, "rasterize"):
+                rgb = colorize(
+                    np.asarray(fractal_data[:, row:row + strip_rows]).T,
+                    tol, colormap, (low, high))
+            with Instrumentation.phase(phases, "encode"):
+                png.write_rows(rgb)
 
 
 def plot_fractal(fractal_data, img_size=16, tol=.1, output_file="out.png"):
+    """
+    matplotlib preview of iteration counts. write_fractal_image is far
+    faster and is what the backends use.
+    :param img_size: Figure size in inches
+    """
+    # matplotlib is slow to import, so only load it once a plot is requested
+    import matplotlib.pyplot as plt
     img = -np.log(fractal_data + tol)
-    plt.figure(figsize=(img_size, img_size))
+    figure = plt.figure(figsize=(img_size, img_size))
     plt.axis('off')
     print("Saving image to: " + output_file)
     plt.imshow(img)
     plt.savefig(output_file, bbox_inches='tight')
+    plt.close(figure)
+
+
+def parse_bounds(text):
+    """
+    Parse a 'min_x,max_x,min_y,max_y' command line value.
+    """
+    bounds = tuple(float(value) for value in text.split(","))
+    if len(bounds) != 4:
+        raise ValueError("Bounds must be min_x,max_x,min_y,max_y")
+    return bounds
@@ -0,0 +1,139 @@
+"""
+Mapping from image pixels to the complex plane shared by every Julia
+backend. A viewport is a centre, a zoom scale, a rotation and an image size;
+the default viewport reproduces the original fixed mapping
+x = 1.5 * (w - width / 2) / (0.5 * width),
+y = (h - height / 2) / (0.5 * height)
+bit for bit.
+"""
+import math
+from decimal import Decimal, localcontext
+
+import numpy as np
+
+
+def parse_center(text):
+    """
+    Parse a "re,im" centre. The parts are kept as Decimals so deep zoom
+    centres keep more digits than a float64 can hold.
+    """
+    parts = text.split(",")
+    if len(parts) != 2:
+        raise ValueError("Centre must be given as re,im")
+    return Decimal(parts[0].strip()), Decimal(parts[1].strip())
+
+
+class Viewport:
+    """
+    Region of the complex plane rendered into a width x height image.
+    :param width: Width of the image in pixels
+    :param height: Height of the image in pixels, defaults to the width
+    :param center: Centre of the image, as a complex number or as a (re, im)
+        pair of Decimals or strings for centres beyond float64 precision
+    :param scale: Zoom factor. At scale 1 the image spans -1..1 vertically
+    :param rotation: Rotation of the image about its centre in degrees
+    :param aspect: Ratio of the horizontal to the vertical extent of the
+        image. The default of 1.5 matches the original mapping; use
+        width / height for square pixels
+    """
+
+    def __init__(self, width=300, height=None, center=0j, scale=1.0,
+                 rotation=0.0, aspect=1.5):
+        if height is None:
+            height = width
+        if isinstance(center, tuple):
+            self.center_re = Decimal(center[0])
+            self.center_im = Decimal(center[1])
+        else:
+            center = complex(center)
+            self.center_re = Decimal(center.real)
+            self.center_im = Decimal(center.imag)
+        self.center = complex(float(self.center_re), float(self.center_im))
+        self.width = width
+        self.height = height
+        self.scale = float(scale)
+        self.rotation = float(rotation)
+        self.aspect = float(aspect)
+        self.half_x = self.aspect / self.scale
+        self.half_y = 1.0 / self.scale
+        self.cos = math.cos(math.radians(self.rotation))
+        self.sin = math.sin(math.radians(self.rotation))
+
+    def __repr__(self):
+        return ("Viewport(width={}, height={}, center=({}, {}), scale={}, "
+                "rotation={}, aspect={})".format(
+                    self.width, self.height, self.center_re, self.center_im,
+                    self.scale, self.rotation, self.aspect))
+
+    def resized(self, width, height=None):
+        """
+        :return: Viewport over the same region at a different resolution
+        """
+        return Viewport(width, height, (self.center_re, self.center_im),
+                        self.scale, self.rotation, self.aspect)
+
+    def is_centred(self):
+        """
+        :return: whether the image is centred on the origin, in which case
+            pixel (w, h) maps to minus pixel (width - w, height - h)
+        """
+        return self.center_re == 0 and self.center_im == 0
+
+    def _offsets(self, rows, columns):
+        u = self.half_x * (rows - self.width / 2) / (0.5 * self.width)
+        v = self.half_y * (columns - self.height / 2) / (0.5 * self.height)
+        if self.rotation == 0:
+            return u, v
+        return u * self.cos - v * self.sin, u * self.sin + v * self.cos
+
+    def offsets(self, rows, columns):
+        """
+        Position of pixels relative to the centre. At deep zooms these stay
+        accurate in float64 even when centre + offset does not.
+        :param rows: Array of pixel rows, 0 <= w < width
+        :param columns: Array of pixel columns, 0 <= h < height
+        """
+        u, v = self._offsets(rows, columns)
+        return u + 1j * v
+
+    def points(self, rows, columns):
+        """
+        :return: Complex plane position of the given pixels
+        """
+        u, v = self._offsets(rows, columns)
+        return (self.center.real + u) + 1j * (self.center.imag + v)
+
+    def plane(self, row_start=0, row_stop=None):
+        """
+        Build the flattened complex plane for rows [row_start, row_stop).
+        """
+        if row_stop is None:
+            row_stop = self.width
+        rows = np.arange(row_start, row_stop)[:, np.newaxis]
+        columns = np.arange(self.height)[np.newaxis, :]
+        return self.points(rows, columns).ravel()
+
+    def reference(self, offset, precision):
+        """
+        Position of the pixel at the given offset from the centre, in
+        Decimal arithmetic with the given number of significant digits.
+        """
+        with localcontext() as context:
+            context.prec = precision
+            return (self.center_re + Decimal(offset.real),
+                    self.center_im + Decimal(offset.imag))
+
+    def precision(self):
+        """
+        :return: Significant digits needed to resolve a pixel at this zoom
+        """
+        pixels = max(self.width, self.height)
+        return max(20, int(math.log10(self.scale * pixels)) + 20)
+
+    def kernel_parameters(self):
+        """
+        :return: centre x, centre y, half extents and rotation for the
+            computeFractal kernel
+        """
+        return (self.center.real, self.center.imag, self.half_x, self.half_y,
+                self.cos, self.sin)
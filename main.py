@@ -1,10 +1,18 @@
-import CPUTransformation
-import GPUTransformation
+import Backends
+import Batch
+import Formulas
+import FractalCache
+import Instrumentation
+import OutputPipeline
+import ResultsStore
+import Utilities
+import Viewport
 import constants
-import pandas as pd
 import sys
 from os import path
-from tabulate import tabulate
+
+# Julia engines selected by --mode
+JULIA_MODES = ("standard", "accelerated", "progressive", "deep")
 
 
 def print_help():
@@ -14,116 +22,333 @@ def print_help():
     print("Optional arguments: --width {width of image}"
           "--height {height of image}"
           "--points {number of points}"
-          "--gpu_output {full path for gpu image file}"
-          "--cpu_output {full path for cpu image file}"
+          "--backend {comma separated list of " +
+          ", ".join(Backends.BACKENDS) + "}"
+          "--{backend}_output {full path for that backend's image file}"
           "--block {block size for gpu}"
+          "--stream {points per chunk for constant-memory rendering}"
+          "--bounds {min_x,max_x,min_y,max_y}"
+          "--workers {number of cpu worker processes}"
+          "--seed {seed for a reproducible image}"
+          "--converge {fraction of changed pixels to stop at, --points is "
+          "then the most points}"
+          "--cache {directory to cache raw fractal data in}"
+          "--cache_size {cache size in megabytes}"
+          "--write_queue {images queued for a background writer}"
+          "--compression {png compression level 0-9}"
+          "--raw {1 to save .npy arrays instead of png images}"
+          "--profile {full path to save a cProfile of the run to}"
           "--timing {full file path to save run times}")
     print("To run a Julia set fractal: --julia {1-14}")
     print("Optional arguments: --size {size of image width/height}"
+          "--height {height of image, defaults to the size}"
+          "--center {re,im centre of the image}"
+          "--scale {zoom factor}"
+          "--rotation {rotation of the image in degrees}"
           "--iterations {number of total iterations}"
-          "--gpu_output {full path for gpu image file}"
-          "--cpu_output {full path for cpu image file}"
+          "--backend {comma separated list of " +
+          ", ".join(Backends.BACKENDS) + "}"
+          "--{backend}_output {full path for that backend's image file}"
           "--block {block size for gpu}"
           "--divergence {divergence value}"
+          "--workers {number of cpu worker processes}"
+          "--mode {" + ", ".join(JULIA_MODES) + "}"
+          "--out_of_core {full path of the cpu iteration buffer file}"
+          "--formula {" + ", ".join(Formulas.FORMULAS) + " or an expression "
+          "in z and c}"
+          "--plane {z for Julia sets, c for Mandelbrot-type sets}"
+          "--cache {directory to cache raw fractal data in}"
+          "--cache_size {cache size in megabytes}"
+          "--write_queue {images queued for a background writer}"
+          "--compression {png compression level 0-9}"
+          "--raw {1 to save .npy arrays instead of png images}"
+          "--profile {full path to save a cProfile of the run to}"
           "--timing {full path for file to save run times}")
+    print("To render a batch of jobs in one pool of workers: "
+          "--batch {JSON job file}")
+    print("Optional arguments: --workers {number of worker processes}"
+          "--output_dir {directory for images of jobs without an output}"
+          "--cache {directory to cache raw fractal data in}"
+          "--cache_size {cache size in megabytes}"
+          "--write_queue {images queued for a background writer}"
+          "--compression {png compression level 0-9}"
+          "--raw {1 to save .npy arrays instead of png images}"
+          "--timing {full path of a JSON lines file for job timings}")
 
 
-def save_ifs_times(cpu_time, gpu_time, transformation, timing_file, num_points,
-                   block_size, img_width, img_height, cpu_points, gpu_points):
-    new_results = {"transformation": [transformation],
-                   "points": [num_points],
-                   "cpu_time": [cpu_time],
-                   "gpu_time": [gpu_time],
-                   "img_width": [img_width],
-                   "img_height": [img_height],
-                   "block_size": [block_size],
-                   "cpu_points": [cpu_points],
-                   "gpu_points": [gpu_points]}
-    new_results = pd.DataFrame.from_dict(new_results)
+def print_times(results_table):
+    # tabulate is only needed once timings are reported
+    from tabulate import tabulate
+    print(tabulate(results_table, headers="keys"))
+    return results_table
+
+
+def open_results_store(timing_file):
+    """
+    Open the results store for a timing file. Timing files used to be CSVs
+    rewritten on every run; for a .csv path the store is a database next to
+    it, into which the existing CSV is imported the first time.
+    """
+    store_file = timing_file
+    legacy_file = ""
+    if path.splitext(timing_file)[1].lower() == ".csv":
+        store_file = path.splitext(timing_file)[0] + ".db"
+        if path.exists(timing_file) and not path.exists(store_file):
+            legacy_file = timing_file
+    store = ResultsStore.ResultsStore(store_file)
+    if len(legacy_file) > 0:
+        with open(legacy_file) as legacy:
+            # only the Julia CSVs have an iterations column
+            kind = "julia" if "iterations" in legacy.readline() else "ifs"
+        print("Importing", legacy_file, "into", store_file)
+        store.import_csv(legacy_file, kind)
+    return store
 
-    if len(timing_file) > 0:
-        if path.exists(timing_file):
-            print("File exists... Loading in csv...")
-            results_table = pd.read_csv(timing_file, index_col=False)
-            results_table = results_table.append(new_results)
-        else:
-            results_table = new_results
 
-        results_table.to_csv(timing_file, index=False)
-        print("Saved results to ", timing_file)
+def save_times(new_results, timing_file):
+    store = open_results_store(timing_file)
+    store.append(new_results)
+    print("Saved results to ", store.database)
 
-    print(tabulate(new_results, headers=new_results.keys()))
 
+def save_ifs_times(run_times, total_points, transformation, timing_file,
+                   num_points, block_size, img_width, img_height):
+    new_results = [{"kind": "ifs",
+                    "transformation": transformation,
+                    "backend": name,
+                    "time_sec": run_time,
+                    "points": num_points,
+                    "total_points": int(total_points[name]),
+                    "image_width": img_width,
+                    "image_height": img_height,
+                    "block_size": block_size}
+                   for name, run_time in run_times.items()]
+
+    if len(timing_file) > 0:
+        save_times(print_times(new_results), timing_file)
+    else:
+        for name, run_time in run_times.items():
+            print(name, "run time:", run_time, "sec,", total_points[name],
+                  "points")
 
-def save_julia_times(cpu_time, gpu_time, julia_set, output_file, iterations,
-                     size, block):
-    new_results_table = {"transformation": [julia_set],
-                         "iterations": [iterations],
-                         "image_size": [size],
-                         "cpu_time_sec": [cpu_time],
-                         "gpu_time_sec": [gpu_time],
-                         "block_size": [block]}
-    new_results_table = pd.DataFrame.from_dict(new_results_table)
+
+def save_julia_times(run_times, julia_set, output_file, iterations,
+                     img_width, img_height, block):
+    new_results = [{"kind": "julia",
+                    "transformation": julia_set,
+                    "backend": name,
+                    "time_sec": run_time,
+                    "iterations": iterations,
+                    "image_width": img_width,
+                    "image_height": img_height,
+                    "block_size": block}
+                   for name, run_time in run_times.items()]
 
     if len(output_file) > 0:
-        if path.exists(output_file):
-            print("File exists... Loading in csv...")
-            results_table = pd.read_csv(output_file, index_col=False)
-            results_table = results_table.append(new_results_table)
-        else:
-            results_table = new_results_table
+        save_times(print_times(new_results), output_file)
+    else:
+        for name, run_time in run_times.items():
+            print(name, "run time:", run_time, "sec")
+
 
-        results_table.to_csv(output_file, index=False)
-        print("Saved results to ", output_file)
+def default_output_files(backends):
+    return {name: name + "Out.png" for name in backends}
 
-    print(tabulate(new_results_table, headers=new_results_table.keys()))
+
+def save_phase_records(records, timing_file):
+    """
+    Print the per-phase timings of each backend and, if a timing file is
+    given, append them as JSON lines next to it.
+    """
+    for record in records:
+        print(record["backend"], "phases:",
+              ", ".join("{} {:.6f} sec".format(name, record[name + "_sec"])
+                        for name in Instrumentation.PHASES),
+              "| peak memory {:.1f} MB".format(record["peak_rss_mb"]))
+    if len(timing_file) > 0:
+        phases_file = path.splitext(timing_file)[0] + "_phases.jsonl"
+        Instrumentation.save_records(records, phases_file)
+        print("Saved phase timings to ", phases_file)
 
 
 def run_julia(set_to_run, iterations, divergence_val, width, block_size,
-              cpu_output_file, gpu_output_file, timing_file, transform_name):
+              output_files, timing_file, transform_name, workers=1,
+              backends=("cpu", "gpu"), profile_file="", mode="standard",
+              viewport=None, buffer_file="", cache=None, formula=None,
+              pipeline=None):
     julia_set = constants.julia_fractals[set_to_run]
-    cpu_run_time = \
-        CPUTransformation.cpuDivergentFractal(c=julia_set,
-                                              iterations=iterations,
-                                              divergence_value=divergence_val,
-                                              width=width,
-                                              output_file=cpu_output_file)
-    gpu_run_time = \
-        GPUTransformation.gpu_divergent_fractal(c=julia_set,
-                                                iterations=iterations,
-                                                divergence_value=divergence_val,
-                                                width=width,
-                                                block_size=block_size,
-                                                output_file=gpu_output_file)
-
-    save_julia_times(cpu_time=cpu_run_time,
-                     gpu_time=gpu_run_time,
+    if viewport is None:
+        viewport = Viewport.Viewport(width)
+    if formula is not None:
+        for name in backends:
+            if not Backends.accepts(name, "julia", "formula"):
+                raise ValueError("Backend '" + name + "' does not support "
+                                 "formulas")
+    if mode != "standard":
+        for name in backends:
+            if not Backends.accepts(name, "julia", "mode"):
+                raise ValueError("Backend '" + name + "' does not support "
+                                 "the " + mode + " mode")
+    if len(buffer_file) > 0:
+        for name in backends:
+            if not Backends.accepts(name, "julia", "buffer_file"):
+                raise ValueError("Backend '" + name + "' does not support "
+                                 "out-of-core rendering")
+    run_times = {}
+    records = []
+    with Instrumentation.profile(profile_file):
+        for name in backends:
+            phases = Instrumentation.PhaseTimer()
+            run_times[name] = Backends.run(name, "julia",
+                                           c=julia_set,
+                                           iterations=iterations,
+                                           divergence_value=divergence_val,
+                                           width=width,
+                                           block_size=block_size,
+                                           workers=workers,
+                                           mode=mode,
+                                           viewport=viewport,
+                                           buffer_file=buffer_file,
+                                           cache=cache,
+                                           phases=phases,
+                                           formula=formula,
+                                           pipeline=pipeline,
+                                           output_file=output_files[name])
+            records.append(phases.record(transformation=transform_name,
+                                         backend=name,
+                                         iterations=iterations,
+                                         img_width=viewport.width,
+                                         img_height=viewport.height,
+                                         block_size=block_size))
+    close_pipeline(pipeline)
+
+    save_phase_records(records, timing_file)
+    save_julia_times(run_times=run_times,
                      julia_set=transform_name,
                      output_file=timing_file,
-                     size=width,
+                     img_width=viewport.width,
+                     img_height=viewport.height,
                      block=block_size,
                      iterations=iterations)
 
 
-def run_ifs(transformation, width, height, num_points, gpu_output_file,
-            cpu_output_file, timing_file, block, ifs_name):
-    cpu_run_time, cpu_total_points = \
-        CPUTransformation.cpuIfsTransform(transformation=transformation,
-                                          width=width,
-                                          height=height,
-                                          num_points=num_points,
-                                          output_file=cpu_output_file)
-    gpu_run_time, gpu_total_points = \
-        GPUTransformation.gpu_ifs_transform(transformation=transformation,
-                                            width=width,
-                                            height=height,
-                                            num_points=num_points,
-                                            block_size=block,
-                                            output_file=gpu_output_file)
+def run_ifs(transformation, width, height, num_points, output_files,
+            timing_file, block, ifs_name, chunk_size=0, bounds=None,
+            backends=("cpu", "gpu"), profile_file="", cache=None, workers=1,
+            seed=None, tolerance=None, pipeline=None):
+    if tolerance is not None and chunk_size == 0:
+        # convergence is checked after every chunk
+        chunk_size = Utilities.CONVERGENCE_CHUNK_SIZE
+    kind = "streaming_ifs" if chunk_size > 0 else "ifs"
+    for name in backends:
+        if seed is not None and not Backends.accepts(name, kind, "seed"):
+            raise ValueError("Backend '" + name + "' does not support "
+                             "seeded runs")
+        if tolerance is not None and \
+                not Backends.accepts(name, kind, "tolerance"):
+            raise ValueError("Backend '" + name + "' does not support "
+                             "convergence")
+    run_times = {}
+    total_points = {}
+    records = []
+    with Instrumentation.profile(profile_file):
+        for name in backends:
+            phases = Instrumentation.PhaseTimer()
+            if chunk_size > 0:
+                run_times[name], total_points[name] = \
+                    Backends.run(name, "streaming_ifs",
+                                 transformation=transformation,
+                                 width=width,
+                                 height=height,
+                                 num_points=num_points,
+                                 chunk_size=chunk_size,
+                                 bounds=bounds,
+                                 block_size=block,
+                                 workers=workers,
+                                 seed=seed,
+                                 tolerance=tolerance,
+                                 cache=cache,
+                                 pipeline=pipeline,
+                                 phases=phases,
+                                 output_file=output_files[name])
+            else:
+                run_times[name], total_points[name] = \
+                    Backends.run(name, "ifs",
+                                 transformation=transformation,
+                                 width=width,
+                                 height=height,
+                                 num_points=num_points,
+                                 block_size=block,
+                                 workers=workers,
+                                 seed=seed,
+                                 cache=cache,
+                                 pipeline=pipeline,
+                                 phases=phases,
+                                 output_file=output_files[name])
+            records.append(phases.record(transformation=ifs_name,
+                                         backend=name,
+                                         points=num_points,
+                                         img_width=width,
+                                         img_height=height,
+                                         block_size=block))
+            if tolerance is not None:
+                print("{} {} converged after {} of at most {} points".format(
+                    ifs_name, name, total_points[name], num_points))
+    close_pipeline(pipeline)
+
+    save_phase_records(records, timing_file)
+    save_ifs_times(run_times, total_points, ifs_name, timing_file,
+                   num_points, block, width, height)
+
+
+def open_cache(cache_dir, cache_size):
+    """
+    :param cache_dir: Cache directory, or an empty string for no cache
+    :param cache_size: Disk budget of the cache in megabytes
+    """
+    if len(cache_dir) == 0:
+        return None
+    return FractalCache.FractalCache(cache_dir, int(cache_size * 2 ** 20))
+
+
+def open_pipeline(write_queue, compression, raw):
+    """
+    :param write_queue: Number of images queued for the background writer,
+        0 to write each image before the next backend runs
+    :param compression: PNG compression level, or None for the default
+    :param raw: Save .npy arrays instead of PNG images
+    :return: OutputPipeline.OutputPipeline, or None for the default output
+    """
+    if write_queue == 0 and compression is None and not raw:
+        return None
+    return OutputPipeline.OutputPipeline(
+        write_queue, 6 if compression is None else compression, raw)
 
-    save_ifs_times(cpu_run_time, gpu_run_time, ifs_name, timing_file,
-                   num_points, block, width, height, cpu_total_points,
-                   gpu_total_points)
+
+def close_pipeline(pipeline):
+    """
+    Wait for the pipeline to write every queued image.
+    """
+    if pipeline is not None:
+        pipeline.close()
+        print(pipeline.summary())
+
+
+def output_backend(option):
+    """
+    Match --{backend}_output options, plus the -c/-g shorthands for the cpu
+    and gpu backends.
+    :return: backend name the option sets the output file of, or None
+    """
+    if option == "-c":
+        return "cpu"
+    if option == "-g":
+        return "gpu"
+    if option.startswith("--") and option.endswith("_output"):
+        name = option[2:-len("_output")]
+        if name in Backends.BACKENDS:
+            return name
+    return None
 
 
 def process_julia_runs(i, n):
@@ -135,27 +360,75 @@ def process_julia_runs(i, n):
     iterations = 200
     divergence_val = 10
     width = 300
+    height = None
+    center = 0j
+    scale = 1.0
+    rotation = 0.0
     block_size = 64
-    gpu_output_file = "gpuOut.png"
-    cpu_output_file = "cpuOut.png"
+    workers = 1
+    mode = "standard"
+    buffer_file = ""
+    formula = ""
+    plane = None
+    backends = ["cpu", "gpu"]
+    output_files = default_output_files(Backends.BACKENDS)
     timing_file = ""
+    profile_file = ""
+    cache_dir = ""
+    cache_size = 1024
+    write_queue = 0
+    compression = None
+    raw = False
     i += 1
     while i < n:
         try:
             if sys.argv[i] == "--size" or sys.argv[i] == "-s":
                 width = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--height":
+                height = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--center":
+                center = Viewport.parse_center(sys.argv[i + 1])
+            elif sys.argv[i] == "--scale":
+                scale = float(sys.argv[i + 1])
+            elif sys.argv[i] == "--rotation":
+                rotation = float(sys.argv[i + 1])
             elif sys.argv[i] == "--iterations" or sys.argv[i] == "-i":
                 iterations = int(sys.argv[i + 1])
-            elif sys.argv[i] == "--gpu_output" or sys.argv[i] == "-g":
-                gpu_output_file = sys.argv[i + 1]
-            elif sys.argv[i] == "--cpu_output" or sys.argv[i] == "-c":
-                cpu_output_file = sys.argv[i + 1]
+            elif output_backend(sys.argv[i]) is not None:
+                output_files[output_backend(sys.argv[i])] = sys.argv[i + 1]
+            elif sys.argv[i] == "--backend":
+                backends = Backends.parse_backends(sys.argv[i + 1])
             elif sys.argv[i] == "--block" or sys.argv[i] == "-b":
                 block_size = int(sys.argv[i + 1])
             elif sys.argv[i] == "--divergence" or sys.argv[i] == "-d":
                 divergence_val = sys.argv[i + 1]
+            elif sys.argv[i] == "--workers" or sys.argv[i] == "-n":
+                workers = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--mode":
+                mode = sys.argv[i + 1]
+                if mode not in JULIA_MODES:
+                    raise ValueError("Unknown mode '" + mode + "'. Available "
+                                     "modes: " + ", ".join(JULIA_MODES))
+            elif sys.argv[i] == "--out_of_core":
+                buffer_file = sys.argv[i + 1]
+            elif sys.argv[i] == "--formula":
+                formula = sys.argv[i + 1]
+            elif sys.argv[i] == "--plane":
+                plane = sys.argv[i + 1]
             elif sys.argv[i] == "--timing" or sys.argv[i] == "-t":
                 timing_file = sys.argv[i + 1]
+            elif sys.argv[i] == "--profile":
+                profile_file = sys.argv[i + 1]
+            elif sys.argv[i] == "--cache":
+                cache_dir = sys.argv[i + 1]
+            elif sys.argv[i] == "--cache_size":
+                cache_size = float(sys.argv[i + 1])
+            elif sys.argv[i] == "--write_queue":
+                write_queue = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--compression":
+                compression = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--raw":
+                raw = sys.argv[i + 1] == "1"
             i += 2
         except IndexError:
             print("Index out of range error. The expected number of arguments "
@@ -166,7 +439,12 @@ def process_julia_runs(i, n):
             raise
 
     run_julia(set_to_run, iterations, divergence_val, width, block_size,
-              cpu_output_file, gpu_output_file, timing_file, set_to_run)
+              output_files, timing_file, set_to_run, workers, backends,
+              profile_file, mode,
+              Viewport.Viewport(width, height, center, scale, rotation),
+              buffer_file, open_cache(cache_dir, cache_size),
+              Formulas.parse_formula(formula, plane) if len(formula) > 0
+              else None, open_pipeline(write_queue, compression, raw))
 
 
 def process_ifs_runs(i, n):
@@ -181,9 +459,20 @@ def process_ifs_runs(i, n):
     height = 300
     block_size = 64
     num_points = 10000
-    gpu_output_file = "gpuOut.png"
-    cpu_output_file = "cpuOut.png"
+    chunk_size = 0
+    bounds = None
+    workers = 1
+    seed = None
+    tolerance = None
+    backends = ["cpu", "gpu"]
+    output_files = default_output_files(Backends.BACKENDS)
     timing_file = ""
+    profile_file = ""
+    cache_dir = ""
+    cache_size = 1024
+    write_queue = 0
+    compression = None
+    raw = False
     i += 1
     while i < n:
         try:
@@ -193,14 +482,36 @@ def process_ifs_runs(i, n):
                 height = int(sys.argv[i + 1])
             elif sys.argv[i] == "--points" or sys.argv[i] == "-p":
                 num_points = int(sys.argv[i + 1])
-            elif sys.argv[i] == "--gpu_output" or sys.argv[i] == "-g":
-                gpu_output_file = sys.argv[i + 1]
-            elif sys.argv[i] == "--cpu_output" or sys.argv[i] == "-c":
-                cpu_output_file = sys.argv[i + 1]
+            elif output_backend(sys.argv[i]) is not None:
+                output_files[output_backend(sys.argv[i])] = sys.argv[i + 1]
+            elif sys.argv[i] == "--backend":
+                backends = Backends.parse_backends(sys.argv[i + 1])
             elif sys.argv[i] == "--block" or sys.argv[i] == "-b":
                 block_size = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--stream":
+                chunk_size = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--bounds":
+                bounds = Utilities.parse_bounds(sys.argv[i + 1])
+            elif sys.argv[i] == "--workers" or sys.argv[i] == "-n":
+                workers = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--seed":
+                seed = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--converge":
+                tolerance = float(sys.argv[i + 1])
             elif sys.argv[i] == "--timing" or sys.argv[i] == "-t":
                 timing_file = sys.argv[i + 1]
+            elif sys.argv[i] == "--profile":
+                profile_file = sys.argv[i + 1]
+            elif sys.argv[i] == "--cache":
+                cache_dir = sys.argv[i + 1]
+            elif sys.argv[i] == "--cache_size":
+                cache_size = float(sys.argv[i + 1])
+            elif sys.argv[i] == "--write_queue":
+                write_queue = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--compression":
+                compression = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--raw":
+                raw = sys.argv[i + 1] == "1"
             i += 2
         except IndexError:
             print("Index out of range error. The expected number of arguments "
@@ -210,8 +521,55 @@ def process_ifs_runs(i, n):
             print("Error:", Exception.args)
             raise
 
-    run_ifs(transform, width, height, num_points, gpu_output_file,
-            cpu_output_file, timing_file, block_size, transform_name)
+    run_ifs(transform, width, height, num_points, output_files, timing_file,
+            block_size, transform_name, chunk_size, bounds, backends,
+            profile_file, open_cache(cache_dir, cache_size), workers, seed,
+            tolerance, open_pipeline(write_queue, compression, raw))
+
+
+def process_batch_runs(i, n):
+    if i >= n:
+        print("Error: A job file must be provided")
+        print_help()
+        exit(0)
+    job_file = sys.argv[i]
+    workers = None
+    output_dir = "."
+    timing_file = ""
+    cache_dir = ""
+    cache_size = 1024
+    write_queue = 2
+    compression = 6
+    raw = False
+    i += 1
+    while i < n:
+        try:
+            if sys.argv[i] == "--workers" or sys.argv[i] == "-n":
+                workers = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--output_dir":
+                output_dir = sys.argv[i + 1]
+            elif sys.argv[i] == "--timing" or sys.argv[i] == "-t":
+                timing_file = sys.argv[i + 1]
+            elif sys.argv[i] == "--cache":
+                cache_dir = sys.argv[i + 1]
+            elif sys.argv[i] == "--cache_size":
+                cache_size = float(sys.argv[i + 1])
+            elif sys.argv[i] == "--write_queue":
+                write_queue = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--compression":
+                compression = int(sys.argv[i + 1])
+            elif sys.argv[i] == "--raw":
+                raw = sys.argv[i + 1] == "1"
+            else:
+                print_help()
+                exit(0)
+            i += 2
+        except IndexError:
+            print("Index out of range error. The expected number of arguments "
+                  "were not provided.")
+            exit(1)
+    Batch.run_batch(job_file, workers, output_dir, timing_file, cache_dir,
+                    int(cache_size * 2 ** 20), write_queue, compression, raw)
 
 
 def parse_input_args():
@@ -228,6 +586,9 @@ def parse_input_args():
         elif sys.argv[i] == "--ifs":
             i += 1
             process_ifs_runs(i, n)
+        elif sys.argv[i] == "--batch":
+            i += 1
+            process_batch_runs(i, n)
         else:
             print("Unknown option provided")
             print_help()
@@ -1,14 +1,4 @@
-for ifs in "leaf" "fern" "dragon" "pentadentrite" "koch" "spiral" "tree" "twig"
-do
-  for numPoint in 10000 50000 100000 150000 2000000 300000
-  do
-    gpuFileName="${PWD}/images/ifs/gpu_${ifs}_${numPoint}.png"
-    cpuFileName="${PWD}/images/ifs/cpu_${ifs}_${numPoint}.png"
-    echo "python3 main.py --ifs $ifs --width 300 --gpu_output \
-$gpuFileName --cpu_output $cpuFileName --timing $PWD/ifs_times.csv \
---block 8 --points ${numPoint}"
-    python3 main.py --ifs ${ifs} --size 300 --gpu_output ${gpuFileName} \
-    --cpu_output ${cpuFileName} --timing $PWD/ifs_times.csv --block 8 \
-    --points ${numPoint}
-  done
-done
+python3 Benchmark.py --ifs all --sizes 300 \
+  --points 10000,50000,100000,150000,300000,2000000 \
+  --backend cpu,gpu --block 8 --warmup 1 --repeats 5 \
+  --output "${PWD}/ifs_benchmark.csv" --images "${PWD}/images/ifs"
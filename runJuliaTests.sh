@@ -1,14 +1,3 @@
-for i in {}1..20}
-do
-  for iter in {100..300..50}
-  do
-    gpuFileName="${PWD}/images/julia/gpuOut_${i}_${iter}.png"
-    cpuFileName="${PWD}/images/julia/cpuOut_${i}_${iter}.png"
-    echo "python3 main.py --julia $i --width 300 --gpu_output \
-$gpuFileName --cpu_output $cpuFileName --timing $PWD/julia_times.csv \
---block 8 --iterations ${iter}"
-    python3 main.py --julia $i --size 300 --gpu_output $gpuFileName \
-    --cpu_output $cpuFileName --block 8 --timing $PWD/julia_times.csv \
-    --iterations $iter
-  done
-done
+python3 Benchmark.py --julia all --sizes 300 --iterations 100,150,200,250,300 \
+  --backend cpu,gpu --block 8 --warmup 1 --repeats 5 \
+  --output "${PWD}/julia_benchmark.csv" --images "${PWD}/images/julia"
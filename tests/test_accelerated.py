@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+import CPUTransformation
+import Formulas
+import constants
+from Viewport import Viewport
+
+
+@pytest.mark.parametrize("name", ["set1", "set3", "set5", "set7"])
+def test_accelerated_matches_standard(name):
+    c = constants.julia_fractals[name]
+    viewport = Viewport(97, 64)
+    expected = CPUTransformation.cpuJuliaIterations(c, 500, 10,
+                                                    viewport=viewport)
+    counts = CPUTransformation.cpuAcceleratedJuliaIterations(
+        c, 500, 10, viewport=viewport)
+    np.testing.assert_array_equal(counts, expected)
+
+
+@pytest.mark.parametrize("expression, size, min_size", [
+    ("sin(z) + c", 300, 8),
+    ("sin(z) * c", 160, 4),
+])
+def test_accelerated_non_polynomial_formulas(expression, size, min_size):
+    # the sets of these maps can have holes, which the border fill misses
+    formula = Formulas.parse_formula(expression)
+    c = 1.2673 - 0.8955j
+    viewport = Viewport(size)
+    expected = CPUTransformation.cpuJuliaIterations(
+        c, 300, 10, viewport=viewport, formula=formula)
+    counts = CPUTransformation.cpuAcceleratedJuliaIterations(
+        c, 300, 10, viewport=viewport, formula=formula, min_size=min_size)
+    np.testing.assert_array_equal(counts, expected)
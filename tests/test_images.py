@@ -0,0 +1,45 @@
+import numpy as np
+from PIL import Image
+
+import CPUTransformation
+import OutputPipeline
+import Utilities
+import constants
+from Viewport import Viewport
+
+
+def _counts(width=40, height=25):
+    return CPUTransformation.cpuJuliaIterations(
+        constants.julia_fractals["set3"], 100, 10,
+        viewport=Viewport(width, height))
+
+
+def test_write_fractal_image_is_width_by_height(tmp_path):
+    counts = _counts()
+    output_file = str(tmp_path / "out.png")
+    Utilities.write_fractal_image(counts, output_file=output_file)
+    image = np.asarray(Image.open(output_file))
+    assert image.shape == (25, 40, 3)
+    # image rows run along h, as in the tile server
+    np.testing.assert_array_equal(image, Utilities.colorize(counts.T))
+
+
+def test_striped_writer_matches_plain_writer(tmp_path):
+    counts = _counts()
+    plain, striped = str(tmp_path / "plain.png"), str(tmp_path / "strip.png")
+    Utilities.write_fractal_image(counts, output_file=plain)
+    Utilities.write_fractal_image_striped(counts, output_file=striped,
+                                          strip_rows=7)
+    np.testing.assert_array_equal(np.asarray(Image.open(striped)),
+                                  np.asarray(Image.open(plain)))
+
+
+def test_pipeline_matches_plain_writer(tmp_path):
+    counts = _counts()
+    plain, queued = str(tmp_path / "plain.png"), str(tmp_path / "queue.png")
+    Utilities.write_fractal_image(counts, output_file=plain)
+    with OutputPipeline.OutputPipeline() as pipeline:
+        Utilities.write_fractal_image(counts, output_file=queued,
+                                      pipeline=pipeline)
+    np.testing.assert_array_equal(np.asarray(Image.open(queued)),
+                                  np.asarray(Image.open(plain)))
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+import CPUTransformation
+import Formulas
+import constants
+from Viewport import Viewport
+
+SIZES = [(1, 1), (3, 3), (5, 7), (2, 9), (17, 13), (64, 64), (101, 67)]
+
+
+@pytest.mark.parametrize("width, height", SIZES)
+@pytest.mark.parametrize("name", ["set1", "set3", "set5", "set7", "set12"])
+def test_progressive_matches_standard(name, width, height):
+    c = constants.julia_fractals[name]
+    viewport = Viewport(width, height)
+    expected = CPUTransformation.cpuJuliaIterations(c, 300, 10,
+                                                    viewport=viewport)
+    counts = CPUTransformation.cpuProgressiveJuliaIterations(
+        c, 300, 10, viewport=viewport)
+    np.testing.assert_array_equal(counts, expected)
+
+
+@pytest.mark.parametrize("start_step", [1, 2, 16, 64])
+def test_progressive_start_steps(start_step):
+    c = constants.julia_fractals["set7"]
+    viewport = Viewport(45, 31)
+    expected = CPUTransformation.cpuJuliaIterations(c, 1000, 10,
+                                                    viewport=viewport)
+    counts = CPUTransformation.cpuProgressiveJuliaIterations(
+        c, 1000, 10, viewport=viewport, start_step=start_step)
+    np.testing.assert_array_equal(counts, expected)
+
+
+@pytest.mark.parametrize("formula", ["burning_ship_julia", "mandelbrot",
+                                     "sin(z) * c"])
+def test_progressive_formulas(formula):
+    formula = Formulas.parse_formula(formula)
+    c = constants.julia_fractals["set4"]
+    viewport = Viewport(65, 16)
+    expected = CPUTransformation.cpuJuliaIterations(
+        c, 200, 10, viewport=viewport, formula=formula)
+    counts = CPUTransformation.cpuProgressiveJuliaIterations(
+        c, 200, 10, viewport=viewport, formula=formula)
+    np.testing.assert_array_equal(counts, expected)